@@ -37,7 +37,20 @@ class Aperture:
         :param jaw: list with jaw positions
         """
         self.jaw = self.CreateJaw(jaw)
-        self.leaf_pairs = self.CreateLeafPairs(leaf_positions, leaf_widths, self.jaw)
+        self.leaf_positions = leaf_positions
+        self.leaf_widths = leaf_widths
+        self._leaf_pairs = None
+
+    @property
+    def leaf_pairs(self):
+        """Leaf pairs are only built on first access, BeamApertures views never pay for them otherwise"""
+        if self._leaf_pairs is None:
+            self._leaf_pairs = self.CreateLeafPairs(self.leaf_positions, self.leaf_widths, self.jaw)
+        return self._leaf_pairs
+
+    @leaf_pairs.setter
+    def leaf_pairs(self, value):
+        self._leaf_pairs = value
 
     def CreateLeafPairs(self, positions, widths, jaw):
         """Aperture Leaf Pairs"""
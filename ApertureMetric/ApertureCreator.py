@@ -4,25 +4,48 @@ import numpy as np
 from pydicom.dataset import Dataset
 
 from ApertureMetric.Aperture import PyAperture
+from ApertureMetric.BeamApertures import BeamApertures
+from ApertureMetric.Instrumentation import Timed
 
 
 class AperturesFromBeamCreator:
     """计算控制点子野（Apertures）信息"""
 
-    def Create(self, beam: Dict[str, str]) -> List[PyAperture]:
-        apertures = []
+    @Timed("apertures", "AperturesFromBeamCreator.Create",
+           counts=lambda args, result: {"control_points": len(result), "apertures": len(result),
+                                        "leaf_pairs": len(result) * result.Npairs})
+    def Create(self, beam: Dict[str, str]) -> BeamApertures:
+        """Returns the beam apertures, a sequence of PyAperture views backed by (Ncp, Npairs, 2) arrays"""
+        if "LeafPositions" in beam:
+            # beam already extracted to arrays (DicomParse.PlanArrays), no pydicom control points
+            return BeamApertures(beam["LeafPositions"], self.GetLeafWidths(beam), beam["JawPositions"],
+                                 beam["ApertureGantryAngles"], beam.get("ApertureControlPoints"))
+
+        positions = []
+        jaws = []
+        gantry_angles = []
+        control_points = []
 
         # BeamLimitingDeviceSequence LeafPositionBoundaries
         leafWidths = self.GetLeafWidths(beam)
 
-        for controlPoint in beam["ControlPointSequence"]:
+        for index, controlPoint in enumerate(beam["ControlPointSequence"]):
             gantry_angle = float(controlPoint.GantryAngle) if "GantryAngle" in controlPoint else beam["GantryAngle"]
             leafPositions = self.GetLeafPositions(controlPoint)
             jaw = self.GetJawPositions(beam, controlPoint)  # Jaw Tracking
             if leafPositions is not None:
-                apertures.append(PyAperture(leafPositions, leafWidths, jaw, gantry_angle))
+                positions.append(leafPositions.T)
+                jaws.append(jaw)
+                gantry_angles.append(gantry_angle)
+                control_points.append(index)
+
+        positions = np.array(positions, dtype=float).reshape(len(positions), len(leafWidths), 2)
+        return BeamApertures(positions, leafWidths, np.array(jaws, dtype=float), np.array(gantry_angles, dtype=float),
+                             np.array(control_points, dtype=np.intp))
 
-        return apertures
+    def CreatePyApertures(self, beam: Dict[str, str]) -> List[PyAperture]:
+        """Returns the beam apertures as a list of PyAperture objects"""
+        return list(self.Create(beam))
 
     def GetJawPositions(self, beam: dict, control_point: Dataset) -> List[float]:
         """得到每个控制点Jaw位置，铅门跟随方式每个控制点Jaw位置在变化"""
@@ -50,6 +73,10 @@ class AperturesFromBeamCreator:
 
     def GetLeafWidths(self, beam_dict: Dict) -> np.ndarray:
         """Get MLCX leaf width from  BeamLimitingDeviceSequence (300a, 00be) Leaf Position Boundaries Tag"""
+        if "LeafPositionBoundaries" in beam_dict:
+            boundaries = beam_dict["LeafPositionBoundaries"]
+            return np.diff(boundaries) if boundaries is not None else None
+
         bs = beam_dict["BeamLimitingDeviceSequence"]
         # the script only takes MLCX as parameter
         for b in bs:
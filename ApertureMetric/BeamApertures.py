@@ -0,0 +1,191 @@
+from collections.abc import Sequence
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from ApertureMetric.Aperture import Aperture, PyAperture
+from ApertureMetric.Kernels import GetKernels
+
+
+class BeamApertures(Sequence):
+    """
+        Array-backed apertures of all control points of a beam.
+
+        Leaf positions are stored as one float array of shape (Ncp, Npairs, 2), the last axis holding
+        bank A (Left) and bank B (Right) positions. Jaws are stored as an (Ncp, 4) array ordered as the
+        Jaw class: left, top, right, bottom (y axis already inverted by AperturesFromBeamCreator).
+        Leaf tops and widths are shared by every control point of the beam. Control points without leaf
+        positions have no aperture, control_points holds the index of each aperture in the beam control points.
+
+        The vectorized routines return (Ncp, Npairs) arrays with the same semantics as the scalar
+        LeafPair methods, and (Ncp,) arrays for the per-aperture routines. Indexing or iterating
+        returns PyAperture views, so existing CalculatePerAperture implementations keep working.
+    """
+
+    def __init__(self, leaf_positions: np.ndarray, leaf_widths: np.ndarray, jaws: np.ndarray,
+                 gantry_angles: np.ndarray, control_points: np.ndarray = None) -> None:
+        """
+        :param leaf_positions: Numpy 3D array of floats, (Ncp, Npairs, 2)
+        :param leaf_widths: Numpy array 1D, (Npairs,)
+        :param jaws: Numpy 2D array of floats, (Ncp, 4) left, top, right, bottom
+        :param gantry_angles: Numpy array 1D, (Ncp,)
+        :param control_points: Numpy array 1D, (Ncp,) control point indices of the apertures, default 0 to Ncp - 1
+        """
+        self.leaf_positions = np.asarray(leaf_positions, dtype=float)
+        self.leaf_widths = np.asarray(leaf_widths, dtype=float)
+        self.jaws = np.asarray(jaws, dtype=float).reshape(-1, 4)
+        self.gantry_angles = np.asarray(gantry_angles, dtype=float)
+        if control_points is None:
+            control_points = np.arange(len(self.gantry_angles))
+        self.control_points = np.asarray(control_points).astype(np.intp)
+
+        self.leaf_tops = np.array(Aperture.GetLeafTops(self.leaf_widths), dtype=float)
+        self.leaf_bottoms = self.leaf_tops - self.leaf_widths
+
+        self._views: List[Optional[PyAperture]] = [None] * len(self.gantry_angles)
+        self._outside_jaw = None
+        self._field_size = None
+        self._open_leaf_width = None
+
+    @classmethod
+    def FromApertures(cls, apertures: List[Aperture]) -> "BeamApertures":
+        """Builds the array representation from a list of (Py)Aperture objects"""
+        if isinstance(apertures, BeamApertures):
+            return apertures
+
+        widths = np.array([lp.Width for lp in apertures[0].LeafPairs]) if len(apertures) > 0 else np.empty(0)
+        positions = np.array([[(lp.Left, lp.Right) for lp in ap.LeafPairs] for ap in apertures],
+                             dtype=float).reshape(len(apertures), len(widths), 2)
+        jaws = np.array([(ap.Jaw.Left, ap.Jaw.Top, ap.Jaw.Right, ap.Jaw.Bottom) for ap in apertures], dtype=float)
+        gantry_angles = np.array([getattr(ap, "GantryAngle", np.nan) for ap in apertures], dtype=float)
+        return cls(positions, widths, jaws, gantry_angles)
+
+    # Sequence protocol, PyAperture views
+
+    def __len__(self) -> int:
+        return self.leaf_positions.shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("control point index out of range")
+        if self._views[index] is None:
+            self._views[index] = PyAperture(self.leaf_positions[index].T, self.leaf_widths,
+                                            list(self.jaws[index]), float(self.gantry_angles[index]))
+        return self._views[index]
+
+    def __iter__(self) -> Iterator[PyAperture]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return "BeamApertures - Control Points: %d, Leaf Pairs: %d" % (self.Ncp, self.Npairs)
+
+    # Beam data
+
+    @property
+    def Ncp(self) -> int:
+        return self.leaf_positions.shape[0]
+
+    @property
+    def Npairs(self) -> int:
+        return self.leaf_positions.shape[1]
+
+    @property
+    def Left(self) -> np.ndarray:
+        """Bank A positions, (Ncp, Npairs)"""
+        return self.leaf_positions[:, :, 0]
+
+    @property
+    def Right(self) -> np.ndarray:
+        """Bank B positions, (Ncp, Npairs)"""
+        return self.leaf_positions[:, :, 1]
+
+    @property
+    def JawLeft(self) -> np.ndarray:
+        return self.jaws[:, 0]
+
+    @property
+    def JawTop(self) -> np.ndarray:
+        return self.jaws[:, 1]
+
+    @property
+    def JawRight(self) -> np.ndarray:
+        return self.jaws[:, 2]
+
+    @property
+    def JawBottom(self) -> np.ndarray:
+        return self.jaws[:, 3]
+
+    @property
+    def GantryAngles(self) -> np.ndarray:
+        return self.gantry_angles
+
+    # Vectorized leaf pair routines, (Ncp, Npairs)
+
+    def IsOutsideJaw(self) -> np.ndarray:
+        """Mask of the leaf pairs outside the jaws, same edge convention as LeafPair.IsOutsideJaw"""
+        if self._outside_jaw is None:
+            self._outside_jaw = (
+                    (self.JawTop[:, None] <= self.leaf_bottoms[None, :])
+                    | (self.JawBottom[:, None] >= self.leaf_tops[None, :])
+                    | (self.JawLeft[:, None] >= self.Right)
+                    | (self.JawRight[:, None] <= self.Left)
+            )
+        return self._outside_jaw
+
+    def IsOpenBehindJaw(self) -> np.ndarray:
+        return self.IsOutsideJaw() & ((self.JawLeft[:, None] > self.Left) | (self.JawRight[:, None] < self.Right))
+
+    def FieldSize(self) -> np.ndarray:
+        """Jaw clipped opening of every leaf pair, computed once per beam"""
+        if self._field_size is None:
+            left = np.maximum(self.JawLeft[:, None], self.Left)
+            right = np.minimum(self.JawRight[:, None], self.Right)
+            self._field_size = np.where(self.IsOutsideJaw(), 0.0, right - left)
+        return self._field_size
+
+    def OpenLeafWidth(self) -> np.ndarray:
+        """Returns the amount of leaf width that is open, considering the Position of the jaw"""
+        if self._open_leaf_width is None:
+            top = np.minimum(self.JawTop[:, None], self.leaf_tops[None, :])
+            bottom = np.maximum(self.JawBottom[:, None], self.leaf_bottoms[None, :])
+            self._open_leaf_width = np.where(self.IsOutsideJaw(), 0.0, top - bottom)
+        return self._open_leaf_width
+
+    def FieldArea(self) -> np.ndarray:
+        return self.FieldSize() * self.OpenLeafWidth()
+
+    # Vectorized aperture routines, (Ncp,)
+
+    def Area(self) -> np.ndarray:
+        return np.sum(self.FieldArea(), axis=1)
+
+    def OpenLeafPairsNumber(self) -> np.ndarray:
+        return np.sum(~self.IsOutsideJaw(), axis=1)
+
+    def HasOpenLeafBehindJaws(self) -> np.ndarray:
+        return np.any(self.IsOpenBehindJaw(), axis=1)
+
+    def SidePerimeter(self) -> np.ndarray:
+        """Perimeter between adjacent leaf pairs i - 1 (top) and i (bottom), (Ncp, Npairs - 1),
+        same cases, in the same order, as Aperture.SidePerimeter"""
+        return GetKernels().SidePerimeter(self.Left, self.Right, self.jaws, self.leaf_tops, self.leaf_bottoms,
+                                          self.IsOutsideJaw(), self.FieldSize())
+
+    def SidePerimeterHorizontal(self) -> np.ndarray:
+        """Horizontal leaf perimeter: top end of the first pair, sides between pairs, bottom end of the last pair"""
+        field_size = self.FieldSize()
+        return field_size[:, 0] + np.sum(self.SidePerimeter(), axis=1) + field_size[:, -1]
+
+    def SidePerimeterVertical(self) -> np.ndarray:
+        """Vertical leaf perimeter, open leaf width of the pairs inside the jaws"""
+        return np.sum(self.OpenLeafWidth(), axis=1)
+
+    def ApertureSubRegions(self) -> np.ndarray:
+        """Number of aperture sub regions: an open pair (field size > 0.5 mm) starts a new region when the previous
+        pair is closed or when their leaves do not overlap, as Aperture.ApertureSubRegions"""
+        return GetKernels().ApertureSubRegions(self.Left, self.Right, self.FieldSize())
@@ -0,0 +1,208 @@
+import hashlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from ApertureMetric.ApertureCreator import AperturesFromBeamCreator
+from ApertureMetric.BeamApertures import BeamApertures
+from ApertureMetric.FieldSizeDistribution import FieldSizeDistribution
+from ApertureMetric.MetersetCreator import MetersetsFromMetersetWeightsCreator
+from ApertureMetric.MLCAttributes import MLCAttributes
+
+
+def ControlPointSequenceHash(beam: Dict[str, str]) -> str:
+    """SHA-1 of the beam control point content: gantry angles, cumulative meterset weights, all
+    LeafJawPositions and the beam MU (metersets are scaled by it)"""
+    h = hashlib.sha1()
+    h.update(np.array([float(beam.get("MU", np.nan))]).tobytes())
+    if "LeafPositions" in beam:
+        # beam extracted to arrays (DicomParse.PlanArrays)
+        for key in ["ControlPointGantryAngles", "CumulativeMetersetWeights", "LeafPositions", "JawPositions"]:
+            h.update(np.ascontiguousarray(beam[key], dtype=float).tobytes())
+        return h.hexdigest()
+    for cp in beam["ControlPointSequence"]:
+        h.update(np.array([float(cp.get("GantryAngle", np.nan)),
+                           float(cp.get("CumulativeMetersetWeight", np.nan))]).tobytes())
+        for bl in cp.get("BeamLimitingDevicePositionSequence", []):
+            h.update(str(bl.RTBeamLimitingDeviceType).encode())
+            h.update(np.asarray(bl.LeafJawPositions, dtype=float).tobytes())
+    return h.hexdigest()
+
+
+# Beam values read by the metrics besides the control point arrays, part of the beam content hash
+CONTENT_HASH_KEYS = ["MU", "TreatmentMachineName", "DoseRateSet", "GantryRotationAngle", "PrimaryDosimeterUnit",
+                     "TreatmentDeliveryType"]
+
+
+def LeafPositionBoundaries(beam: Dict[str, str]):
+    """MLC leaf boundaries of a pydicom backed beam, None without MLC"""
+    for b in beam.get("BeamLimitingDeviceSequence", []):
+        if b.RTBeamLimitingDeviceType in ["MLCX", "MLCX1", "MLCX2"]:
+            return np.asarray(b.LeafPositionBoundaries, dtype=float)
+    return None
+
+
+def BeamContentHash(beam: Dict[str, str], context: "BeamContext" = None) -> str:
+    """SHA-1 of everything the metrics read from a beam: leaf and jaw positions, gantry angles, cumulative meterset
+    weights, leaf boundaries, MU, machine and dose rate. A pydicom backed beam and its extracted version
+    (DicomParse.PlanArrays) have the same hash, so it identifies the beam across plan revisions and files."""
+    if "LeafPositions" in beam:
+        arrays = [beam["LeafPositions"], beam["JawPositions"], beam["ApertureGantryAngles"],
+                  beam["ControlPointGantryAngles"], beam["CumulativeMetersetWeights"], beam["LeafPositionBoundaries"]]
+    else:
+        # same arrays as DicomParse.PlanArrays.ExtractBeamArrays
+        context = context if context is not None else BeamContext(beam)
+        apertures = context.Apertures
+        arrays = [apertures.leaf_positions, apertures.jaws, apertures.gantry_angles, context.GantryAngles,
+                  MetersetsFromMetersetWeightsCreator().GetBeamMetersetWeights(beam), LeafPositionBoundaries(beam)]
+
+    h = hashlib.sha1()
+    h.update(repr([str(beam.get(key, "")) for key in CONTENT_HASH_KEYS]).encode())
+    for values in arrays:
+        if values is None:
+            h.update(b"none")
+            continue
+        values = np.ascontiguousarray(values, dtype=float)
+        h.update(repr(values.shape).encode())
+        h.update(values.tobytes())
+    return h.hexdigest()
+
+
+class BeamContext:
+    """Lazily computed, shared beam data: apertures, metersets, gantry angles and MLC attributes.
+
+    Every attribute is computed on first access and reused by all metric instances working on the
+    same beam, instead of each metric rebuilding the apertures.
+    """
+
+    def __init__(self, beam: Dict[str, str]) -> None:
+        self.beam = beam
+        self._cache = {}
+
+    def Memoize(self, name: str, func):
+        """Returns the cached value stored under name, computing it with func() on first access"""
+        if name not in self._cache:
+            self._cache[name] = func()
+        return self._cache[name]
+
+    def Clear(self) -> None:
+        self._cache.clear()
+
+    @property
+    def Apertures(self) -> BeamApertures:
+        return self.Memoize("apertures", lambda: AperturesFromBeamCreator().Create(self.beam))
+
+    @property
+    def Metersets(self) -> np.ndarray:
+        """Meterset values per control point"""
+        return self.Memoize("metersets", lambda: MetersetsFromMetersetWeightsCreator().Create(self.beam))
+
+    @property
+    def CumulativeMetersets(self) -> np.ndarray:
+        return self.Memoize("cumulative_metersets",
+                            lambda: MetersetsFromMetersetWeightsCreator().GetCumulativeMetersets(self.beam))
+
+    @property
+    def FieldSizes(self) -> FieldSizeDistribution:
+        """Open leaf pair field sizes, shared by SmallApertureScore at every threshold and LeafGap"""
+        return self.Memoize("field_sizes", lambda: FieldSizeDistribution(self.Apertures))
+
+    @property
+    def ContentHash(self) -> str:
+        """BeamContentHash of the beam, key of the memoized metric results (ComplexityMetric.BeamResultCache)"""
+        return self.Memoize("content_hash", lambda: BeamContentHash(self.beam, self))
+
+    @property
+    def GantryAngles(self) -> List[float]:
+        return self.Memoize("gantry_angles", self.GetGantryAngles)
+
+    @property
+    def MLCAttributes(self) -> MLCAttributes:
+        return self.Memoize("mlc_attributes", lambda: MLCAttributes(
+            self.Apertures, self.CumulativeMetersets, self.beam['TreatmentMachineName'],
+            self.beam['DoseRateSet'], self.beam['GantryRotationAngle']))
+
+    def GetGantryAngles(self) -> List[float]:
+        if "ControlPointGantryAngles" in self.beam:
+            return list(self.beam["ControlPointGantryAngles"])
+
+        angles = []
+        for cp in self.beam["ControlPointSequence"]:
+            gantry_angle = float(cp.GantryAngle) if "GantryAngle" in cp else self.beam["GantryAngle"]
+            angles.append(gantry_angle)
+        return angles
+
+
+class BeamContextCache:
+    """Plan level BeamContext cache, keyed by beam number and control point content hash.
+
+    The cache is attached to the plan dict (plan[PLAN_KEY]) and every beam dict refers to it (beam[BEAM_KEY]),
+    so metrics called with a single beam still find the shared context. The content hash is computed once,
+    when the beam context is created; call Invalidate after modifying a beam, or Refresh to re-hash every
+    beam and drop the stale contexts. Clear releases all cached data to bound memory in batch runs.
+    """
+
+    PLAN_KEY = "beam_context_cache"
+    BEAM_KEY = "BeamContextCache"
+
+    def __init__(self) -> None:
+        self.contexts: Dict[Tuple[int, str], BeamContext] = {}
+        self.hashes: Dict[int, str] = {}
+        self.beams: Dict[int, Dict[str, str]] = {}
+
+    @classmethod
+    def ForPlan(cls, plan: Dict[str, str]) -> "BeamContextCache":
+        """Returns the cache attached to the plan dict, attaching a new one if needed"""
+        cache = plan.get(cls.PLAN_KEY)
+        if cache is None:
+            cache = cls()
+            plan[cls.PLAN_KEY] = cache
+        for number, beam in plan.get("beams", {}).items():
+            beam.setdefault("BeamNumber", number)
+            beam[cls.BEAM_KEY] = cache
+        return cache
+
+    @classmethod
+    def ForBeam(cls, beam: Dict[str, str]) -> BeamContext:
+        """Returns the shared context of a beam, or an uncached one if the beam is not attached to a plan cache"""
+        cache = beam.get(cls.BEAM_KEY)
+        if cache is None:
+            return BeamContext(beam)
+        return cache.Get(beam)
+
+    def Get(self, beam: Dict[str, str]) -> BeamContext:
+        number = beam.get("BeamNumber", id(beam))
+        if number not in self.hashes:
+            self.hashes[number] = ControlPointSequenceHash(beam)
+            self.beams[number] = beam
+        key = (number, self.hashes[number])
+        if key not in self.contexts:
+            self.contexts[key] = BeamContext(beam)
+        return self.contexts[key]
+
+    def Invalidate(self, beam_number=None) -> None:
+        """Drops the cached context of one beam, or of every beam if beam_number is None"""
+        if beam_number is None:
+            self.Clear()
+            return
+        digest = self.hashes.pop(beam_number, None)
+        self.beams.pop(beam_number, None)
+        context = self.contexts.pop((beam_number, digest), None)
+        if context is not None:
+            context.Clear()
+
+    def Refresh(self) -> None:
+        """Re-hashes the known beams and drops the contexts whose control points changed"""
+        for number, beam in list(self.beams.items()):
+            if ControlPointSequenceHash(beam) != self.hashes[number]:
+                self.Invalidate(number)
+
+    def Clear(self) -> None:
+        for context in self.contexts.values():
+            context.Clear()
+        self.contexts.clear()
+        self.hashes.clear()
+        self.beams.clear()
+
+    def __len__(self) -> int:
+        return len(self.contexts)
@@ -0,0 +1,58 @@
+from typing import Sequence, Union
+
+import numpy as np
+
+from ApertureMetric.BeamApertures import BeamApertures
+
+
+class FieldSizeDistribution:
+    """
+        Field sizes of the open leaf pairs (inside the jaws) of every control point of a beam, collected once
+        and shared by SmallApertureScore (any thresholds), LeafGap and field size histograms.
+
+        Field sizes are replaced by their rank in the sorted distinct field sizes of the beam, and each
+        control point row is sorted once. The integer keys row * (Nsizes + 1) + rank are then globally sorted,
+        so the number of field sizes below any list of thresholds is found for all control points with a
+        single searchsorted, without floating point offsets.
+    """
+
+    def __init__(self, apertures: BeamApertures) -> None:
+        apertures = BeamApertures.FromApertures(apertures)
+        field_size = apertures.FieldSize()
+        self.inside = ~apertures.IsOutsideJaw()
+        self.Ncp, self.Npairs = field_size.shape
+
+        # open leaf gaps in control point then leaf pair order, as the LeafGap loop
+        self.leaf_gaps = field_size[self.inside]
+        self.sizes = np.unique(self.leaf_gaps)
+        self.counts = np.sum(self.inside, axis=1)
+
+        # leaf pairs outside the jaws get rank Nsizes and are never below a threshold
+        n_sizes = len(self.sizes)
+        ranks = np.where(self.inside, np.searchsorted(self.sizes, field_size), n_sizes)
+        self.row_offsets = np.arange(self.Ncp) * (n_sizes + 1)
+        self.keys = (np.sort(ranks, axis=1) + self.row_offsets[:, None]).ravel()
+
+    def CountBelow(self, thresholds: Union[float, Sequence[float]]) -> np.ndarray:
+        """Number of open leaf pairs with field size < threshold, (Ncp,) or (Ncp, len(thresholds))"""
+        thresholds = np.asarray(thresholds, dtype=float)
+        threshold_ranks = np.searchsorted(self.sizes, np.ravel(thresholds), side='left')
+        keys = self.row_offsets[:, None] + threshold_ranks[None, :]
+        counts = np.searchsorted(self.keys, keys, side='left') - (np.arange(self.Ncp) * self.Npairs)[:, None]
+        return counts[:, 0] if thresholds.ndim == 0 else counts
+
+    def SmallApertureScore(self, x: Union[float, Sequence[float]] = 5) -> np.ndarray:
+        """Fraction of the open leaf pairs with field size < x per control point, NaN without open leaf pair"""
+        counts = self.CountBelow(x)
+        total = self.counts if counts.ndim == 1 else self.counts[:, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return counts / total
+
+    def LeafGaps(self) -> np.ndarray:
+        """Field sizes of the open leaf pairs, control point by control point"""
+        return self.leaf_gaps
+
+    def Histogram(self, edges: Sequence[float], per_control_point: bool = False) -> np.ndarray:
+        """Number of open leaf pairs with edges[i] <= field size < edges[i + 1], for the beam or per control point"""
+        histogram = np.diff(self.CountBelow(np.asarray(edges, dtype=float)), axis=1)
+        return histogram if per_control_point else np.sum(histogram, axis=0)
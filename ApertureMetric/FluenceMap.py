@@ -0,0 +1,119 @@
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from ApertureMetric.BeamApertures import BeamApertures
+from ApertureMetric.BeamContext import BeamContextCache
+
+
+def CoverageSteps(lo: np.ndarray, hi: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Pixel indices (m, 4) and values (m, 4) of the first difference of the coverage of the intervals [lo, hi]
+    (in pixel units) over n pixels: its cumulative sum is the covered fraction of every pixel"""
+    lo = np.clip(lo, 0.0, n)
+    hi = np.clip(hi, lo, n)
+    i, j = np.floor(lo), np.floor(hi)
+    f, g = lo - i, hi - j
+    # indices up to n + 1: the steps past the last pixel only close the coverage, they are dropped with the margin
+    index = np.stack([i, i + 1, j, j + 1], axis=-1).astype(np.intp)
+    steps = np.stack([1.0 - f, f, g - 1.0, -g], axis=-1)
+    return index, steps
+
+
+class FluenceMap:
+    """MU weighted fluence of a beam on a regular grid: every control point aperture, leaf pair openings clipped by
+    the jaws, deposits its meterset (MetersetsFromMetersetWeightsCreator) times the open fraction of each pixel.
+
+    Each open leaf pair is a rectangle whose coverage is the outer product of its x and y pixel coverages; both are
+    cumulative sums of 4 steps (CoverageSteps), so the 16 corner steps of all the rectangles are accumulated in one
+    difference array and the map is its 2D prefix sum, without any per pixel loop. Pixels partly covered by a
+    rectangle get the covered fraction of their area.
+
+    The fluence array is (Ny, Nx), row 0 at the lowest y (plot with origin="lower"); x is the leaf travel
+    direction, y the leaf pair axis as in BeamApertures, in mm.
+
+    Example:
+        fluence = FluenceMap.FromBeam(plan["beams"][1], resolution=2.5)
+        gy, gx = np.gradient(fluence.fluence, fluence.resolution)
+    """
+
+    def __init__(self, fluence: np.ndarray, extent: Sequence[float], resolution: float) -> None:
+        """
+        :param fluence: Numpy 2D array, (Ny, Nx) MU per pixel
+        :param extent: x min, x max, y min, y max of the grid, in mm
+        :param resolution: pixel size, in mm
+        """
+        self.fluence = fluence
+        self.extent = tuple(float(e) for e in extent)
+        self.resolution = float(resolution)
+
+    def __array__(self, dtype=None) -> np.ndarray:
+        return self.fluence if dtype is None else self.fluence.astype(dtype)
+
+    def __repr__(self):
+        return "FluenceMap(%d x %d, %.2f mm, %.1f MU max)" % (self.fluence.shape + (self.resolution, self.fluence.max()))
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.fluence.shape
+
+    @property
+    def x(self) -> np.ndarray:
+        """Pixel centres along the leaf travel direction"""
+        return self.extent[0] + self.resolution * (np.arange(self.fluence.shape[1]) + 0.5)
+
+    @property
+    def y(self) -> np.ndarray:
+        """Pixel centres along the leaf pair axis"""
+        return self.extent[2] + self.resolution * (np.arange(self.fluence.shape[0]) + 0.5)
+
+    @classmethod
+    def FromBeam(cls, beam: Dict[str, str], resolution: float = 1.0, extent: Sequence[float] = None) -> "FluenceMap":
+        """Fluence of a beam with the shared beam apertures and metersets (BeamContext), control points without
+        aperture deposit nothing"""
+        context = BeamContextCache.ForBeam(beam)
+        apertures = context.Apertures
+        return cls.FromApertures(apertures, context.Metersets[apertures.control_points], resolution, extent)
+
+    @classmethod
+    def FromApertures(cls, apertures: BeamApertures, metersets: np.ndarray, resolution: float = 1.0,
+                      extent: Sequence[float] = None) -> "FluenceMap":
+        """
+        :param apertures: BeamApertures (or list of apertures) of the control points
+        :param metersets: MU of the apertures, one per aperture (e.g. BeamContext.Metersets[control_points])
+        :param resolution: pixel size in mm, e.g. 1.0 or 2.5
+        :param extent: x min, x max, y min, y max of the grid in mm, default the union of the jaw openings
+            rounded to the resolution; openings outside the grid are cut
+        """
+        apertures = BeamApertures.FromApertures(apertures)
+        metersets = np.asarray(metersets, dtype=float)
+        if len(metersets) != apertures.Ncp:
+            raise ValueError("%d metersets for %d apertures" % (len(metersets), apertures.Ncp))
+        if extent is None:
+            extent = (np.floor(np.min(apertures.JawLeft) / resolution) * resolution,
+                      np.ceil(np.max(apertures.JawRight) / resolution) * resolution,
+                      np.floor(np.min(apertures.JawBottom) / resolution) * resolution,
+                      np.ceil(np.max(apertures.JawTop) / resolution) * resolution)
+        x_min, x_max, y_min, y_max = extent
+        nx = max(int(round((x_max - x_min) / resolution)), 1)
+        ny = max(int(round((y_max - y_min) / resolution)), 1)
+
+        # open rectangles of the leaf pairs inside the jaws, (Ncp, Npairs)
+        left = np.maximum(apertures.JawLeft[:, None], apertures.Left)
+        right = np.minimum(apertures.JawRight[:, None], apertures.Right)
+        top = np.minimum(apertures.JawTop[:, None], apertures.leaf_tops[None, :])
+        bottom = np.maximum(apertures.JawBottom[:, None], apertures.leaf_bottoms[None, :])
+        open_pairs = ~apertures.IsOutsideJaw() & (right > left) & (top > bottom)
+        cp, pair = np.nonzero(open_pairs)
+
+        x_index, x_steps = CoverageSteps((left[cp, pair] - x_min) / resolution,
+                                         (right[cp, pair] - x_min) / resolution, nx)
+        y_index, y_steps = CoverageSteps((bottom[cp, pair] - y_min) / resolution,
+                                         (top[cp, pair] - y_min) / resolution, ny)
+
+        # 2D difference array, (ny + 2, nx + 2) with the margin of the closing steps
+        corners = y_steps[:, :, None] * x_steps[:, None, :] * metersets[cp, None, None]
+        flat_index = y_index[:, :, None] * (nx + 2) + x_index[:, None, :]
+        steps = np.bincount(flat_index.ravel(), weights=corners.ravel(), minlength=(ny + 2) * (nx + 2))
+        steps = steps.reshape(ny + 2, nx + 2)
+        fluence = np.cumsum(np.cumsum(steps, axis=0), axis=1)[:ny, :nx]
+        return cls(fluence, (x_min, x_min + nx * resolution, y_min, y_min + ny * resolution), resolution)
@@ -0,0 +1,150 @@
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Union
+
+# Active recorder, None when timing is disabled: the Timed wrappers then only read this global
+_RECORDER = None
+
+STAT_KEYS = ["calls", "wall", "cpu", "max_wall", "control_points", "leaf_pairs", "apertures"]
+
+
+class TimingRecorder:
+    """Wall and CPU time, control point / leaf pair counts and apertures built per call of the Timed hooks,
+    aggregated by (stage, name) and by plan over a batch run.
+
+    apertures and leaf_pairs count the apertures built by AperturesFromBeamCreator.Create during the call,
+    including nested calls, so metrics reusing the shared BeamContext show 0. Calls from several threads
+    are aggregated, but their counts may then overlap. Each process has its own recorder, use a single
+    process (workers=0) to time a cohort run.
+    """
+
+    def __init__(self) -> None:
+        self.stats = {}
+        self.plans = {}
+        self.created_apertures = 0
+        self.created_leaf_pairs = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def Call(self, stage: str, name: str, func: Callable, args, kwargs, counts: Callable = None, plan: str = None):
+        apertures, leaf_pairs = self.created_apertures, self.created_leaf_pairs
+        # plan time is only added by the outermost plan call (e.g. MetricSuite, not each of its metrics)
+        plan_depth = getattr(self.local, "plan_depth", 0)
+        self.local.plan_depth = plan_depth + (plan is not None)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            self.local.plan_depth = plan_depth
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+        extra = counts(args, result) if counts is not None else {}
+        if plan is None and "plan" in extra:
+            plan = extra["plan"]
+        with self.lock:
+            self.created_apertures += extra.get("apertures", 0)
+            self.created_leaf_pairs += extra.get("leaf_pairs", 0)
+            stat = self.stats.setdefault((stage, name), dict.fromkeys(STAT_KEYS, 0))
+            stat["calls"] += 1
+            stat["wall"] += wall
+            stat["cpu"] += cpu
+            stat["max_wall"] = max(stat["max_wall"], wall)
+            stat["control_points"] += extra.get("control_points", 0)
+            stat["apertures"] += self.created_apertures - apertures
+            stat["leaf_pairs"] += self.created_leaf_pairs - leaf_pairs
+            if plan is not None and plan_depth == 0:
+                stat = self.plans.setdefault(plan, {"wall": 0.0, "cpu": 0.0})
+                stat["wall"] += wall
+                stat["cpu"] += cpu
+        return result
+
+    def ToDict(self) -> Dict:
+        stats = [dict(stage=stage, name=name, **stat) for (stage, name), stat in self.stats.items()]
+        plans = [dict(plan=plan, **stat) for plan, stat in self.plans.items()]
+        return {"stats": sorted(stats, key=lambda s: -s["wall"]), "plans": sorted(plans, key=lambda p: -p["wall"])}
+
+    def Save(self, filename: str) -> None:
+        with open(filename, "w") as f:
+            json.dump(self.ToDict(), f, indent=2)
+
+    def Table(self, plans: int = 10) -> str:
+        """Text report, stages sorted by total wall time, then the slowest plans"""
+        report = self.ToDict()
+        lines = ["%-12s %-40s %8s %10s %10s %10s %10s %10s %10s" % (
+            "stage", "name", "calls", "wall (s)", "cpu (s)", "ms/call", "cps", "apertures", "leaf pairs")]
+        for s in report["stats"]:
+            lines.append("%-12s %-40s %8d %10.3f %10.3f %10.3f %10d %10d %10d" % (
+                s["stage"], s["name"][:40], s["calls"], s["wall"], s["cpu"], 1000 * s["wall"] / s["calls"],
+                s["control_points"], s["apertures"], s["leaf_pairs"]))
+        if report["plans"]:
+            lines.append("")
+            lines.append("%-53s %10s %10s" % ("plan", "wall (s)", "cpu (s)"))
+            for p in report["plans"][:plans]:
+                lines.append("%-53s %10.3f %10.3f" % (p["plan"][:53], p["wall"], p["cpu"]))
+        return "\n".join(lines)
+
+
+def Timed(stage: str, name: Union[str, Callable] = None, counts: Callable = None, plan: Callable = None) -> Callable:
+    """Decorator recording the calls of func in the active TimingRecorder, a plain call while timing is disabled
+
+    :param name: label of the calls, or function args -> label (e.g. the class of self), default the function name
+    :param counts: function (args, result) -> dict of control_points, apertures and leaf_pairs,
+        and plan, the plan label when it is only known from the result (RTPlan.get_plan)
+    :param plan: function args -> plan label, the call time is then added to the plan
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _RECORDER
+            if recorder is None:
+                return func(*args, **kwargs)
+            label = name(args) if callable(name) else (name or func.__qualname__)
+            return recorder.Call(stage, label, func, args, kwargs, counts, plan(args) if plan is not None else None)
+        return wrapper
+    return decorator
+
+
+def EnableTiming(recorder: TimingRecorder = None) -> TimingRecorder:
+    global _RECORDER
+    _RECORDER = recorder if recorder is not None else TimingRecorder()
+    return _RECORDER
+
+
+def DisableTiming() -> TimingRecorder:
+    global _RECORDER
+    recorder, _RECORDER = _RECORDER, None
+    return recorder
+
+
+@contextmanager
+def Timing(recorder: TimingRecorder = None):
+    """Records the Timed hooks inside the with block:
+
+        with Timing() as timing:
+            rows = run_cohort(filepaths, METRICS, workers=0)
+        print(timing.Table())
+        timing.Save("timing.json")
+    """
+    previous = _RECORDER
+    recorder = EnableTiming(recorder)
+    try:
+        yield recorder
+    finally:
+        EnableTiming(previous) if previous is not None else DisableTiming()
+
+
+def PlanLabel(plan: Dict) -> str:
+    return "%s/%s" % (plan.get("patient_id", ""), plan.get("plan_name", plan.get("label", "")))
+
+
+def BeamControlPoints(beam: Dict) -> int:
+    if "ControlPointSequence" in beam:
+        return len(beam["ControlPointSequence"])
+    return len(beam.get("CumulativeMetersetWeights", ()))
+
+
+def PlanControlPoints(plan: Dict) -> int:
+    return sum(BeamControlPoints(beam) for beam in plan.get("beams", {}).values())
@@ -0,0 +1,169 @@
+import os
+import warnings
+from typing import Optional
+
+import numpy as np
+
+# Backend of the loop kernels, numpy (default) or numba; numba falls back to numpy when it is not installed
+BACKEND_ENV = "PLANCOMPLEXITY_BACKEND"
+BACKENDS = ["numpy", "numba"]
+
+# Selected on first use, once per process
+_KERNELS = None
+
+
+class NumpyKernels:
+    """Reference kernels, vectorized over the control points of a beam.
+
+    Kernels take raw float64 arrays: left and right bank positions and field sizes (Ncp, Npairs), jaws (Ncp, 4)
+    ordered left, top, right, bottom, leaf tops and bottoms (Npairs,), as held by BeamApertures.
+    """
+    name = "numpy"
+
+    @staticmethod
+    def SidePerimeter(left: np.ndarray, right: np.ndarray, jaws: np.ndarray, leaf_tops: np.ndarray,
+                      leaf_bottoms: np.ndarray, outside: np.ndarray, field_size: np.ndarray) -> np.ndarray:
+        """Perimeter between adjacent leaf pairs i - 1 (top) and i (bottom), (Ncp, Npairs - 1)"""
+        top_size, bottom_size = field_size[:, :-1], field_size[:, 1:]
+        top_left, bottom_left = left[:, :-1], left[:, 1:]
+        top_right, bottom_right = right[:, :-1], right[:, 1:]
+        jaw_left, jaw_right = jaws[:, 0, None], jaws[:, 2, None]
+
+        edges = (np.abs(np.maximum(jaw_left, top_left) - np.maximum(jaw_left, bottom_left))
+                 + np.abs(np.minimum(jaw_right, top_right) - np.minimum(jaw_right, bottom_right)))
+        return np.select(
+            [outside[:, :-1] & outside[:, 1:],
+             jaws[:, 1, None] <= leaf_bottoms[None, :-1],
+             jaws[:, 3, None] >= leaf_tops[None, 1:],
+             (bottom_left > top_right) | (bottom_right < top_left)],
+            [0.0, bottom_size, top_size, top_size + bottom_size],
+            default=edges)
+
+    @staticmethod
+    def ApertureSubRegions(left: np.ndarray, right: np.ndarray, field_size: np.ndarray) -> np.ndarray:
+        """Number of sub regions of every aperture, (Ncp,)"""
+        opened = field_size > 0.5
+        new_region = np.ones_like(opened)
+        new_region[:, 1:] = ~opened[:, :-1] | (left[:, 1:] >= right[:, :-1]) | (right[:, 1:] <= left[:, :-1])
+        return np.sum(opened & new_region, axis=1)
+
+    @staticmethod
+    def SportModulation(positions: np.ndarray, metersets: np.ndarray, gantry_angles: np.ndarray, K: int) -> np.ndarray:
+        """SPORT MI of every control point over its 2K neighbours, positions (Ncp, Npairs, 2)"""
+        Ncp = len(positions)
+        mi = np.zeros(Ncp, dtype=float)
+        # the i -> i + shift and i -> i - shift neighbours share the same term, computed once per shift
+        for shift in range(1, min(K, Ncp - 1) + 1):
+            mlc_sum = np.sum(np.abs(positions[shift:] - positions[:-shift]), axis=(1, 2))
+            delta_mu = metersets[shift:] - metersets[:-shift]
+            delta_gantry = gantry_angles[shift:] - gantry_angles[:-shift]
+            factor = np.zeros(len(delta_mu))
+            np.divide(np.abs(delta_mu), np.abs(delta_gantry), out=factor, where=delta_gantry != 0)
+
+            term = mlc_sum * factor
+            mi[:-shift] += term
+            mi[shift:] += term
+        return mi
+
+
+# Loop versions of the kernels, compiled by NumbaKernels; plain Python functions otherwise
+
+def SidePerimeterLoop(left, right, jaws, leaf_tops, leaf_bottoms, outside, field_size):
+    n_cp, n_pairs = left.shape
+    perimeter = np.zeros((n_cp, max(n_pairs - 1, 0)))
+    for c in range(n_cp):
+        jaw_left, jaw_top, jaw_right, jaw_bottom = jaws[c, 0], jaws[c, 1], jaws[c, 2], jaws[c, 3]
+        for i in range(1, n_pairs):
+            top_size, bottom_size = field_size[c, i - 1], field_size[c, i]
+            top_left, bottom_left = left[c, i - 1], left[c, i]
+            top_right, bottom_right = right[c, i - 1], right[c, i]
+            if outside[c, i - 1] and outside[c, i]:
+                value = 0.0
+            elif jaw_top <= leaf_bottoms[i - 1]:
+                value = bottom_size
+            elif jaw_bottom >= leaf_tops[i]:
+                value = top_size
+            elif bottom_left > top_right or bottom_right < top_left:
+                value = top_size + bottom_size
+            else:
+                value = (abs(max(jaw_left, top_left) - max(jaw_left, bottom_left))
+                         + abs(min(jaw_right, top_right) - min(jaw_right, bottom_right)))
+            perimeter[c, i - 1] = value
+    return perimeter
+
+
+def ApertureSubRegionsLoop(left, right, field_size):
+    n_cp, n_pairs = left.shape
+    regions = np.zeros(n_cp, dtype=np.int64)
+    for c in range(n_cp):
+        previous_open = False
+        for i in range(n_pairs):
+            is_open = field_size[c, i] > 0.5
+            if is_open and (not previous_open or left[c, i] >= right[c, i - 1] or right[c, i] <= left[c, i - 1]):
+                regions[c] += 1
+            previous_open = is_open
+    return regions
+
+
+def SportModulationLoop(positions, metersets, gantry_angles, K):
+    n_cp, n_pairs = positions.shape[0], positions.shape[1]
+    mi = np.zeros(n_cp)
+    for shift in range(1, min(K, n_cp - 1) + 1):
+        for c in range(n_cp - shift):
+            delta_gantry = gantry_angles[c + shift] - gantry_angles[c]
+            if delta_gantry == 0:
+                continue
+            mlc_sum = 0.0
+            for i in range(n_pairs):
+                mlc_sum += abs(positions[c + shift, i, 0] - positions[c, i, 0])
+                mlc_sum += abs(positions[c + shift, i, 1] - positions[c, i, 1])
+            term = mlc_sum * (abs(metersets[c + shift] - metersets[c]) / abs(delta_gantry))
+            mi[c] += term
+            mi[c + shift] += term
+    return mi
+
+
+class NumbaKernels:
+    """Loop kernels compiled by Numba. Compiled functions are cached on disk (cache=True, in __pycache__
+    or NUMBA_CACHE_DIR), so new processes load them instead of compiling them again."""
+    name = "numba"
+
+    def __init__(self) -> None:
+        import numba
+
+        jit = numba.njit(cache=True)
+        self.SidePerimeter = jit(SidePerimeterLoop)
+        self.ApertureSubRegions = jit(ApertureSubRegionsLoop)
+        self.SportModulationLoop = jit(SportModulationLoop)
+
+    def SportModulation(self, positions: np.ndarray, metersets: np.ndarray, gantry_angles: np.ndarray,
+                        K: int) -> np.ndarray:
+        return self.SportModulationLoop(np.ascontiguousarray(positions), np.ascontiguousarray(metersets),
+                                        np.ascontiguousarray(gantry_angles), int(K))
+
+
+def LoadKernels(name: Optional[str] = None):
+    """Kernels of a backend, by default the one of PLANCOMPLEXITY_BACKEND; numpy if numba is not installed"""
+    name = (name or os.environ.get(BACKEND_ENV) or "numpy").lower()
+    if name not in BACKENDS:
+        raise ValueError("unknown kernel backend: %s, expected one of %s" % (name, BACKENDS))
+    if name == "numba":
+        try:
+            return NumbaKernels()
+        except ImportError:
+            warnings.warn("numba is not installed, using the numpy kernels")
+    return NumpyKernels()
+
+
+def GetKernels():
+    """Process wide kernels, selected once"""
+    global _KERNELS
+    if _KERNELS is None:
+        _KERNELS = LoadKernels()
+    return _KERNELS
+
+
+def SetKernels(name: Optional[str]) -> None:
+    """Selects the backend of the process, None selects it again from the environment on next use"""
+    global _KERNELS
+    _KERNELS = LoadKernels(name) if name is not None else None
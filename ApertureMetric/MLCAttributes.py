@@ -1,10 +1,21 @@
 import warnings
+from typing import Optional
 
 import numpy as np
-import pandas as pd
+
+from ApertureMetric.BeamApertures import BeamApertures
+from ApertureMetric.MachineProfile import GetMachineProfile, MachineProfile
 
 
 class MLCAttributes:
+    """MLC, gantry and dose rate kinematics of a beam, as NumPy arrays (one row per control point).
+
+    The first row of the speeds, the first two rows of the accelerations and the first value of every
+    delta are NaN, as the differences are not defined there. pandas DataFrame views of the arrays are
+    available with MLCSpeed(as_frame=True), MLCAcc(as_frame=True) and the delta_mu_time, gantry and
+    dose_rate properties; pandas is only imported when a view is requested.
+    """
+
     def __init__(self, apertures, cumulative_mu, treatment_machine_name, dose_rate_set,
                  gantry_rotation_angle) -> None:
         # beam data
@@ -13,110 +24,143 @@ class MLCAttributes:
         self.gantry_rotation_angle = gantry_rotation_angle
         self.apertures = apertures
         self.Ncp = len(self.apertures)
+        beam_apertures = BeamApertures.FromApertures(apertures)
 
         # meterset data
-        self.delta_mu_time = self.get_delta_mu_data(cumulative_mu)
-
-        # MLC position data
-        self.mlc_positions = self.get_positions()
-        self.mlc_speed = (self.mlc_positions.diff().abs().T / self.delta_mu_time['time']).T
-        self.mlc_speed_std = self.mlc_speed.std()
-
-        self.mlc_acc = (self.mlc_speed.diff().abs().T / self.delta_mu_time['time']).T
-        self.mlc_acc_std = self.mlc_acc.std()
-
-        # gantry data
-        gantry_angles = np.array([ap.GantryAngle for ap in self.apertures])
-        self.gantry = pd.DataFrame(gantry_angles, columns=['gantry'])
-        self.gantry['delta_gantry'] = self.rolling_apply(self.delta_gantry, gantry_angles)
-        self.gantry['gantry_speed'] = self.gantry['delta_gantry'] / self.delta_mu_time['time']
-        self.gantry['delta_gantry_speed'] = self.gantry['gantry_speed'].diff().abs()
-        self.gantry['gantry_acc'] = self.gantry['delta_gantry_speed'] / self.delta_mu_time['time']
-
-        # dose rate data
-        self.dose_rate = pd.DataFrame(
-            self.delta_mu_time['delta_mu'] / self.delta_mu_time['time'], columns=['DR'])
-        self.dose_rate['delta_dose_rate'] = self.dose_rate.diff().abs()
-
-    def get_delta_mu_data(self, cumulative_mu):
-        # meterset data
-        tmp = pd.DataFrame(cumulative_mu, columns=['MU'])
-        tmp['delta_mu'] = tmp.diff().abs()
-        tmp['time'] = tmp['delta_mu'].apply(self.calculate_time)
-        return tmp
+        self.cumulative_mu = np.asarray(cumulative_mu, dtype=float)
+        self.delta_mu = self.Delta(self.cumulative_mu)
+
+        # MLC position and gantry angle data, columns ordered bank A / bank B of each leaf pair
+        self.mlc_positions = beam_apertures.leaf_positions.reshape(self.Ncp, -1)
+        self.gantry_angles = np.asarray(beam_apertures.GantryAngles, dtype=float)
+        self.delta_gantry_angle = np.concatenate(
+            ([np.nan], self.delta_gantry((self.gantry_angles[:-1], self.gantry_angles[1:]))))
+        self.time = self.calculate_times(self.delta_mu)
+
+        with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)     # all-NaN columns of nanstd
+
+            self.mlc_speed = self.Delta(self.mlc_positions) / self.time[:, None]
+            self.mlc_speed_std = np.nanstd(self.mlc_speed, axis=0, ddof=1)
+
+            self.mlc_acc = self.Delta(self.mlc_speed) / self.time[:, None]
+            self.mlc_acc_std = np.nanstd(self.mlc_acc, axis=0, ddof=1)
+
+            # gantry data
+            self.gantry_speed = self.delta_gantry_angle / self.time
+            self.delta_gantry_speed = self.Delta(self.gantry_speed)
+            self.gantry_acc = self.delta_gantry_speed / self.time
+
+            # dose rate data
+            self.dose_rates = self.delta_mu / self.time
+            self.delta_dose_rate = self.Delta(self.dose_rates)
+
+    @staticmethod
+    def Delta(values: np.ndarray) -> np.ndarray:
+        """Absolute difference with the previous row, NaN for the first row (pandas diff().abs())"""
+        delta = np.full(values.shape, np.nan)
+        delta[1:] = np.abs(values[1:] - values[:-1])
+        return delta
+
+    def machine_profile(self) -> Optional[MachineProfile]:
+        """Delivery limits of the treatment machine from the machine profile registry, None if unknown"""
+        return GetMachineProfile(self.treatment_machine_name)
+
+    def max_gantry_speed(self):
+        """Maximum gantry speed (deg/s) of the treatment machine, None if unknown"""
+        profile = self.machine_profile()
+        return profile.max_gantry_speed if profile is not None else None
+
+    def calculate_times(self, delta_mu: np.ndarray) -> np.ndarray:
+        """Time (s) of all control points with the delivery model of the machine profile, NaN where not defined"""
+        profile = self.machine_profile()
+        if profile is None:
+            warnings.warn("机器 %s 不在machine profile中，无法计算控制点时间" % self.treatment_machine_name)
+            return np.full(len(delta_mu), np.nan)
+
+        # 控制点间最大叶片运动距离，Elekta模型中限制控制点最短时间
+        leaf_travel = np.max(self.Delta(self.mlc_positions), axis=1, initial=0.0)
+        return profile.ControlPointTimes(delta_mu, self.delta_gantry_angle, leaf_travel,
+                                         dose_rate_set=self.dose_rate_set,
+                                         gantry_rotation_angle=self.gantry_rotation_angle)
 
     def calculate_time(self, delta_mu):
         """计算控制点时间（Calculate time between control points in seconds）
+        Scalar reference of calculate_times, only for the constant_gantry_speed (Varian) delivery model.
         :param delta_mu:
         :return: time in seconds
         """
-        # 当前方法Trilogy, dose rate为600 MU/min
-        if self.treatment_machine_name == 'TRILOGY-SN5602':
-            # Gantry最大速度匀速旋转条件下，单位控制点MU为delta,当前控制点MU大于delta说明机架有降速
-            delta = ((self.gantry_rotation_angle / self.Ncp) / 4.8) * (self.dose_rate_set / 60)
-            if delta_mu <= delta:
-                return (self.gantry_rotation_angle / self.Ncp) / 4.8
-            elif delta_mu > delta:
-                return delta_mu / (self.dose_rate_set / 60)
-        elif self.treatment_machine_name == 'TrueBeamSN1352' \
-                or self.treatment_machine_name == 'TrueBeamSN2716':
-            delta = ((self.gantry_rotation_angle / self.Ncp) / 6.0) * (self.dose_rate_set / 60)
-            if delta_mu <= delta:
-                return (self.gantry_rotation_angle / self.Ncp) / 6.0
-            elif delta_mu > delta:
-                return delta_mu / (self.dose_rate_set / 60)
-        else:
-            warnings.warn("当前只有Varian机器可计算控制点时间，Monaco控制点时间计算待确定？？？")
-
-    def get_positions(self):
-        pos = []
-        for aperture in self.apertures:
-            cp_pos = [(lp.Left, lp.Right) for lp in aperture.LeafPairs]
-            arr = np.ravel(cp_pos)  # 返回一个扁平数组
-            pos.append(arr)
-
-        return pd.DataFrame(pos)
+        profile = self.machine_profile()
+        if profile is None or profile.delivery_model != "constant_gantry_speed":
+            warnings.warn("calculate_time只适用于Varian机器，其他机器使用calculate_times")
+            return None
+        # Gantry最大速度匀速旋转条件下，单位控制点MU为delta,当前控制点MU大于delta说明机架有降速
+        gantry_time = (self.gantry_rotation_angle / self.Ncp) / profile.max_gantry_speed
+        delta = gantry_time * (self.dose_rate_set / 60)
+        if delta_mu <= delta:
+            return gantry_time
+        return delta_mu / (self.dose_rate_set / 60)
+
+    def get_positions(self) -> np.ndarray:
+        return self.mlc_positions
 
     @staticmethod
     def delta_gantry(param):
+        """Smallest angle between gantry angles alpha and beta, element-wise for arrays"""
         alpha, beta = param
-        phi = abs(beta - alpha) % 360
-        return 360 - phi if phi > 180 else phi
-
-    @staticmethod
-    def rolling_apply(fun, a, w=2):
-        r = np.empty(a.shape)
-        r.fill(np.nan)
-        for i in range(w - 1, a.shape[0]):
-            r[i] = fun(a[(i - w + 1):i + 1])
-        return r
-
-    def MLCSpeed(self) -> pd.DataFrame:
+        phi = np.abs(np.asarray(beta) - np.asarray(alpha)) % 360
+        return np.where(phi > 180, 360 - phi, phi)
+
+    # pandas views
+
+    @property
+    def delta_mu_time(self):
+        import pandas as pd
+        return pd.DataFrame({'MU': self.cumulative_mu, 'delta_mu': self.delta_mu, 'time': self.time})
+
+    @property
+    def gantry(self):
+        import pandas as pd
+        return pd.DataFrame({'gantry': self.gantry_angles, 'delta_gantry': self.delta_gantry_angle,
+                             'gantry_speed': self.gantry_speed, 'delta_gantry_speed': self.delta_gantry_speed,
+                             'gantry_acc': self.gantry_acc})
+
+    @property
+    def dose_rate(self):
+        import pandas as pd
+        return pd.DataFrame({'DR': self.dose_rates, 'delta_dose_rate': self.delta_dose_rate})
+
+    def MLCSpeed(self, as_frame: bool = False):
+        if as_frame:
+            import pandas as pd
+            return pd.DataFrame(self.mlc_speed)
         return self.mlc_speed
 
-    def MLCAcc(self) -> pd.DataFrame:
+    def MLCAcc(self, as_frame: bool = False):
+        if as_frame:
+            import pandas as pd
+            return pd.DataFrame(self.mlc_acc)
         return self.mlc_acc
 
+    @staticmethod
+    def NonZeroMean(values: np.ndarray, axis=None) -> np.ndarray:
+        """Mean skipping NaN and zero values"""
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanmean(np.where(values == 0, np.nan, values), axis=axis)
+
     def MLCSpeedAvg(self) -> np.ndarray:
         # 排除MLC速度为0叶片，其显著影响平均值计算
-        mlc_speed_nonzero = self.mlc_speed.replace(0, np.NaN)
-        mlc_speed_avg = np.mean(mlc_speed_nonzero.mean())
-        return mlc_speed_avg
+        return self.NonZeroMean(self.NonZeroMean(self.mlc_speed, axis=0))
 
     def MLCSpeedStdAvg(self) -> np.ndarray:
         # 排除MLC速度标准差为0叶片，其显著影响平均值计算
-        mlc_speed_std_nonzero = self.mlc_speed_std.replace(0, np.NaN)
-        mlc_speed_std_avg = np.mean(mlc_speed_std_nonzero.mean())
-        return mlc_speed_std_avg
+        return self.NonZeroMean(self.mlc_speed_std)
 
     def MLCAccAvg(self) -> np.ndarray:
         # 排除MLC加速度为0叶片，其显著影响平均值计算
-        mlc_acc_nonzero = self.mlc_acc.replace(0, np.NaN)
-        mlc_acc_avg = np.mean(mlc_acc_nonzero.mean())
-        return mlc_acc_avg
+        return self.NonZeroMean(self.NonZeroMean(self.mlc_acc, axis=0))
 
     def MLCAccStdAvg(self) -> np.ndarray:
         # 排除MLC加速度标准差为0叶片，其显著影响平均值计算
-        mlc_acc_std_nonzero = self.mlc_acc_std.replace(0, np.NaN)
-        mlc_acc_std_avg = np.mean(mlc_acc_std_nonzero.mean())
-        return mlc_acc_std_avg
+        return self.NonZeroMean(self.mlc_acc_std)
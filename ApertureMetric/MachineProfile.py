@@ -0,0 +1,129 @@
+import json
+import os
+import os.path as osp
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Default registry, another JSON file with the same layout can be given with the environment variable
+DEFAULT_PROFILES = osp.join(osp.dirname(osp.abspath(__file__)), "machine_profiles.json")
+PROFILES_ENV = "PLANCOMPLEXITY_MACHINE_PROFILES"
+
+# Loaded on first use, once per process
+_REGISTRY = None
+
+
+class MachineProfile:
+    """
+        Delivery limits of a treatment machine and its control point time model.
+
+        delivery_model:
+            "constant_gantry_speed": Varian VMAT, the gantry turns at max_gantry_speed and the dose rate is
+                modulated below the planned DoseRateSet; a control point takes longer only when its MU cannot
+                be delivered at DoseRateSet in the time of an even gantry step (rotation angle / Ncp).
+            "discrete_dose_rate": Elekta VMAT, the dose rate is one of the dose_rates levels and the gantry
+                slows down when needed: the time is limited by the gantry (max_gantry_speed), the MLC
+                (max_mlc_speed, largest leaf travel) and the MU, delivered at the highest level that does not
+                make the control point shorter than the gantry and MLC limits.
+    """
+
+    def __init__(self, name: str, machines: Sequence[str], manufacturer: str, delivery_model: str,
+                 max_gantry_speed: float, dose_rates: Sequence[float], max_mlc_speed: float) -> None:
+        """
+        :param max_gantry_speed: deg/s
+        :param dose_rates: available dose rates, MU/min
+        :param max_mlc_speed: mm/s
+        """
+        if delivery_model not in ["constant_gantry_speed", "discrete_dose_rate"]:
+            raise ValueError("unknown delivery model: %s" % delivery_model)
+        self.name = name
+        self.machines = list(machines)
+        self.manufacturer = manufacturer
+        self.delivery_model = delivery_model
+        self.max_gantry_speed = float(max_gantry_speed)
+        self.dose_rates = np.sort(np.asarray(dose_rates, dtype=float))
+        self.max_mlc_speed = float(max_mlc_speed)
+
+    @classmethod
+    def FromDict(cls, profile: Dict) -> "MachineProfile":
+        return cls(profile["name"], profile["machines"], profile.get("manufacturer", ""), profile["delivery_model"],
+                   profile["max_gantry_speed"], profile["dose_rates"], profile["max_mlc_speed"])
+
+    def __repr__(self):
+        return "MachineProfile - %s (%s)" % (self.name, self.delivery_model)
+
+    def ControlPointTimes(self, delta_mu: np.ndarray, delta_gantry: np.ndarray, leaf_travel: np.ndarray,
+                          dose_rate_set: float = None, gantry_rotation_angle: float = None) -> np.ndarray:
+        """Duration (s) of every control point of a beam, NaN where delta_mu is NaN (first control point)
+
+        :param delta_mu: MU delivered since the previous control point
+        :param delta_gantry: gantry rotation since the previous control point (deg)
+        :param leaf_travel: largest leaf travel since the previous control point (mm)
+        :param dose_rate_set: planned dose rate (MU/min), default the highest dose rate of the profile
+        :param gantry_rotation_angle: total arc length (deg), used by the constant_gantry_speed model
+        """
+        delta_mu = np.asarray(delta_mu, dtype=float)
+        if dose_rate_set is None or dose_rate_set == "":
+            dose_rate_set = self.dose_rates[-1]
+        dose_rate_set = float(dose_rate_set)
+
+        if self.delivery_model == "constant_gantry_speed":
+            gantry_time = (gantry_rotation_angle / len(delta_mu)) / self.max_gantry_speed
+            delta = gantry_time * (dose_rate_set / 60)
+            times = np.where(delta_mu <= delta, gantry_time, delta_mu / (dose_rate_set / 60))
+        else:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                # shortest time allowed by the gantry and the MLC
+                min_time = np.maximum(np.abs(np.asarray(delta_gantry, dtype=float)) / self.max_gantry_speed,
+                                      np.asarray(leaf_travel, dtype=float) / self.max_mlc_speed)
+                levels = self.dose_rates[self.dose_rates <= dose_rate_set] / 60
+                if len(levels) == 0:
+                    levels = self.dose_rates[:1] / 60
+                # highest level not faster than min_time, the lowest level if even that one is too fast
+                required = delta_mu / min_time
+                index = np.clip(np.searchsorted(levels, required, side='right') - 1, 0, len(levels) - 1)
+                times = np.maximum(min_time, delta_mu / levels[index])
+        return np.where(np.isnan(delta_mu), np.nan, times)
+
+
+class MachineProfileRegistry:
+    """Machine profiles by treatment machine name (DICOM TreatmentMachineName)"""
+
+    def __init__(self, profiles: List[MachineProfile]) -> None:
+        self.profiles = list(profiles)
+        self.machines = {machine: profile for profile in self.profiles for machine in profile.machines}
+
+    @classmethod
+    def Load(cls, filename: str = None) -> "MachineProfileRegistry":
+        """Loads a JSON registry, by default PLANCOMPLEXITY_MACHINE_PROFILES or the bundled machine_profiles.json"""
+        filename = filename or os.environ.get(PROFILES_ENV) or DEFAULT_PROFILES
+        with open(filename) as f:
+            data = json.load(f)
+        return cls([MachineProfile.FromDict(profile) for profile in data["profiles"]])
+
+    def Get(self, treatment_machine_name: str) -> Optional[MachineProfile]:
+        return self.machines.get(str(treatment_machine_name))
+
+    def __contains__(self, treatment_machine_name: str) -> bool:
+        return str(treatment_machine_name) in self.machines
+
+    def __len__(self) -> int:
+        return len(self.profiles)
+
+
+def GetMachineRegistry() -> MachineProfileRegistry:
+    """Process wide registry, loaded once"""
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = MachineProfileRegistry.Load()
+    return _REGISTRY
+
+
+def SetMachineRegistry(registry: Optional[MachineProfileRegistry]) -> None:
+    """Replaces the process wide registry, None reloads it from file on next use"""
+    global _REGISTRY
+    _REGISTRY = registry
+
+
+def GetMachineProfile(treatment_machine_name: str) -> Optional[MachineProfile]:
+    return GetMachineRegistry().Get(treatment_machine_name)
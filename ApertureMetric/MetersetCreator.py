@@ -9,16 +9,22 @@ class MetersetsFromMetersetWeightsCreator:
         if beam["PrimaryDosimeterUnit"] != "MU":
             return None
 
-        metersetWeights = self.GetMetersetWeights(beam["ControlPointSequence"])
+        metersetWeights = self.GetBeamMetersetWeights(beam)
         metersets = self.ConvertMetersetWeightsToMetersets(beam["MU"], metersetWeights)
 
         return self.UndoCummulativeSum(metersets)
 
     def GetCumulativeMetersets(self, beam):
-        metersetWeights = self.GetMetersetWeights(beam["ControlPointSequence"])
+        metersetWeights = self.GetBeamMetersetWeights(beam)
         metersets = self.ConvertMetersetWeightsToMetersets(beam["MU"], metersetWeights)
         return metersets
 
+    def GetBeamMetersetWeights(self, beam):
+        if "CumulativeMetersetWeights" in beam:
+            # beam already extracted to arrays (DicomParse.PlanArrays)
+            return np.asarray(beam["CumulativeMetersetWeights"], dtype=float)
+        return self.GetMetersetWeights(beam["ControlPointSequence"])
+
     @staticmethod
     def GetMetersetWeights(ControlPoints):
         return np.array([cp.CumulativeMetersetWeight for cp in ControlPoints], dtype=float)
@@ -30,13 +36,8 @@ class MetersetsFromMetersetWeightsCreator:
     @staticmethod
     def UndoCummulativeSum(cummulativeSum):
         """Returns the values whose cummulative sum is "cummulativeSum" """
-        values = np.zeros(len(cummulativeSum))
-        delta_prev = 0.0
-        for i in range(len(values) - 1):
-            delta_curr = cummulativeSum[i + 1] - cummulativeSum[i]
-            values[i] = 0.5 * delta_prev + 0.5 * delta_curr
-            delta_prev = delta_curr
-
-        values[-1] = 0.5 * delta_prev
-
-        return values
+        # each control point gets half of the meterset delivered before and half of the one delivered after it
+        delta = np.diff(np.asarray(cummulativeSum, dtype=float))
+        delta_prev = np.concatenate(([0.0], delta))
+        delta_curr = np.concatenate((delta, [0.0]))
+        return 0.5 * delta_prev + 0.5 * delta_curr
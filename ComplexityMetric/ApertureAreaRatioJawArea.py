@@ -1,7 +1,10 @@
 from typing import List
 
+import numpy as np
+
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
+from ApertureMetric.BeamApertures import BeamApertures
 
 
 class ApertureAreaRatioJawArea(ComplexityMetric):
@@ -11,11 +14,16 @@ class ApertureAreaRatioJawArea(ComplexityMetric):
         LAM, Dao, et al. Predicting gamma passing rates for portal dosimetry‐based IMRT QA using machine learning.
         Medical physics, 2019, 46.10: 4666-4675. DOI: https://doi.org/10.1002/mp.13752
     """
-    def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
+    def CalculatePerAperture(self, apertures: List[PyAperture]) -> np.ndarray:
         """计算控制点Aperture面积与Jaw面积比值"""
-        return [self.CalculateApertureAreaRatioJawArea(aperture) for aperture in apertures]
+        beam_apertures = BeamApertures.FromApertures(apertures)
+        jaw_area = (np.abs(beam_apertures.JawRight - beam_apertures.JawLeft)
+                    * np.abs(beam_apertures.JawTop - beam_apertures.JawBottom))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return beam_apertures.Area() / jaw_area
 
     def CalculateApertureAreaRatioJawArea(self, aperture: PyAperture) -> float:
+        """Scalar reference of CalculatePerAperture"""
         AA = aperture.Area()
         jaws = aperture.Jaw
         JA = abs(jaws.Right - jaws.Left) * abs(jaws.Top - jaws.Bottom)
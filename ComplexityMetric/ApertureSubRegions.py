@@ -1,7 +1,10 @@
 from typing import List
 
+import numpy as np
+
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
+from ApertureMetric.BeamApertures import BeamApertures
 
 
 class ApertureSubRegions(ComplexityMetric):
@@ -11,6 +14,6 @@ class ApertureSubRegions(ComplexityMetric):
         LAM, Dao, et al. Predicting gamma passing rates for portal dosimetry‐based IMRT QA using machine learning.
         Medical physics, 2019, 46.10: 4666-4675. DOI: https://doi.org/10.1002/mp.13752
     """
-    def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
+    def CalculatePerAperture(self, apertures: List[PyAperture]) -> np.ndarray:
         """计算aperture中有多少个小子野，MLC interplay"""
-        return [aperture.ApertureSubRegions() for aperture in apertures]
+        return BeamApertures.FromApertures(apertures).ApertureSubRegions()
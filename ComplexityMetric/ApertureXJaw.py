@@ -1,7 +1,10 @@
 from typing import List
 
+import numpy as np
+
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
+from ApertureMetric.BeamApertures import BeamApertures
 
 
 class ApertureXJaw(ComplexityMetric):
@@ -12,6 +15,7 @@ class ApertureXJaw(ComplexityMetric):
         Classification Accuracy. International Journal of Radiation Oncology* Biology* Physics, 2019, 105.4: 893-902.
         DOI: https://doi.org/10.1016/j.ijrobp.2019.07.049
     """
-    def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
+    def CalculatePerAperture(self, apertures: List[PyAperture]) -> np.ndarray:
         """计算X方向Jaw距离"""
-        return [abs(aperture.jaw.Right - aperture.jaw.Left) for aperture in apertures]
\ No newline at end of file
+        beam_apertures = BeamApertures.FromApertures(apertures)
+        return np.abs(beam_apertures.JawRight - beam_apertures.JawLeft)
\ No newline at end of file
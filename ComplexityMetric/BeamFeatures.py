@@ -0,0 +1,62 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from ComplexityMetric.ApertureAreaRatioJawArea import ApertureAreaRatioJawArea
+from ComplexityMetric.ApertureSubRegions import ApertureSubRegions
+from ComplexityMetric.ApertureXJaw import ApertureXJaw
+from ComplexityMetric.ApertureYJaw import ApertureYJaw
+from ComplexityMetric.ConvertedApertureMetric import ConvertedApertureMetric
+from ComplexityMetric.EdgeAreaMetric import EdgeAreaMetric
+from ComplexityMetric.EdgeMetric import EdgeMetric
+from ComplexityMetric.LeafArea import LeafArea
+from ComplexityMetric.MeanAsymmetryDistance import MeanAsymmetryDistance
+from ComplexityMetric.MeanFieldArea import MeanFieldArea
+from ComplexityMetric.MetricSuite import MetricSuite
+from ComplexityMetric.ModulationComplexityScore import ModulationComplexityScore
+from ComplexityMetric.PlanIrregularity import PlanIrregularity
+from ComplexityMetric.SmallApertureScore import SmallApertureScore
+
+# Per control point aperture features, MetricSuite entries (name, metric) or (name, metric, params)
+BEAM_FEATURES = [
+    ('Aperture_Area', MeanFieldArea()),
+    ('Leaf_Area', LeafArea()),
+    ('EDGE_Metric', EdgeMetric()),
+    ('Plan_Irregularity', PlanIrregularity()),
+    ('Converted_Aperture_Metric', ConvertedApertureMetric()),
+    ('Edge_Area_Metric', EdgeAreaMetric()),
+    (('Small_Aperture_Score_5mm', 'Small_Aperture_Score_10mm', 'Small_Aperture_Score_20mm'),
+     SmallApertureScore(), {'x': [5, 10, 20]}),
+    ('Mean_Asymmetry_Distance', MeanAsymmetryDistance()),
+    ('Modulation_Complexity_Score', ModulationComplexityScore()),
+    ('Aperture_Area_Ratio_Jaw_Area', ApertureAreaRatioJawArea()),
+    ('Aperture_Sub_Regions', ApertureSubRegions()),
+    ('Aperture_X_Jaw_Distance', ApertureXJaw()),
+    ('Aperture_Y_Jaw_Distance', ApertureYJaw()),
+]
+
+
+def compute_beam_features(beam: Dict[str, str], metrics: Sequence[Tuple] = None) -> Tuple[np.ndarray, List[str]]:
+    """Returns the (Ncp, M) float matrix of the unweighted per control point metrics of a beam and its M column names
+
+    The beam apertures are built once (BeamContext) and shared by all metrics, each metric fills its columns
+    of the matrix with one vectorized call.
+
+    :param beam: beam dict of RTPlan.get_plan (or DicomParse.PlanArrays.ExtractPlan)
+    :param metrics: MetricSuite, or its list of (name, metric, params) entries, default BEAM_FEATURES;
+        only per control point metrics (PerControlPoint) are allowed
+    """
+    suite = metrics if isinstance(metrics, MetricSuite) else MetricSuite(BEAM_FEATURES if metrics is None else metrics)
+    for name, metric, params in suite.metrics:
+        if not metric.PerControlPoint:
+            raise ValueError("%s is not a per control point metric" % type(metric).__name__)
+
+    names = suite.ColumnNames
+    n_cp = len(suite.GetBeamContext(beam).Apertures)
+    features = np.empty((n_cp, len(names)))
+    column = 0
+    for name, metric, params in suite.metrics:
+        values = np.asarray(metric.GetMetricsBeam(beam, **params), dtype=float).reshape(n_cp, -1)
+        features[:, column:column + values.shape[1]] = values
+        column += values.shape[1]
+    return features, names
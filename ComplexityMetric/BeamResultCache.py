@@ -0,0 +1,120 @@
+import copy
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Tuple
+
+import numpy as np
+
+# Active cache, None when beam results are not memoized: the wrappers then only read this global
+_CACHE = None
+
+
+def MetricIdentity(metric) -> Tuple[str, list]:
+    """Class name and simple attributes (e.g. SPORT K, speed bins) of a metric, what makes two instances differ"""
+    attributes = {k: v for k, v in vars(metric).items() if isinstance(v, (bool, int, float, str, tuple, list, dict))}
+    return type(metric).__name__, sorted(attributes.items())
+
+
+def ParameterKey(value) -> Hashable:
+    """Hashable key of a metric parameter, arrays (e.g. SPORT metersets) by the SHA-1 of their values"""
+    if isinstance(value, np.ndarray):
+        return "array", value.shape, hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest()
+    if isinstance(value, (list, tuple)):
+        return tuple(ParameterKey(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, ParameterKey(v)) for k, v in value.items()))
+    return repr(value)
+
+
+class BeamResultCache:
+    """Memoized beam level metric results, keyed by (beam content hash, metric, method, parameters).
+
+    Revisions of a plan usually share most of their beams: with a cache active, the metrics of the beams whose
+    content (BeamContext.ContentHash) did not change are read back instead of calculated. Per control point
+    metrics store their unweighted values (GetMetricsBeam), the others their beam result (CalculateForBeam).
+    The least recently used results are dropped beyond max_entries. Each process has its own cache. Callers get
+    a copy of the stored result, changing it (e.g. a list of per control point values) does not change the cache.
+
+    Example:
+        with BeamResults() as cache:
+            for revision in revisions:
+                rows.append(suite.CalculateForPlan(ReadPlan(revision)))
+        print(cache.hits, cache.misses)
+    """
+
+    def __init__(self, max_entries: int = 100000) -> None:
+        self.max_entries = max_entries
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def Call(self, method: str, func: Callable, metric, beam: Dict[str, str], args, kwargs):
+        key = (metric.GetBeamContext(beam).ContentHash, repr(MetricIdentity(metric)), method,
+               ParameterKey(args), ParameterKey(kwargs))
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(self.results[key])
+
+        result = func(metric, beam, *args, **kwargs)
+        with self.lock:
+            self.misses += 1
+            self.results[key] = copy.deepcopy(result)
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+        return result
+
+    def Clear(self) -> None:
+        with self.lock:
+            self.results.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+
+def MemoizedBeam(method: str) -> Callable:
+    """Decorator of the beam entry points of ComplexityMetric, memoized in the active BeamResultCache:
+    GetMetricsBeam for per control point metrics, CalculateForBeam for the others"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, beam, *args, **kwargs):
+            cache = _CACHE
+            if (cache is None or not self.CacheBeamResults
+                    or self.PerControlPoint != (method == "GetMetricsBeam")):
+                return func(self, beam, *args, **kwargs)
+            return cache.Call(method, func, self, beam, args, kwargs)
+        return wrapper
+    return decorator
+
+
+def EnableBeamResults(cache: BeamResultCache = None) -> BeamResultCache:
+    global _CACHE
+    _CACHE = cache if cache is not None else BeamResultCache()
+    return _CACHE
+
+
+def DisableBeamResults() -> BeamResultCache:
+    global _CACHE
+    cache, _CACHE = _CACHE, None
+    return cache
+
+
+def GetBeamResults() -> BeamResultCache:
+    return _CACHE
+
+
+@contextmanager
+def BeamResults(cache: BeamResultCache = None):
+    """Memoizes the beam results of the metrics inside the with block, see BeamResultCache"""
+    previous = _CACHE
+    cache = EnableBeamResults(cache)
+    try:
+        yield cache
+    finally:
+        EnableBeamResults(previous) if previous is not None else DisableBeamResults()
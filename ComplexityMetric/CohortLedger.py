@@ -0,0 +1,121 @@
+import json
+import os
+import sqlite3
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from ComplexityMetric.CohortRunner import iter_cohort
+from ComplexityMetric.MetricSuite import MetricSuite
+from DicomParse.PlanCache import PlanCache
+
+
+class CohortLedger:
+    """SQLite ledger of the processed plan files: path, size, mtime, content SHA-1, metric set version
+    and the result record (CohortRunner.ProcessPlan) of each file.
+
+    A file is up to date when its ledger entry has the same version and either the same size and mtime,
+    or, if these changed, the same content hash (the file was copied or touched but not modified).
+    """
+
+    def __init__(self, filename: str, commit_every: int = 50) -> None:
+        self.filename = filename
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS ledger (
+                                   path TEXT PRIMARY KEY, size INTEGER, mtime REAL, sha1 TEXT,
+                                   version TEXT, status TEXT, record TEXT)""")
+        self.connection.commit()
+
+    def __enter__(self) -> "CohortLedger":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.Close()
+
+    def Close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM ledger").fetchone()[0]
+
+    def Get(self, path: str, version: str) -> Optional[Dict]:
+        """Returns the stored record of an unchanged file processed with version, None otherwise"""
+        row = self.connection.execute("SELECT size, mtime, sha1, version, record FROM ledger WHERE path = ?",
+                                      (path,)).fetchone()
+        if row is None or row[3] != version:
+            return None
+
+        size, mtime, sha1, _, record = row
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if (stat.st_size, stat.st_mtime) != (size, mtime):
+            if stat.st_size != size or PlanCache.Key(path) != sha1:
+                return None
+            # same content, only the file stat changed
+            self.connection.execute("UPDATE ledger SET mtime = ? WHERE path = ?", (stat.st_mtime, path))
+        return json.loads(record)
+
+    def Put(self, record: Dict, version: str) -> None:
+        """Stores a record of iter_cohort(..., file_stamp=True): its file stamp is the size, mtime and SHA-1 of
+        the content calculated, a file rewritten meanwhile is not taken as up to date on the next run"""
+        path = record["path"]
+        # control point columns are written to a ControlPointSink, not kept in the ledger
+        stored = {key: value for key, value in record.items() if key not in ["control_points", "file"]}
+        stamp = record.get("file") or {}     # no stamp when the file could not be read
+        size, mtime, sha1 = stamp.get("size"), stamp.get("mtime"), stamp.get("sha1")
+        self.connection.execute("INSERT OR REPLACE INTO ledger VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (path, size, mtime, sha1, version, record["status"], json.dumps(stored)))
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.connection.commit()
+            self._uncommitted = 0
+
+    def Prune(self, paths: Sequence[str]) -> int:
+        """Removes the entries of files not in paths (deleted or moved plans), returns the number removed"""
+        keep = set(paths)
+        stale = [path for path, in self.connection.execute("SELECT path FROM ledger") if path not in keep]
+        self.connection.executemany("DELETE FROM ledger WHERE path = ?", [(path,) for path in stale])
+        self.connection.commit()
+        return len(stale)
+
+
+def iter_incremental_cohort(paths: Sequence[str], metrics, ledger: CohortLedger, retry_errors: bool = True,
+                            **kwargs) -> Iterator[Dict]:
+    """Yields the result record of every plan file in the order of paths, calculating only the new or
+    changed files (see iter_cohort for kwargs) and reading the others from the ledger.
+
+    The ledger version combines the MetricSuite Version, plan_classes and the qualified name of plan_filter, so
+    changing the metric set or the selection recalculates every file. Failed files are calculated again unless retry_errors is False.
+    """
+    suite = metrics if isinstance(metrics, MetricSuite) else MetricSuite(metrics)
+    version = suite.Version
+    if kwargs.get("plan_classes") is not None:
+        version += ":" + ",".join(sorted(kwargs["plan_classes"]))
+    if kwargs.get("plan_filter") is not None:
+        plan_filter = kwargs["plan_filter"]
+        version += ":%s.%s" % (plan_filter.__module__, plan_filter.__qualname__)
+
+    stored = {}
+    for path in paths:
+        record = ledger.Get(path, version)
+        if record is not None and (record["status"] != "error" or not retry_errors):
+            stored[path] = record
+
+    computed = iter_cohort([path for path in paths if path not in stored], suite, file_stamp=True, **kwargs)
+    for path in paths:
+        if path in stored:
+            yield stored[path]
+        else:
+            record = next(computed)
+            ledger.Put(record, version)
+            yield record
+    ledger.connection.commit()
+
+
+def run_incremental_cohort(paths: Sequence[str], metrics, ledger: CohortLedger, retry_errors: bool = True,
+                           **kwargs) -> List[Dict]:
+    """Calculates the metrics of the new or changed plan files, see iter_incremental_cohort"""
+    return list(iter_incremental_cohort(paths, metrics, ledger, retry_errors=retry_errors, **kwargs))
@@ -0,0 +1,331 @@
+import hashlib
+import io
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from ComplexityMetric.ControlPointSink import ControlPointColumns
+from ComplexityMetric.MetricSuite import MetricSuite
+from DicomParse.PlanArrays import ReadPlan
+from DicomParse.PlanCache import PlanCache
+from DicomParse.dicomrt import triage
+
+# Per-process state of the pool workers, set once by InitWorker instead of pickling the metrics for every file
+_WORKER_STATE = {}
+
+
+def PlanInfo(plan: Dict[str, str]) -> Dict[str, Union[str, float]]:
+    """Small, picklable plan description used as the first columns of a cohort row"""
+    machine_id = ""
+    for beam in plan["beams"].values():
+        machine_id = str(beam.get("TreatmentMachineName", ""))
+        break
+
+    return {
+        "ID": str(plan["patient_id"]),
+        "Name": str(plan["patient_name"]),
+        "PlanID": str(plan["plan_name"]),
+        "MachineID": machine_id,
+        "Calculation_Model": str(plan["calculation_model"]),
+        "Prescribed_Dose": plan["rxdose"],
+        "MU": float(plan["Plan_MU"]),
+    }
+
+
+def ToBuiltin(value):
+    """Converts numpy scalars so that result records stay small and picklable"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def NewRecord(path: str) -> Dict:
+    return {"path": path, "status": "ok", "plan": {}, "metrics": {}, "error": ""}
+
+
+def SetError(record: Dict, e: Exception) -> Dict:
+    record["status"] = "error"
+    record["error"] = "%s: %s" % (type(e).__name__, e)
+    return record
+
+
+def ReadErrorRecord(path: str, error: str, plan_classes: Sequence[str] = None) -> Dict:
+    """Record of a file that could not be read, skipped as triage class INVALID as in ProcessPlan"""
+    record = NewRecord(path)
+    if plan_classes is not None and "INVALID" not in plan_classes:
+        record["status"] = "skipped"
+        record["error"] = "plan class: INVALID"
+    else:
+        record["status"] = "error"
+        record["error"] = error
+    return record
+
+
+def FileStamp(data: bytes, stat: Dict) -> Dict:
+    """Size, mtime and content SHA-1 of a plan file, stat taken before data was read (ReadPlanData)"""
+    return dict(stat, sha1=hashlib.sha1(data).hexdigest())
+
+
+def ParsePlan(path: str, record: Dict, plan_classes: Sequence[str] = None, plan_cache: PlanCache = None,
+              data: bytes = None) -> Optional[Dict]:
+    """Parse stage of ProcessPlan, returns the plan of a file or None when it is skipped (record updated)
+
+    The plan is read in extraction mode (DicomParse.PlanArrays.ReadPlan), the dataset is released before the
+    compute stage. With data, the file content already read (iter_plan_data), the file is not opened again.
+    """
+    source = (lambda: io.BytesIO(data)) if data is not None else (lambda: path)
+    if plan_classes is not None:
+        plan_class = triage(source())["plan_class"]
+        if plan_class not in plan_classes:
+            record["status"] = "skipped"
+            record["error"] = "plan class: %s" % plan_class
+            return None
+
+    if plan_cache is not None:
+        return plan_cache.Load(path) if data is None else plan_cache.LoadData(data)
+    return ReadPlan(path if data is None else data)
+
+
+def ComputePlan(plan: Dict, record: Dict, suite: MetricSuite, plan_filter: Callable = None,
+                control_points: bool = False) -> Dict:
+    """Compute stage of ProcessPlan, fills the plan and metrics of the record"""
+    record["plan"] = PlanInfo(plan)
+    if plan_filter is not None and not plan_filter(plan):
+        record["status"] = "skipped"
+        return record
+
+    row = suite.CalculateForPlan(plan)
+    record["metrics"] = {name: ToBuiltin(v) for name, v in row.items()}
+    if control_points:
+        record["control_points"] = ControlPointColumns(plan, suite, record["path"])
+    return record
+
+
+def ProcessPlan(path: str, suite: MetricSuite, plan_filter: Callable = None,
+                plan_classes: Sequence[str] = None, plan_cache: PlanCache = None,
+                control_points: bool = False, data: bytes = None, file_stamp: bool = False,
+                stat: Dict = None) -> Dict:
+    """Calculates the metrics of one plan file and returns a result record, never raises
+
+    The record holds path, status ("ok", "skipped" or "error"), plan (PlanInfo), metrics (named row)
+    and error (message of the failure), no pydicom objects. With plan_classes, files whose triage
+    class is not listed are skipped before the full parse. With plan_cache, the extracted plan is read
+    from (or stored in) the cache instead of being parsed by pydicom. With control_points, the record also
+    holds control_points, the per control point metric columns of the plan (ControlPointSink.ControlPointColumns).
+    With data, the file content is parsed instead of reading path (see ParsePlan), stat its size and mtime.
+    With file_stamp, the record also holds file, the size, mtime and SHA-1 (FileStamp) of the content that was
+    calculated, for CohortLedger.
+    """
+    if file_stamp and data is None:
+        try:
+            data, stat = ReadPlanData(path)
+        except OSError as e:
+            return ReadErrorRecord(path, "%s: %s" % (type(e).__name__, e), plan_classes)
+
+    record = NewRecord(path)
+    if file_stamp:
+        record["file"] = FileStamp(data, stat)
+    try:
+        plan = ParsePlan(path, record, plan_classes, plan_cache, data)
+        if plan is not None:
+            ComputePlan(plan, record, suite, plan_filter, control_points)
+    except Exception as e:
+        SetError(record, e)
+
+    return record
+
+
+def ReadPlanData(path: str) -> Tuple[bytes, Dict]:
+    """Content of a file and its size and mtime, taken before the read"""
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        return f.read(), {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def iter_plan_data(paths: Sequence[str], io_threads: int = 4,
+                   prefetch: int = 16) -> Iterator[Tuple[str, bytes, str, Dict]]:
+    """Yields (path, content, error, stat) of every file in the order of paths, io_threads threads reading up to
+    prefetch files ahead of the consumer; content and stat are None and error the message of a failed read"""
+    paths = iter(paths)
+    with ThreadPoolExecutor(max_workers=io_threads) as pool:
+        pending = deque((path, pool.submit(ReadPlanData, path)) for path in itertools.islice(paths, prefetch))
+        while pending:
+            path, future = pending.popleft()
+            # keep prefetch reads running while the consumer handles this file
+            pending.extend((p, pool.submit(ReadPlanData, p)) for p in itertools.islice(paths, 1))
+            try:
+                data, stat = future.result()
+            except OSError as e:
+                yield path, None, "%s: %s" % (type(e).__name__, e), None
+            else:
+                yield path, data, "", stat
+
+
+def InitWorker(suite: MetricSuite, plan_filter: Callable, plan_classes: Sequence[str],
+               plan_cache: PlanCache, control_points: bool = False, file_stamp: bool = False) -> None:
+    _WORKER_STATE["suite"] = suite
+    _WORKER_STATE["plan_filter"] = plan_filter
+    _WORKER_STATE["plan_classes"] = plan_classes
+    _WORKER_STATE["plan_cache"] = plan_cache
+    _WORKER_STATE["control_points"] = control_points
+    _WORKER_STATE["file_stamp"] = file_stamp
+
+
+def ProcessPlanInWorker(path: str) -> Dict:
+    return ProcessPlan(path, _WORKER_STATE["suite"], _WORKER_STATE["plan_filter"], _WORKER_STATE["plan_classes"],
+                       _WORKER_STATE["plan_cache"], _WORKER_STATE["control_points"],
+                       file_stamp=_WORKER_STATE["file_stamp"])
+
+
+def ProcessPlanDataChunkInWorker(items: List[Tuple[str, bytes, str, Dict]]) -> List[Dict]:
+    return [ProcessPlanDataInWorker(item) for item in items]
+
+
+def ProcessPlanDataInWorker(item: Tuple[str, bytes, str, Dict]) -> Dict:
+    path, data, error, stat = item
+    if data is None:
+        return ReadErrorRecord(path, error, _WORKER_STATE["plan_classes"])
+    return ProcessPlan(path, _WORKER_STATE["suite"], _WORKER_STATE["plan_filter"], _WORKER_STATE["plan_classes"],
+                       _WORKER_STATE["plan_cache"], _WORKER_STATE["control_points"], data=data,
+                       file_stamp=_WORKER_STATE["file_stamp"], stat=stat)
+
+
+def iter_pipeline(paths: Sequence[str], suite: MetricSuite, workers: int = None, chunksize: int = 1,
+                  max_tasks_per_child: int = None, io_threads: int = 4, prefetch: int = 16, plan_filter: Callable = None,
+                  plan_classes: Sequence[str] = None, plan_cache: PlanCache = None,
+                  control_points: bool = False, file_stamp: bool = False) -> Iterator[Dict]:
+    """Pipeline mode of iter_cohort: file reads (iter_plan_data), parsing and metric calculation overlap
+
+    In this process (workers 0 or 1), a parse thread turns the prefetched contents into extracted plans while
+    the metrics of the previous plans are calculated. With a process pool, the contents are sent to the
+    workers by chunks of chunksize files, which they parse (CPU bound, as the metrics) and calculate; at most
+    prefetch + 2 * workers * chunksize files are held in memory, the reads wait for the workers when the queues
+    are full.
+    """
+    items = iter_plan_data(paths, io_threads=io_threads, prefetch=prefetch)
+    if workers is not None and workers <= 1:
+        parsed = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+        failure = []     # exception escaping the parse stage, raised again in the consumer
+
+        def post(item) -> bool:
+            while not stop.is_set():
+                try:
+                    parsed.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def parse_stage():
+            try:
+                for path, data, error, stat in items:
+                    record, plan = NewRecord(path), None
+                    if data is None:
+                        record = ReadErrorRecord(path, error, plan_classes)
+                    else:
+                        if file_stamp:
+                            record["file"] = FileStamp(data, stat)
+                        try:
+                            plan = ParsePlan(path, record, plan_classes, plan_cache, data)
+                        except Exception as e:
+                            SetError(record, e)
+                    if not post((record, plan)):
+                        return
+            except BaseException as e:
+                failure.append(e)
+            finally:
+                # the consumer always gets the end of the stream
+                post(None)
+
+        thread = threading.Thread(target=parse_stage, daemon=True)
+        thread.start()
+        try:
+            for record, plan in iter(parsed.get, None):
+                if plan is not None:
+                    try:
+                        ComputePlan(plan, record, suite, plan_filter, control_points)
+                    except Exception as e:
+                        SetError(record, e)
+                yield record
+            if failure:
+                raise failure[0]
+        finally:
+            stop.set()
+        return
+
+    with multiprocessing.Pool(processes=workers, initializer=InitWorker,
+                              initargs=(suite, plan_filter, plan_classes, plan_cache, control_points, file_stamp),
+                              maxtasksperchild=max_tasks_per_child) as pool:
+        # bounded window of submitted chunks instead of imap, which would read the whole input ahead
+        in_flight = deque()
+        chunks = iter(lambda: list(itertools.islice(items, max(chunksize, 1))), [])
+        for chunk in chunks:
+            in_flight.append(pool.apply_async(ProcessPlanDataChunkInWorker, (chunk,)))
+            if len(in_flight) >= 2 * (workers or os.cpu_count() or 1):
+                yield from in_flight.popleft().get()
+        while in_flight:
+            yield from in_flight.popleft().get()
+
+
+def iter_cohort(paths: Sequence[str], metrics, workers: int = None, chunksize: int = 1,
+                max_tasks_per_child: int = None, plan_filter: Callable = None,
+                plan_classes: Sequence[str] = None, plan_cache: PlanCache = None,
+                control_points: bool = False, io_threads: int = 0, prefetch: int = 16,
+                file_stamp: bool = False) -> Iterator[Dict]:
+    """Yields the result record of every plan file, in the order of paths
+
+    :param paths: plan file names, e.g. from retrieve_dcm_filenames
+    :param metrics: MetricSuite, or its list of (name, metric, params) entries
+    :param workers: number of worker processes, None for os.cpu_count(), 0 or 1 to run in this process
+    :param chunksize: number of files (or file contents with io_threads) sent to a worker at once
+    :param max_tasks_per_child: files processed before a worker is replaced, bounds worker memory
+    :param plan_filter: module level function plan dict -> bool, plans returning False are skipped
+    :param plan_classes: triage classes to calculate (e.g. ["VMAT"]), other files are skipped from their header
+    :param plan_cache: DicomParse.PlanCache.PlanCache of extracted plans, shared by the workers
+    :param control_points: adds the per control point metric columns to the records, for ControlPointSink
+    :param io_threads: with io_threads > 0, files are read by io_threads threads, up to prefetch files ahead,
+        while the previous files are parsed and calculated (iter_pipeline)
+    :param file_stamp: adds the size, mtime and SHA-1 of the calculated file content to the records, for
+        CohortLedger
+    """
+    suite = metrics if isinstance(metrics, MetricSuite) else MetricSuite(metrics)
+
+    if io_threads > 0:
+        yield from iter_pipeline(paths, suite, workers=workers, chunksize=chunksize,
+                                 max_tasks_per_child=max_tasks_per_child,
+                                 io_threads=io_threads, prefetch=prefetch, plan_filter=plan_filter,
+                                 plan_classes=plan_classes, plan_cache=plan_cache, control_points=control_points,
+                                 file_stamp=file_stamp)
+        return
+
+    if workers is not None and workers <= 1:
+        for path in paths:
+            yield ProcessPlan(path, suite, plan_filter, plan_classes, plan_cache, control_points,
+                              file_stamp=file_stamp)
+        return
+
+    with multiprocessing.Pool(processes=workers, initializer=InitWorker, initargs=(suite, plan_filter, plan_classes, plan_cache, control_points, file_stamp),
+                              maxtasksperchild=max_tasks_per_child) as pool:
+        # imap keeps the input order whatever the completion order of the workers
+        for record in pool.imap(ProcessPlanInWorker, paths, chunksize=chunksize):
+            yield record
+
+
+def run_cohort(paths: Sequence[str], metrics, workers: int = None, chunksize: int = 1,
+               max_tasks_per_child: int = None, plan_filter: Callable = None,
+               plan_classes: Sequence[str] = None, plan_cache: PlanCache = None,
+               control_points: bool = False, io_threads: int = 0, prefetch: int = 16,
+               file_stamp: bool = False) -> List[Dict]:
+    """Calculates the metrics of a cohort of plan files with a process pool, see iter_cohort"""
+    return list(iter_cohort(paths, metrics, workers=workers, chunksize=chunksize,
+                            max_tasks_per_child=max_tasks_per_child, plan_filter=plan_filter,
+                            plan_classes=plan_classes, plan_cache=plan_cache, control_points=control_points,
+                            io_threads=io_threads, prefetch=prefetch, file_stamp=file_stamp))
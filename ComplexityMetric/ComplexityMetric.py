@@ -3,16 +3,52 @@ import math
 
 import numpy as np
 
-from ApertureMetric.ApertureCreator import AperturesFromBeamCreator
-from ApertureMetric.MetersetCreator import MetersetsFromMetersetWeightsCreator
 from ApertureMetric.Aperture import PyAperture
+from ApertureMetric.BeamContext import BeamContext, BeamContextCache
+from ApertureMetric.Instrumentation import BeamControlPoints, PlanControlPoints, PlanLabel, Timed
+from ComplexityMetric.BeamResultCache import MemoizedBeam
 
 
-class ComplexityMetric:
+def MetricName(args) -> str:
+    return type(args[0]).__name__
+
+
+def PlanArgument(args) -> Dict[str, str]:
+    return args[1] if len(args) > 1 and args[1] is not None else {}
+
 
+# instrumentation hooks of the metric entry points, see ApertureMetric.Instrumentation
+TimedPlan = Timed("metric.plan", MetricName, plan=lambda args: PlanLabel(PlanArgument(args)),
+                  counts=lambda args, result: {"control_points": PlanControlPoints(PlanArgument(args))})
+TimedBeam = Timed("metric.beam", MetricName,
+                  counts=lambda args, result: {"control_points": BeamControlPoints(args[1]) if len(args) > 1 else 0})
+# per control point values, called directly by MetricSuite for each of its metrics
+TimedControlPoints = Timed("metric.cp", MetricName,
+                           counts=lambda args, result: {"control_points": BeamControlPoints(args[1])})
+
+
+class ComplexityMetric:
+    # True when the plan metric is the MU weighted sum of per control point values (GetMetricsBeam),
+    # False for metrics that aggregate the beams in their own CalculateForPlan
+    PerControlPoint = True
+    # beam results are memoized by content hash while a BeamResultCache is active (ComplexityMetric.BeamResultCache)
+    CacheBeamResults = True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # overridden entry points are timed and memoized as the base ones
+        if "CalculateForPlan" in vars(cls):
+            cls.CalculateForPlan = TimedPlan(vars(cls)["CalculateForPlan"])
+        if "CalculateForBeam" in vars(cls):
+            cls.CalculateForBeam = TimedBeam(MemoizedBeam("CalculateForBeam")(vars(cls)["CalculateForBeam"]))
+        if "GetMetricsBeam" in vars(cls):
+            cls.GetMetricsBeam = TimedControlPoints(MemoizedBeam("GetMetricsBeam")(vars(cls)["GetMetricsBeam"]))
+
+    @TimedPlan
     def CalculateForPlan(self, plan: Dict[str, str]=None) -> float:
         """Returns the complexity metric of a plan, calculated as the weighted sum of the individual metrics
         for each beam"""
+        BeamContextCache.ForPlan(plan)
         weights = self.GetWeightsPlan(plan)
         metrics = self.GetMetricsPlan(plan)
 
@@ -38,6 +74,8 @@ class ComplexityMetric:
                     values.append(v)
         return values
 
+    @TimedBeam
+    @MemoizedBeam("CalculateForBeam")
     def CalculateForBeam(self, beam: Dict[str, str]) -> float:
         """Returns the complexity metric of a beam, calculated as the weighted sum of the individual metrics
         for each control point"""
@@ -48,21 +86,23 @@ class ComplexityMetric:
 
     def GetWeightsBeam(self, beam: Dict[str, str]) -> np.ndarray:
         """Returns the weights of a beam's control points, the weights are the meterset values per control point"""
-        return MetersetsFromMetersetWeightsCreator().Create(beam)
+        return self.GetBeamContext(beam).Metersets
 
+    @TimedControlPoints
+    @MemoizedBeam("GetMetricsBeam")
     def GetMetricsBeam(self, beam: Dict[str, str]) -> List[float]:
         """Returns the unweighted metrics of a beam's control points"""
-        apertures = AperturesFromBeamCreator().Create(beam)
+        apertures = self.GetBeamContext(beam).Apertures
         return self.CalculatePerAperture(apertures)
 
     def GetGantryAngleBeam(self, beam: Dict[str, str]) -> List[float]:
         """Return the angle of the beam every cp gantry"""
-        angles = []
+        return self.GetBeamContext(beam).GantryAngles
 
-        for cp in beam["ControlPointSequence"]:
-            gantry_angle = float(cp.GantryAngle) if "GantryAngle" in cp else beam["GantryAngle"]
-            angles.append(gantry_angle)
-        return angles
+    @staticmethod
+    def GetBeamContext(beam: Dict[str, str]) -> BeamContext:
+        """Returns the beam apertures, metersets and MLC attributes shared by all metrics of the plan"""
+        return BeamContextCache.ForBeam(beam)
 
     def CalculatePerAperture(self, apertures: List[PyAperture]):
         """Override method"""
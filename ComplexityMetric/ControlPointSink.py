@@ -0,0 +1,222 @@
+import csv
+from typing import Dict, Iterator, List, Sequence
+
+import numpy as np
+
+from ComplexityMetric.MetricSuite import MetricSuite
+
+# Leading columns of every control point row, followed by the per control point metric columns of the suite
+CONTROL_POINT_COLUMNS = ["PlanUID", "Path", "Beam", "ControlPoint", "GantryAngle", "BeamMU", "MUWeight"]
+FORMATS = ["parquet", "arrow"]
+
+
+def ImportPyArrow():
+    """pyarrow is only needed by the columnar output, imported on use"""
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("control point output needs pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def ControlPointColumns(plan: Dict[str, str], suite: MetricSuite, path: str = "") -> Dict[str, np.ndarray]:
+    """Per control point metrics of a plan as column arrays, one row per control point of each treatment beam
+
+    The metric columns are the per control point metrics (PerControlPoint) of the suite, unweighted;
+    MUWeight is the meterset of the control point and BeamMU the meterset of the beam. Rows are the control
+    points with an aperture (BeamApertures.control_points), ControlPoint being their index in the beam; without
+    per control point metric the columns are empty.
+    """
+    names = suite.ControlPointColumnNames
+    chunks = []
+    for number, beam in plan["beams"].items():
+        if not names or beam["TreatmentDeliveryType"] != "TREATMENT" or not beam["MU"] > 0.:
+            continue
+        values = suite.GetMetricsBeam(beam)
+        control_points = suite.GetBeamContext(beam).Apertures.control_points
+        n_rows = len(control_points)
+        chunk = {
+            "Beam": np.full(n_rows, int(number), dtype=np.int32),
+            "ControlPoint": control_points.astype(np.int32),
+            "GantryAngle": np.asarray(suite.GetGantryAngleBeam(beam), dtype=float)[control_points],
+            "BeamMU": np.full(n_rows, float(beam["MU"])),
+            "MUWeight": np.asarray(suite.GetWeightsBeam(beam), dtype=float)[control_points],
+        }
+        for column, row in zip(names, values.reshape(len(names), -1)):
+            chunk[column] = np.asarray(row[:n_rows], dtype=float)
+        chunks.append(chunk)
+
+    n_rows = sum(len(chunk["Beam"]) for chunk in chunks)
+    columns = {
+        "PlanUID": np.full(n_rows, str(plan.get("sop_instance_uid", "")), dtype=object),
+        "Path": np.full(n_rows, str(path), dtype=object),
+    }
+    for column in CONTROL_POINT_COLUMNS[2:] + names:
+        dtype = np.int32 if column in ["Beam", "ControlPoint"] else float
+        columns[column] = np.concatenate([chunk[column] for chunk in chunks]) if chunks else np.empty(0, dtype=dtype)
+    return columns
+
+
+class ControlPointSink:
+    """Streams per control point rows to a Parquet (or Arrow IPC) file in row groups of row_group_size rows.
+
+    Rows are buffered until a row group is full, so memory is bounded by one row group plus one plan
+    whatever the cohort size. The rows of a plan are written together, in the order of the calls to Write.
+
+    Example:
+        with ControlPointSink("eclipse_cp.parquet", suite.ControlPointColumnNames) as sink:
+            for record in iter_cohort(filepaths, suite, control_points=True):
+                if record["status"] == "ok":
+                    sink.Write(record["control_points"])
+        WritePlanCsv("eclipse_cp.parquet", "eclipse_cp_plans.csv")
+    """
+
+    def __init__(self, filename: str, metric_columns: Sequence[str], format: str = "parquet",
+                 row_group_size: int = 100000, compression: str = "zstd") -> None:
+        if format not in FORMATS:
+            raise ValueError("unknown format: %s" % format)
+        pa = ImportPyArrow()
+        self.filename = filename
+        self.format = format
+        self.row_group_size = row_group_size
+        self.columns = CONTROL_POINT_COLUMNS + [c for c in metric_columns if c not in CONTROL_POINT_COLUMNS]
+        types = {"PlanUID": pa.string(), "Path": pa.string(), "Beam": pa.int32(), "ControlPoint": pa.int32()}
+        self.schema = pa.schema([(column, types.get(column, pa.float64())) for column in self.columns])
+
+        if format == "parquet":
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(filename, self.schema, compression=compression)
+        else:
+            import pyarrow.ipc
+            self.writer = pyarrow.ipc.new_file(filename, self.schema)
+        self.buffer = []
+        self.buffered = 0
+        self.rows = 0
+
+    def Write(self, columns: Dict[str, np.ndarray]) -> None:
+        """Adds the rows of one plan (ControlPointColumns), metric columns of the sink it does not have are NaN"""
+        n_rows = len(columns["Beam"])
+        if n_rows == 0:
+            return
+        chunk = {column: columns[column] if column in columns else np.full(n_rows, np.nan) for column in self.columns}
+        self.buffer.append(chunk)
+        self.buffered += n_rows
+        while self.buffered >= self.row_group_size:
+            self.WriteRowGroup(self.row_group_size)
+
+    def WriteRowGroup(self, n_rows: int) -> None:
+        """Writes the first n_rows buffered rows as one row group, keeps the rest buffered"""
+        pa = ImportPyArrow()
+        merged = {column: np.concatenate([chunk[column] for chunk in self.buffer]) for column in self.columns}
+        table = pa.Table.from_arrays([pa.array(merged[column][:n_rows], type=field.type)
+                                      for column, field in zip(self.columns, self.schema)], schema=self.schema)
+        if self.format == "parquet":
+            self.writer.write_table(table, row_group_size=n_rows)
+        else:
+            self.writer.write_table(table, max_chunksize=n_rows)
+
+        rest = {column: values[n_rows:] for column, values in merged.items()}
+        self.buffered -= n_rows
+        self.buffer = [rest] if self.buffered else []
+        self.rows += n_rows
+
+    def Flush(self) -> None:
+        if self.buffered:
+            self.WriteRowGroup(self.buffered)
+
+    def Close(self) -> None:
+        if self.writer is not None:
+            self.Flush()
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self) -> "ControlPointSink":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.Close()
+
+
+def IterControlPointBatches(filename: str, batch_size: int = 100000) -> Iterator[Dict[str, np.ndarray]]:
+    """Yields the column arrays of a Parquet or Arrow IPC file written by ControlPointSink, batch by batch"""
+    pa = ImportPyArrow()
+    with open(filename, "rb") as f:
+        is_parquet = f.read(4) == b"PAR1"
+
+    if is_parquet:
+        import pyarrow.parquet as pq
+        batches = pq.ParquetFile(filename).iter_batches(batch_size=batch_size)
+    else:
+        import pyarrow.ipc
+        reader = pyarrow.ipc.open_file(pa.memory_map(filename, "r"))
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+
+    for batch in batches:
+        yield {name: batch.column(i).to_numpy(zero_copy_only=False) for i, name in enumerate(batch.schema.names)}
+
+
+def PlanRows(columns: Dict[str, np.ndarray], metric_columns: List[str]) -> List[Dict]:
+    """Plan rows of complete plans (consecutive rows with the same Path): every row is weighted by its MUWeight
+    over the rows of its beam, NaN values being skipped, and the beams by their MU.
+
+    This is CalculateForPlan when every control point has an aperture. Otherwise CalculateForPlan weights the
+    i-th aperture with the meterset of the i-th control point over all the control points of the beam, while
+    the rows keep the meterset of their own control point.
+    """
+    path = columns["Path"]
+    beam = columns["Beam"]
+    starts = np.flatnonzero(np.r_[True, (path[1:] != path[:-1]) | (beam[1:] != beam[:-1])])
+    plan_of_beam = np.cumsum(np.r_[True, path[starts[1:]] != path[starts[:-1]]]) - 1
+
+    weights = columns["MUWeight"]
+    beam_weights = np.add.reduceat(weights, starts)
+    beam_mu = columns["BeamMU"][starts]
+    plan_mu = np.bincount(plan_of_beam, weights=beam_mu)
+    plan_starts = starts[np.r_[True, plan_of_beam[1:] != plan_of_beam[:-1]]]
+
+    rows = [{"PlanUID": columns["PlanUID"][i], "Path": path[i]} for i in plan_starts]
+    for column in metric_columns:
+        beam_values = np.add.reduceat(np.nan_to_num(weights * columns[column], nan=0.0), starts) / beam_weights
+        plan_values = np.bincount(plan_of_beam, weights=beam_mu * np.nan_to_num(beam_values, nan=0.0)) / plan_mu
+        for row, v in zip(rows, plan_values):
+            row[column] = round(float(v), 2)
+    return rows
+
+
+def IterPlanRows(filename: str, batch_size: int = 100000) -> Iterator[Dict]:
+    """Yields the plan level row of every plan of a control point file, the derived plan view of the file.
+
+    Batches are read one at a time; the rows of the last plan of a batch are carried over to the next
+    batch, so memory stays bounded by a batch plus one plan."""
+    carry = None
+    metric_columns = None
+    for columns in IterControlPointBatches(filename, batch_size=batch_size):
+        if metric_columns is None:
+            metric_columns = [column for column in columns if column not in CONTROL_POINT_COLUMNS]
+        if carry is not None:
+            columns = {column: np.concatenate([carry[column], values]) for column, values in columns.items()}
+        if len(columns["Path"]) == 0:
+            continue
+
+        path = columns["Path"]
+        last = np.flatnonzero(path != path[-1])
+        split = last[-1] + 1 if len(last) else 0
+        carry = {column: values[split:] for column, values in columns.items()}
+        if split:
+            yield from PlanRows({column: values[:split] for column, values in columns.items()}, metric_columns)
+
+    if carry is not None and len(carry["Path"]):
+        yield from PlanRows(carry, metric_columns)
+
+
+def WritePlanCsv(filename: str, csv_filename: str, batch_size: int = 100000) -> int:
+    """Writes the plan level CSV derived from a control point file, returns the number of plans"""
+    n_plans = 0
+    with open(csv_filename, "w") as f:
+        writer = csv.writer(f, delimiter=',', lineterminator='\n')
+        for row in IterPlanRows(filename, batch_size=batch_size):
+            if n_plans == 0:
+                writer.writerow(list(row))
+            writer.writerow(list(row.values()))
+            n_plans += 1
+    return n_plans
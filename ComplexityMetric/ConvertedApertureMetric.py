@@ -4,6 +4,7 @@ import numpy as np
 
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
+from ApertureMetric.BeamApertures import BeamApertures
 
 
 class ConvertedApertureMetric(ComplexityMetric):
@@ -14,11 +15,19 @@ class ConvertedApertureMetric(ComplexityMetric):
         and EPID measurements of static MLC openings. Medical physics, 2015, 42.7: 3911-3921.
         DOI: https://doi.org/10.1118/1.4921733
     """
-    def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
+    def CalculatePerAperture(self, apertures: List[PyAperture]) -> np.ndarray:
         """计算CAM"""
-        return [self.CalculateConvertedApertureMetric(aperture) for aperture in apertures]
+        beam_apertures = BeamApertures.FromApertures(apertures)
+        inside = ~beam_apertures.IsOutsideJaw()
+        lp_distance_cam = np.where(inside, 1 - np.exp(-(beam_apertures.FieldSize() / 10)), 0.0)   # convert mm to cm
+        area_cam = 1 - np.exp(-(np.sqrt(beam_apertures.Area()) / 10))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # mean over the leaf pairs inside the jaws, NaN when there is none, as np.mean([])
+            mean_distance_cam = np.sum(lp_distance_cam, axis=1) / np.sum(inside, axis=1)
+        return 1 - mean_distance_cam * area_cam
 
     def CalculateConvertedApertureMetric(self, aperture: PyAperture) -> float:
+        """Scalar reference of CalculatePerAperture"""
         lp_distance_cam = []    # 存储非线性转换后叶片间距，目前只考虑MLC运动方向
 
         for lp in aperture.LeafPairs:
@@ -1,7 +1,10 @@
 from typing import List
 
+import numpy as np
+
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
+from ApertureMetric.BeamApertures import BeamApertures
 
 
 class EdgeAreaMetric(ComplexityMetric):
@@ -13,11 +16,16 @@ class EdgeAreaMetric(ComplexityMetric):
         DOI: https://doi.org/10.1118/1.4921733
     """
 
-    def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
+    def CalculatePerAperture(self, apertures: List[PyAperture]) -> np.ndarray:
         """计算CAM"""
-        return [self.CalculateEdgeAreaMetric(aperture) for aperture in apertures]
+        beam_apertures = BeamApertures.FromApertures(apertures)
+        r1 = beam_apertures.SidePerimeterVertical() * 10
+        r2 = beam_apertures.Area() - r1 / 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return r1 / (r1 + r2)
 
     def CalculateEdgeAreaMetric(self, aperture: PyAperture) -> float:
+        """Scalar reference of CalculatePerAperture"""
         perimeter = aperture.SidePerimeterVertical()
         r1 = perimeter * 10
         r2 = aperture.Area() - r1 / 2
@@ -1,8 +1,11 @@
 from typing import List
 
+import numpy as np
+
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
-from DicomParse.utilities import DivisionOrDefault
+from ApertureMetric.BeamApertures import BeamApertures
+from DicomParse.utilities import DivisionOrDefault, DivisionOrDefaultArray
 
 
 class EdgeMetric(ComplexityMetric):
@@ -18,12 +21,17 @@ class EdgeMetric(ComplexityMetric):
         DOI: https://doi.org/10.1118/1.4921733
     """
 
-    def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
-        return [self.CalculateApertureEdgeMetric(aperture) for aperture in apertures]
+    C1 = 0     # Scaling factor, C1
+    C2 = 1     # Scaling factor, C2
+
+    def CalculatePerAperture(self, apertures: List[PyAperture]) -> np.ndarray:
+        beam_apertures = BeamApertures.FromApertures(apertures)
+        side_perimeter = (self.C1 * beam_apertures.SidePerimeterVertical()
+                          + self.C2 * beam_apertures.SidePerimeterHorizontal())
+        return DivisionOrDefaultArray(side_perimeter, beam_apertures.Area())
 
     def CalculateApertureEdgeMetric(self, aperture: PyAperture) -> float:
-        """计算控制点Aperture Edge Metric"""
-        C1 = 0     # Scaling factor, C1
-        C2 = 1     # Scaling factor, C2
+        """计算控制点Aperture Edge Metric, scalar reference of CalculatePerAperture"""
+        C1, C2 = self.C1, self.C2
         side_perimeter = C1 * aperture.SidePerimeterVertical() + C2 * aperture.SidePerimeterHorizontal()
         return DivisionOrDefault(side_perimeter, aperture.Area())
@@ -0,0 +1,30 @@
+import cProfile
+import io
+import pstats
+
+from ComplexityMetric.MetricSuite import MetricSuite
+from DicomParse.dicomrt import RTPlan
+# timing hooks, in ApertureMetric so that the aperture and DICOM layers can be timed without importing the metrics
+from ApertureMetric.Instrumentation import (BeamControlPoints, DisableTiming, EnableTiming, PlanControlPoints,
+                                            PlanLabel, Timed, Timing, TimingRecorder)
+
+
+def ProfilePlan(plan, metrics, filename: str = None, sort: str = "cumulative", limit: int = 30) -> str:
+    """Runs the metrics of one plan (plan dict or file name) under cProfile, returns the pstats text report
+
+    :param metrics: MetricSuite or its list of (name, metric, params) entries
+    :param filename: writes the raw profile, for snakeviz or a flame graph (e.g. flameprof filename)
+    """
+    suite = metrics if isinstance(metrics, MetricSuite) else MetricSuite(metrics)
+    profile = cProfile.Profile()
+    profile.enable()
+    if isinstance(plan, str):
+        plan = RTPlan(filename=plan).get_plan()
+    suite.CalculateForPlan(plan)
+    profile.disable()
+
+    if filename:
+        profile.dump_stats(filename)
+    out = io.StringIO()
+    pstats.Stats(profile, stream=out).sort_stats(sort).print_stats(limit)
+    return out.getvalue()
@@ -4,6 +4,7 @@ import numpy as np
 
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
+from ApertureMetric.BeamApertures import BeamApertures
 
 
 class LeafArea(ComplexityMetric):
@@ -14,10 +15,14 @@ class LeafArea(ComplexityMetric):
         Med Phys 2011; 38: 5385–93. DOI: https://doi.org/10.1118/1.3633912
     """
 
-    def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
-        return [self.CalculateApertureLeafGapArea(aperture) for aperture in apertures]
+    def CalculatePerAperture(self, apertures: List[PyAperture]) -> np.ndarray:
+        """Mean area of the leaf pairs with a non zero area, NaN when all leaf pairs are closed"""
+        areas = BeamApertures.FromApertures(apertures).FieldArea()
+        nonzero = areas != 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.sum(np.where(nonzero, areas, 0.0), axis=1) / np.sum(nonzero, axis=1)
 
     def CalculateApertureLeafGapArea(self, aperture: PyAperture) -> float:
-        """Calculates the mean aperture area of all leaf pairs"""
+        """Calculates the mean aperture area of all leaf pairs, scalar reference of CalculatePerAperture"""
         areas = np.array(aperture.LeafPairArea)
         return areas[np.nonzero(areas)].mean()
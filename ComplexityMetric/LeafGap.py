@@ -4,7 +4,7 @@ import numpy as np
 
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
-from ApertureMetric.ApertureCreator import AperturesFromBeamCreator
+from ApertureMetric.FieldSizeDistribution import FieldSizeDistribution
 
 
 class LeafGap(ComplexityMetric):
@@ -14,6 +14,7 @@ class LeafGap(ComplexityMetric):
         Nauta M, Villarreal-Barajas JE, Tambasco M. Fractal analysis for assessing the level of
         modulation of IMRT fields. Med Phys 2011; 38: 5385–93. DOI: https://doi.org/10.1118/1.3633912
     """
+    PerControlPoint = False
 
     def CalculateForPlan(self, plan: Dict[str, str] = None):
         leaf_gaps = []
@@ -23,11 +24,14 @@ class LeafGap(ComplexityMetric):
         return round(np.mean(leaf_gaps), 2), round(np.std(leaf_gaps), 2)
 
     def CalculateForBeam(self, beam: Dict[str, str]) -> List[float]:
-        apertures = AperturesFromBeamCreator().Create(beam)
-        return self.CalculatePerAperture(apertures)
+        return list(self.GetBeamContext(beam).FieldSizes.LeafGaps())
 
     def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
         """计算Leaf Gap"""
+        return list(FieldSizeDistribution(apertures).LeafGaps())
+
+    def CalculatePerApertureReference(self, apertures: List[PyAperture]) -> List[float]:
+        """Scalar reference of CalculatePerAperture"""
         leaf_gaps = []
         for aperture in apertures:
             for lp in aperture.LeafPairs:
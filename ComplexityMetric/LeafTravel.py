@@ -4,7 +4,7 @@ import numpy as np
 
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
-from ApertureMetric.ApertureCreator import AperturesFromBeamCreator
+from ApertureMetric.BeamApertures import BeamApertures
 
 
 class LeafTravel(ComplexityMetric):
@@ -14,6 +14,7 @@ class LeafTravel(ComplexityMetric):
         MASI, Laura, et al. Impact of plan parameters on the dosimetric accuracy of volumetric modulated arc therapy.
         Medical physics, 2013, 40.7: 071718. DOI: https://doi.org/10.1118/1.4810969
     """
+    PerControlPoint = False
 
     def CalculateForPlan(self, plan: Dict[str, str] = None):
         leaf_travel = []
@@ -22,12 +23,31 @@ class LeafTravel(ComplexityMetric):
 
         return round(np.mean(np.array(leaf_travel)), 2)
 
-    def CalculateForBeam(self, beam: Dict[str, str]) -> List[float]:
-        apertures = AperturesFromBeamCreator().Create(beam)
+    def CalculateForBeam(self, beam: Dict[str, str]) -> np.ndarray:
+        apertures = self.GetBeamContext(beam).Apertures
         return self.CalculatePerAperture(apertures)
 
-    def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
-        """计算Leaf Gap"""
+    def CalculatePerAperture(self, apertures: List[PyAperture]) -> np.ndarray:
+        """Travel of every leaf over the control points where its pair is inside the jaws, left bank leaves
+        then right bank leaves, each in the order of their first control point inside the jaws"""
+        beam_apertures = BeamApertures.FromApertures(apertures)
+        inside = ~beam_apertures.IsOutsideJaw()
+        if not np.any(inside):
+            return np.empty(0)
+        pairs, cps = np.nonzero(inside.T)       # pair major, control points in order within a pair
+        same_pair = pairs[1:] == pairs[:-1]
+        opened = np.flatnonzero(np.any(inside, axis=0))
+        order = opened[np.argsort(np.argmax(inside, axis=0)[opened], kind="stable")]
+
+        travel = []
+        for positions in [beam_apertures.Left, beam_apertures.Right]:
+            steps = np.abs(np.diff(positions[cps, pairs]))
+            distance = np.bincount(pairs[1:][same_pair], weights=steps[same_pair], minlength=beam_apertures.Npairs)
+            travel.append(distance[order])
+        return np.concatenate(travel)
+
+    def CalculatePerApertureReference(self, apertures: List[PyAperture]) -> List[float]:
+        """Scalar reference of CalculatePerAperture"""
         leaf_travel_track_left = {}
         leaf_travel_track_right = {}
         for aperture in apertures:
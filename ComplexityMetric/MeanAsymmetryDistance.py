@@ -4,6 +4,7 @@ import numpy as np
 
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
+from ApertureMetric.BeamApertures import BeamApertures
 
 
 class MeanAsymmetryDistance(ComplexityMetric):
@@ -14,12 +15,20 @@ class MeanAsymmetryDistance(ComplexityMetric):
         quality assurance results. Phys Med Biol 2015; 60(6):2587-2601.
         DOI: http://doi.org/10.1088/0031-9155/60/6/2587.
     """
-    def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
+    def CalculatePerAperture(self, apertures: List[PyAperture]) -> np.ndarray:
         """计算控制点Aperture叶片对中点与中心轴之间平均距离"""
-        return [self.CalculateMeanAsymmetryDistance(aperture) for aperture in apertures]
+        beam_apertures = BeamApertures.FromApertures(apertures)
+        inside = ~beam_apertures.IsOutsideJaw()
+        mid_x = (beam_apertures.Left + beam_apertures.Right) / 2
+        mid_y = (beam_apertures.leaf_tops + beam_apertures.leaf_bottoms) / 2
+        distance = np.sqrt(mid_x * mid_x + (mid_y * mid_y)[None, :])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # mean over the leaf pairs inside the jaws, NaN when there is none, as np.mean([])
+            return np.sum(np.where(inside, distance, 0.0), axis=1) / np.sum(inside, axis=1)
 
     def CalculateMeanAsymmetryDistance(self, aperture: PyAperture) -> float:
-        """ Mean distance from center of each open leaf to the center of MLC using apertures"""
+        """ Mean distance from center of each open leaf to the center of MLC using apertures,
+        scalar reference of CalculatePerAperture"""
         mid_x = []
         mid_y = []
         for lp in aperture.LeafPairs:
@@ -1,7 +1,10 @@
 from typing import List
 
+import numpy as np
+
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
+from ApertureMetric.BeamApertures import BeamApertures
 
 
 class MeanFieldArea(ComplexityMetric):
@@ -16,6 +19,6 @@ class MeanFieldArea(ComplexityMetric):
         Med Phys 2014;41:21716. DOI: http://dx.doi.org/10.1118/1.4861821.
     """
 
-    def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
+    def CalculatePerAperture(self, apertures: List[PyAperture]) -> np.ndarray:
         """cp Aperture area"""
-        return [aperture.Area() for aperture in apertures]
+        return BeamApertures.FromApertures(apertures).Area()
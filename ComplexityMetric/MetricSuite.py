@@ -0,0 +1,128 @@
+import hashlib
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from ComplexityMetric.BeamResultCache import MetricIdentity
+from ComplexityMetric.ComplexityMetric import ComplexityMetric
+from ApertureMetric.BeamContext import BeamContextCache
+
+
+class MetricSuite(ComplexityMetric):
+    """Computes a list of complexity metrics of a plan in a single pass over its beams
+
+    Each entry is (name, metric) or (name, metric, params), params being the keyword arguments of the
+    metric (e.g. {"x": 5} for SmallApertureScore). Metrics whose plan value is the MU weighted sum of
+    per control point values (PerControlPoint) are stacked per beam into one (metrics x Ncp) matrix and
+    weighted with a single matrix-vector product; the other metrics are calculated with their own
+    CalculateForPlan, and name may then be a tuple naming each of their (flattened) outputs.
+
+    Example:
+        suite = MetricSuite([("EDGE_Metric", EdgeMetric()),
+                             ("Small_Aperture_Score_5mm", SmallApertureScore(), {"x": 5}),
+                             (("Leaf_Gap_Average", "Leaf_Gap_Std"), LeafGap())])
+        row = suite.CalculateForPlan(plan)    # OrderedDict column name -> value
+    """
+
+    PerControlPoint = False
+    # the results of its metrics are memoized one by one
+    CacheBeamResults = False
+
+    def __init__(self, metrics: Sequence[Tuple], version: str = "") -> None:
+        self.version = version
+        self.metrics = []
+        for entry in metrics:
+            name, metric = entry[0], entry[1]
+            params = entry[2] if len(entry) > 2 else {}
+            self.metrics.append((name, metric, params))
+
+    @property
+    def ColumnNames(self) -> List[str]:
+        names = []
+        for name, metric, params in self.metrics:
+            names.extend(self.Names(name))
+        return names
+
+    @property
+    def ControlPointColumnNames(self) -> List[str]:
+        """Column names of the per control point metrics, the rows of GetMetricsBeam"""
+        return [column for name, metric, params in self.metrics if metric.PerControlPoint for column in self.Names(name)]
+
+    @staticmethod
+    def Names(name) -> List[str]:
+        return list(name) if isinstance(name, (tuple, list)) else [name]
+
+    @property
+    def Version(self) -> str:
+        """Identifies the metric set: explicit version string plus a SHA-1 of the column names, metric classes,
+        parameters and simple metric attributes (e.g. SPORT K). Stored results are reused only for the same Version."""
+        h = hashlib.sha1()
+        for name, metric, params in self.metrics:
+            class_name, attributes = MetricIdentity(metric)
+            h.update(repr((name, class_name, sorted(params.items()), attributes)).encode())
+        digest = h.hexdigest()
+        return "%s-%s" % (self.version, digest) if self.version else digest
+
+    def CalculateForPlan(self, plan: Dict[str, str] = None) -> Dict[str, float]:
+        """Returns the named row of all metrics of a plan"""
+        BeamContextCache.ForPlan(plan)
+        cp_metrics = [(name, metric, params) for name, metric, params in self.metrics if metric.PerControlPoint]
+
+        # per control point metrics may have several columns, e.g. SmallApertureScore with a list of x
+        cp_names = [column for name, metric, params in cp_metrics for column in self.Names(name)]
+        values = {}
+        if cp_metrics:
+            weights = np.asarray(self.GetWeightsPlan(plan), dtype=float)
+            beam_values = np.array(self.GetMetricsPlan(plan), dtype=float).reshape(-1, len(cp_names))
+            plan_values = self.WeightedMatrixSum(weights, beam_values)
+            for column, v in zip(cp_names, plan_values):
+                values[column] = round(float(v), 2)
+
+        row = OrderedDict()
+        for name, metric, params in self.metrics:
+            if metric.PerControlPoint:
+                row.update((column, values[column]) for column in self.Names(name))
+                continue
+
+            result = metric.CalculateForPlan(plan, **params)
+            if isinstance(name, (tuple, list)):
+                flat = self.Flatten(result)
+                if len(flat) != len(name):
+                    raise ValueError("%s returns %d values, %d names given" % (type(metric).__name__, len(flat), len(name)))
+                row.update(zip(name, flat))
+            else:
+                row[name] = result
+
+        return row
+
+    def CalculateForBeam(self, beam: Dict[str, str]) -> np.ndarray:
+        """Returns the MU weighted values of the per control point metrics of a beam"""
+        weights = np.asarray(self.GetWeightsBeam(beam), dtype=float)
+        return self.WeightedMatrixSum(weights, self.GetMetricsBeam(beam).T)
+
+    def GetMetricsBeam(self, beam: Dict[str, str]) -> np.ndarray:
+        """Returns the (columns x Ncp) matrix of the unweighted per control point metrics of a beam, a metric
+        returning (Ncp, n) values gives n rows"""
+        rows = []
+        for name, metric, params in self.metrics:
+            if metric.PerControlPoint:
+                values = np.asarray(metric.GetMetricsBeam(beam, **params), dtype=float)
+                rows.append(values.reshape(len(values), -1).T)
+        return np.vstack(rows) if rows else np.empty((0, 0))
+
+    @staticmethod
+    def WeightedMatrixSum(weights: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """Weighted sum of each column of values (n x metrics), NaN values are skipped as in WeightedValues"""
+        n = values.shape[0]
+        normalized = weights[:n] / np.sum(weights)
+        return normalized @ np.nan_to_num(values, nan=0.0, posinf=np.inf, neginf=-np.inf)
+
+    @staticmethod
+    def Flatten(result) -> List[Union[float, str]]:
+        if isinstance(result, (tuple, list, np.ndarray)):
+            flat = []
+            for item in result:
+                flat.extend(MetricSuite.Flatten(item))
+            return flat
+        return [result]
@@ -4,7 +4,8 @@ import numpy as np
 
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
-from DicomParse.utilities import DivisionOrDefault
+from ApertureMetric.BeamApertures import BeamApertures
+from DicomParse.utilities import DivisionOrDefault, DivisionOrDefaultArray
 
 
 class ModulationComplexityScore(ComplexityMetric):
@@ -15,7 +16,40 @@ class ModulationComplexityScore(ComplexityMetric):
         Med Phys 2010;37:505–15. DOI: http://dx.doi.org/10.1118/1.3276775.
     """
 
-    def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
+    def CalculatePerAperture(self, apertures: List[PyAperture]) -> np.ndarray:
+        beam_apertures = BeamApertures.FromApertures(apertures)
+        inside = ~beam_apertures.IsOutsideJaw()
+        left, right = beam_apertures.Left, beam_apertures.Right
+        n_open = np.sum(inside, axis=1)
+        rows = np.arange(beam_apertures.Ncp)
+
+        # LSV of each bank: pos_max is the spread of the open leaf positions, sum(pos_max + diff(pos))
+        # of the scalar version is (N - 1) * pos_max + (last - first open position)
+        first = np.argmax(inside, axis=1)
+        last = inside.shape[1] - 1 - np.argmax(inside[:, ::-1], axis=1)
+        lsv = np.ones(beam_apertures.Ncp)
+        with np.errstate(invalid="ignore"):     # closed control points, set to 0 below
+            for positions in [left, right]:
+                pos_max = (np.max(np.where(inside, positions, -np.inf), axis=1)
+                           - np.min(np.where(inside, positions, np.inf), axis=1))
+                a = (n_open - 1) * pos_max + (positions[rows, last] - positions[rows, first])
+                lsv *= DivisionOrDefaultArray(a, n_open * pos_max)
+
+        aav = DivisionOrDefaultArray(np.sum(beam_apertures.FieldSize(), axis=1), self.AAVNorm(beam_apertures))
+        # 有叶片打开，有计划控制点叶片全关的情况，如E1706020, A7FDMLCa
+        return np.where(n_open > 0, lsv * aav, 0.0)
+
+    @staticmethod
+    def AAVNorm(beam_apertures: BeamApertures) -> float:
+        """Sum over the leaf pairs of the largest opening of the beam (max Right - min Left inside the jaws)"""
+        inside = ~beam_apertures.IsOutsideJaw()
+        opened = np.any(inside, axis=0)
+        min_left = np.min(np.where(inside, beam_apertures.Left, np.inf), axis=0)
+        max_right = np.max(np.where(inside, beam_apertures.Right, -np.inf), axis=0)
+        return float(np.sum(np.abs(max_right - min_left)[opened]))
+
+    def CalculatePerApertureReference(self, apertures: List[PyAperture]) -> List[float]:
+        """Scalar reference of CalculatePerAperture"""
         posi_max = {}
         for aperture in apertures:
             n_pairs = int(len(aperture.LeafPairs))
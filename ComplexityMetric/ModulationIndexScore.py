@@ -1,9 +1,8 @@
+from typing import Sequence, Union
+
 import numpy as np
-from scipy import integrate
 
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
-from ApertureMetric.ApertureCreator import AperturesFromBeamCreator
-from ApertureMetric.MetersetCreator import MetersetsFromMetersetWeightsCreator
 from ApertureMetric.MLCAttributes import MLCAttributes
 
 
@@ -17,24 +16,24 @@ class ModulationIndexScore(ComplexityMetric):
         Park JM, et al. Modulation indices for volumetric modulated Arc therapy. Phys Med Biol 2014; 59: 7315–40.
         DOI: https://doi.org/10.1088/0031-9155/59/23/7315
     """
+    PerControlPoint = False
 
-    def CalculateForPlan(self, plan=None, k=0.02):
+    def CalculateForPlan(self, plan=None, k: Union[float, Sequence[float]] = 0.02):
+        """Returns [MIs, MIa, MIt] of the plan, or one such row per value when k is a list of k values"""
         mi = []
         for i, beam in plan['beams'].items():
             mi.append(self.CalculateForBeam(beam, k))
 
-        mi_weight = []
         weights = self.GetWeightsPlan(plan)
-        for tmp in np.array(mi).T:      # 转置后每一行分别代表mis, mia和mit
-            mi_weight.append(self.WeightedSum(weights, tmp))
+        mi = np.array(mi, dtype=float)
+        mi_weight = np.zeros(mi.shape[1:])
+        for index in np.ndindex(mi_weight.shape):    # 每一列分别代表mis, mia和mit
+            mi_weight[index] = self.WeightedSum(weights, mi[(slice(None),) + index])
 
         return np.round(mi_weight, 2)
 
-    def CalculateForBeam(self, beam, k=0.02):
-        apertures = AperturesFromBeamCreator().Create(beam)
-        cumulative_metersets = MetersetsFromMetersetWeightsCreator().GetCumulativeMetersets(beam)
-        mid = ModulationIndexTotal(apertures, cumulative_metersets, beam['TreatmentMachineName'],
-                                   beam['DoseRateSet'], beam['GantryRotationAngle'])
+    def CalculateForBeam(self, beam, k: Union[float, Sequence[float]] = 0.02):
+        mid = ModulationIndexTotal.FromMLCAttributes(self.GetBeamContext(beam).MLCAttributes)
         return mid.calculate_integrate(k=k)
 
 
@@ -46,78 +45,111 @@ class ModulationIndexTotal(MLCAttributes):
         super().__init__(apertures, cumulative_mu, treatment_machine_name,
                          dose_rate_set, gantry_rotation_angle)
 
-    def calc_mi_speed(self, mlc_speed, speed_std, k=1.0):
+    @classmethod
+    def FromMLCAttributes(cls, mlc_attributes: MLCAttributes) -> "ModulationIndexTotal":
+        """Shares the (cached) kinematics data of an existing MLCAttributes instead of recomputing it"""
+        mid = cls.__new__(cls)
+        mid.__dict__.update(mlc_attributes.__dict__)
+        return mid
+
+    @staticmethod
+    def step_ratio(values, scale):
+        """Ratio r such that (values > f * scale) <=> (f < r) for f >= 0, element-wise
+
+        NaN values or scales are never counted (r = 0), a zero scale counts every positive value (r = inf).
+        """
+        values = np.asarray(values, dtype=float)
+        scale = np.broadcast_to(np.asarray(scale, dtype=float), values.shape)
+        ratio = np.zeros(values.shape)
+        positive = scale > 0
+        np.divide(values, scale, out=ratio, where=positive)
+        ratio[(scale == 0) & (values > 0)] = np.inf
+        return np.nan_to_num(ratio, nan=0.0, posinf=np.inf)
+
+    @staticmethod
+    def integrate_step(ratio, k, weights=None):
+        """Exact integral over f in [0, k] of sum(weights * (f < ratio)), i.e. sum(weights * clip(ratio, 0, k)),
+        for every value of k at once using the sorted ratios"""
+        ratio = np.clip(np.ravel(ratio), 0, None)
+        weights = np.ones(ratio.shape) if weights is None else np.ravel(weights)
+        order = np.argsort(ratio, kind='stable')
+        ratio, weights = ratio[order], weights[order]
+
+        finite = np.isfinite(ratio)
+        cum_wr = np.concatenate(([0.0], np.cumsum(np.where(finite, weights * ratio, 0.0))))
+        cum_w = np.concatenate(([0.0], np.cumsum(weights)))
+
+        k = np.asarray(k, dtype=float)
+        idx = np.searchsorted(ratio, k, side='left')    # ratio[:idx] < k contribute ratio, the rest contribute k
+        return cum_wr[idx] + k * (cum_w[-1] - cum_w[idx])
 
-        calc_z = lambda f: 1 / (self.Ncp - 1) * np.sum(np.sum(mlc_speed > f * speed_std))
-        res = integrate.quad(calc_z, 0, k, full_output=1)
-        return res[0]
+    def calc_mi_speed(self, mlc_speed, speed_std, k=1.0):
+        ratio = self.step_ratio(mlc_speed, speed_std)
+        return 1 / (self.Ncp - 1) * self.integrate_step(ratio, k)
 
     def calc_mi_acceleration(self, mlc_speed, speed_std, mlc_acc, mlc_acc_std, k=1.0, alpha=1.0):
-
-        z_acc = lambda f: (1 / (self.Ncp - 2)) * np.nansum(np.nansum(np.logical_or(mlc_speed > f * speed_std,
-                                                                                   mlc_acc > alpha * f * mlc_acc_std)))
-        res = integrate.quad(z_acc, 0, k, full_output=1)
-        return res[0]
+        ratio = np.maximum(self.step_ratio(mlc_speed, speed_std), self.step_ratio(mlc_acc, alpha * mlc_acc_std))
+        return (1 / (self.Ncp - 2)) * self.integrate_step(ratio, k)
 
     def calc_mi_total(self, mlc_speed, speed_std, mlc_acc, mlc_acc_std, k=1.0, alpha=1.0, WGA=None, WMU=None):
+        ratio = np.maximum(self.step_ratio(mlc_speed, speed_std), self.step_ratio(mlc_acc, alpha * mlc_acc_std))
+        # control points without gantry acceleration or dose rate variation (NaN) are not counted
+        row_weights = np.nan_to_num(np.asarray(WGA, dtype=float) * np.asarray(WMU, dtype=float), nan=0.0)
+        weights = np.broadcast_to(row_weights[:, None], ratio.shape)
+        return (1 / (self.Ncp - 2)) * self.integrate_step(ratio, k, weights)
 
-        z_total = lambda f: (1 / (self.Ncp - 2)) * \
-                            np.nansum(np.nansum(np.logical_or(mlc_speed > f * speed_std,
-                                                              mlc_acc > alpha * f * mlc_acc_std), axis=1) * WGA * WMU)
-
-        res = integrate.quad(z_total, 0, k, full_output=1)
-        return res[0]
-
-    def calculate_integrate(self, k=1.0, beta=2.0, alpha=2.0):
+    def calculate_integrate(self, k: Union[float, Sequence[float]] = 1.0, beta=2.0, alpha=2.0):
+        """MIs, MIa and MIt integrated from 0 to k; for a list of k values returns an (len(k), 3) array"""
 
         # fill NAN
         mlc_speed = np.nan_to_num(self.mlc_speed)
         mlc_acc = np.nan_to_num(self.mlc_acc)
 
-        mis = self.calc_mi_speed(mlc_speed, self.mlc_speed_std.values, k)
+        mis = self.calc_mi_speed(mlc_speed, self.mlc_speed_std, k)
 
-        alpha_acc = 1.0 / self.delta_mu_time['time'].mean()
-        mia = self.calc_mi_acceleration(mlc_speed, self.mlc_speed_std.values,
-                                        mlc_acc, self.mlc_acc_std.values,
+        alpha_acc = 1.0 / np.nanmean(self.time)
+        mia = self.calc_mi_acceleration(mlc_speed, self.mlc_speed_std,
+                                        mlc_acc, self.mlc_acc_std,
                                         k=k, alpha=alpha_acc)
 
-        gantry_acc = self.gantry['gantry_acc'].values
-        WGA = beta / (1 + (beta - 1) * np.exp(-gantry_acc / alpha))
+        WGA = beta / (1 + (beta - 1) * np.exp(-self.gantry_acc / alpha))
         # Wmu
-        delta_dose_rate = self.dose_rate['delta_dose_rate'].values
-        WMU = beta / (1 + (beta - 1) * np.exp(-delta_dose_rate / alpha))
+        WMU = beta / (1 + (beta - 1) * np.exp(-self.delta_dose_rate / alpha))
         mit = self.calc_mi_total(mlc_speed,
-                                 self.mlc_speed_std.values,
+                                 self.mlc_speed_std,
                                  mlc_acc,
-                                 self.mlc_acc_std.values,
+                                 self.mlc_acc_std,
                                  k=k, alpha=alpha_acc, WGA=WGA, WMU=WMU)
 
-        return mis, mia, mit
+        if np.ndim(k) == 0:
+            return float(mis), float(mia), float(mit)
+        return np.stack([mis, mia, mit], axis=1)
 
     def calculate_split(self, f=1.0, beta=2.0, alpha=2.0):
 
-        # speed MI
-        mask_speed_std = self.mlc_speed > f * self.mlc_speed_std
-        Ns = mask_speed_std.sum().sum()
+        # speed MI, NaN speeds or standard deviations are never counted
+        with np.errstate(invalid="ignore"):
+            mask_speed_std = self.mlc_speed > f * self.mlc_speed_std
+        Ns = np.sum(mask_speed_std)
         z_speed = 1 / (self.Ncp - 1) * Ns
 
         # acc MI
-        alpha_acc = 1.0 / self.delta_mu_time['time'].mean()
-        mask_acc_std = self.mlc_acc > alpha_acc * f * self.mlc_acc_std
+        alpha_acc = 1.0 / np.nanmean(self.time)
+        with np.errstate(invalid="ignore"):
+            mask_acc_std = self.mlc_acc > alpha_acc * f * self.mlc_acc_std
 
         mask_acc_mi = np.logical_or(mask_speed_std, mask_acc_std)
-        Nacc = mask_acc_mi.sum().sum()
+        Nacc = np.sum(mask_acc_mi)
         z_acc = 1 / (self.Ncp - 2) * Nacc
 
         # Total MI
-        gantry_acc = self.gantry['gantry_acc']
-        WGA = beta / (1 + (beta - 1) * np.exp(-gantry_acc / alpha))
+        WGA = beta / (1 + (beta - 1) * np.exp(-self.gantry_acc / alpha))
 
         # Wmu
-        delta_dose_rate = self.dose_rate['delta_dose_rate']
-        WMU = beta / (1 + (beta - 1) * np.exp(-delta_dose_rate / alpha))
+        WMU = beta / (1 + (beta - 1) * np.exp(-self.delta_dose_rate / alpha))
 
-        tmp = mask_acc_mi.multiply(WGA, axis='index').multiply(WMU, axis='index')
-        Mti = tmp.sum().sum() / (self.Ncp - 2)
+        # control points without gantry acceleration or dose rate variation (NaN) are skipped, as pandas sum
+        tmp = mask_acc_mi * WGA[:, None] * WMU[:, None]
+        Mti = np.nansum(tmp) / (self.Ncp - 2)
 
         return z_speed, z_acc, Mti
@@ -0,0 +1,113 @@
+from typing import Dict, Sequence, Union
+
+import numpy as np
+
+from ComplexityMetric.BeamResultCache import BeamResults, GetBeamResults
+from ComplexityMetric.MetricSuite import MetricSuite
+from DicomParse.PlanArrays import ReadPlan
+
+
+def BeamValues(beam: Dict[str, str], suite: MetricSuite) -> Dict[str, float]:
+    """Beam level values of the suite metrics: MU weighted per control point metrics, and the other metrics
+    whose CalculateForBeam returns a number (e.g. PlanModulation)"""
+    values = {}
+    for name, metric, params in suite.metrics:
+        result = metric.CalculateForBeam(beam, **params)
+        names = suite.Names(name)
+        flat = suite.Flatten(result)
+        if len(flat) == len(names) and all(isinstance(v, (int, float, np.number)) for v in flat):
+            values.update((column, float(v)) for column, v in zip(names, flat))
+    return values
+
+
+def compare_plans(a: Union[str, Dict], b: Union[str, Dict], metrics: Sequence = None) -> Dict:
+    """Compares two revisions of a plan beam by beam, returns the beam content hashes and metric deltas (b - a).
+
+    Beams are matched by beam number; a beam is unchanged when its content hash (BeamContext.ContentHash) is
+    the same in both plans. Metric results are memoized by beam content (BeamResultCache), so the unchanged
+    beams of b are not calculated again.
+
+    Example:
+        report = compare_plans("plan_v1.dcm", "plan_v2.dcm", METRICS)
+        print(ComparisonTable(report))
+
+    :param a: plan dict or DICOM file name
+    :param b: plan dict or DICOM file name, the revision
+    :param metrics: MetricSuite or its list of (name, metric, params) entries, default
+        ComplexityMetric.BeamFeatures.BEAM_FEATURES
+    :return: {"beams": one row per beam number with beam, name, status ("unchanged", "changed", "added",
+        "removed"), hash_a, hash_b and metric name -> (a, b, b - a), "plan": metric name -> (a, b, b - a)}
+    """
+    if metrics is None:
+        from ComplexityMetric.BeamFeatures import BEAM_FEATURES
+        metrics = BEAM_FEATURES
+    suite = metrics if isinstance(metrics, MetricSuite) else MetricSuite(metrics)
+    plans = [ReadPlan(p) if isinstance(p, str) else p for p in (a, b)]
+
+    cache = GetBeamResults()
+    with BeamResults(cache):
+        rows = [suite.CalculateForPlan(plan) for plan in plans]
+        beams = [{number: beam for number, beam in plan["beams"].items()
+                  if beam["TreatmentDeliveryType"] == "TREATMENT" and beam["MU"] > 0.} for plan in plans]
+
+        report = {"beams": [], "plan": {}}
+        for number in sorted(set(beams[0]) | set(beams[1])):
+            pair = [side.get(number) for side in beams]
+            hashes = [suite.GetBeamContext(beam).ContentHash if beam is not None else "" for beam in pair]
+            values = [BeamValues(beam, suite) if beam is not None else {} for beam in pair]
+            if pair[0] is None or pair[1] is None:
+                status = "added" if pair[0] is None else "removed"
+            else:
+                status = "unchanged" if hashes[0] == hashes[1] else "changed"
+            name = next(str(beam.get("BeamName", "")) for beam in pair if beam is not None)
+
+            row = {"beam": int(number), "name": name, "status": status, "hash_a": hashes[0], "hash_b": hashes[1]}
+            for column in dict.fromkeys(list(values[0]) + list(values[1])):
+                row[column] = Delta(values[0].get(column), values[1].get(column))
+            report["beams"].append(row)
+
+    for column in rows[0]:
+        report["plan"][column] = Delta(rows[0][column], rows[1].get(column))
+    return report
+
+
+def Delta(a, b):
+    """(a, b, b - a), the difference is None when a value is missing or not a number"""
+    if isinstance(a, (int, float, np.number)) and isinstance(b, (int, float, np.number)):
+        return a, b, b - a
+    return a, b, None
+
+
+def Changed(value) -> bool:
+    """Delta with a finite, non zero difference, or a number becoming NaN / inf or the reverse"""
+    a, b, difference = value
+    if difference is None:
+        return False
+    if np.isfinite(difference):
+        return difference != 0
+    return bool(np.isfinite(a)) != bool(np.isfinite(b))
+
+
+def DeltaLine(column: str, value) -> str:
+    a, b, difference = value
+    difference = "%+12.4f" % difference if np.isfinite(difference) else "%12s" % "n/a"
+    return "  %-40s %12.4f %12.4f %s" % (column[:40], a, b, difference)
+
+
+def ComparisonTable(report: Dict) -> str:
+    """Text report of compare_plans: beam status, then the metrics that differ per beam and for the plan"""
+    lines = ["%-6s %-16s %-10s" % ("beam", "name", "status")]
+    for row in report["beams"]:
+        lines.append("%-6d %-16s %-10s" % (row["beam"], row["name"][:16], row["status"]))
+    for row in report["beams"]:
+        deltas = [(column, value) for column, value in row.items() if isinstance(value, tuple) and Changed(value)]
+        if deltas:
+            lines.append("")
+            lines.append("beam %d %s" % (row["beam"], row["name"]))
+            lines.extend(DeltaLine(column, value) for column, value in deltas)
+    deltas = [(column, value) for column, value in report["plan"].items() if Changed(value)]
+    if deltas:
+        lines.append("")
+        lines.append("plan")
+        lines.extend(DeltaLine(column, value) for column, value in deltas)
+    return "\n".join(lines)
@@ -4,7 +4,8 @@ import numpy as np
 
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
-from DicomParse.utilities import DivisionOrDefault
+from ApertureMetric.BeamApertures import BeamApertures
+from DicomParse.utilities import DivisionOrDefault, DivisionOrDefaultArray
 
 
 class PlanIrregularity(ComplexityMetric):
@@ -14,10 +15,14 @@ class PlanIrregularity(ComplexityMetric):
         Du W, et al. Quantification of beam complexity in intensity-modulated radiation therapy treatment plans.
         Med Phys 2014;41:21716. DOI: http://dx.doi.org/10.1118/1.4861821.
     """
-    def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
-        return [self.CalculateApertureIrregularity(aperture) for aperture in apertures]
+    def CalculatePerAperture(self, apertures: List[PyAperture]) -> np.ndarray:
+        beam_apertures = BeamApertures.FromApertures(apertures)
+        aa = beam_apertures.Area()
+        ap = beam_apertures.SidePerimeterHorizontal() + beam_apertures.SidePerimeterVertical()
+        return DivisionOrDefaultArray(ap ** 2, 4 * np.pi * aa)
 
     def CalculateApertureIrregularity(self, aperture: PyAperture) -> float:
+        """Scalar reference of CalculatePerAperture"""
         aa = aperture.Area()
         ap = aperture.SidePerimeterHorizontal() + aperture.SidePerimeterVertical()
         return DivisionOrDefault(ap ** 2, 4 * np.pi * aa)
\ No newline at end of file
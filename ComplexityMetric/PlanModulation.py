@@ -1,8 +1,10 @@
 from typing import List, Dict
 
+import numpy as np
+
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
-from ApertureMetric.ApertureCreator import AperturesFromBeamCreator
+from ApertureMetric.BeamApertures import BeamApertures
 
 
 class PlanModulation(ComplexityMetric):
@@ -12,6 +14,8 @@ class PlanModulation(ComplexityMetric):
         Du W, et al. Quantification of beam complexity in intensity-modulated radiation therapy treatment plans.
         Med Phys 2014;41:21716. DOI: http://dx.doi.org/10.1118/1.4861821.
     """
+    PerControlPoint = False
+
     def CalculateForBeam(self, beam: Dict[str, str]) -> float:
         """Returns the complexity metric of a beam, calculated as the weighted sum of the individual metrics
         for each control point"""
@@ -20,13 +24,22 @@ class PlanModulation(ComplexityMetric):
         UAA = self.CalculateBeamUnionArea(beam)
         return self.ModulationWeightedSum(weights, values, UAA)
 
-    def CalculatePerAperture(self, apertures: List[PyAperture]) -> List[float]:
+    def CalculatePerAperture(self, apertures: List[PyAperture]) -> np.ndarray:
         """cp aperture area"""
-        return [aperture.Area() for aperture in apertures]
+        return BeamApertures.FromApertures(apertures).Area()
 
     def CalculateBeamUnionArea(self, beam: Dict[str, str]) -> float:
-        """Calculate beam aperture union area"""
-        apertures = AperturesFromBeamCreator().Create(beam)
+        """Calculate beam aperture union area: sum over the leaf pairs of their largest area inside the jaws"""
+        beam_apertures = self.GetBeamContext(beam).Apertures
+        inside = ~beam_apertures.IsOutsideJaw()
+        if not np.any(inside):
+            return 0.0
+        area_max = np.max(np.where(inside, beam_apertures.FieldArea(), -np.inf), axis=0)
+        return float(np.sum(area_max[np.any(inside, axis=0)]))
+
+    def CalculateBeamUnionAreaReference(self, beam: Dict[str, str]) -> float:
+        """Scalar reference of CalculateBeamUnionArea"""
+        apertures = self.GetBeamContext(beam).Apertures
 
         area_max = {}
         for aperture in apertures:
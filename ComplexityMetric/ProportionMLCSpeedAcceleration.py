@@ -1,12 +1,9 @@
-from typing import Dict, List
+from typing import Dict, List, Sequence, Tuple, Union
 import warnings
 
 import numpy as np
 
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
-from ApertureMetric.ApertureCreator import AperturesFromBeamCreator
-from ApertureMetric.MetersetCreator import MetersetsFromMetersetWeightsCreator
-from ApertureMetric.MLCAttributes import MLCAttributes
 
 
 class ProportionMLCSpeedAcceleration(ComplexityMetric):
@@ -23,7 +20,36 @@ class ProportionMLCSpeedAcceleration(ComplexityMetric):
         Park JM, et al. The effect of MLC speed and acceleration on the plan delivery accuracy of VMAT.
         Br J Radiol 2015; 88(1049):20140698.
         DOI: https://doi.org/10.1259/bjr.20140698
+
+    Bin edges (bins are [edges[i], edges[i + 1])) are looked up by treatment machine name, with a "default"
+    entry; the defaults keep the same bins for every machine so that plans share the same CSV columns.
     """
+    PerControlPoint = False
+
+    SPEED_BINS = {"default": [0, 4, 8, 12, 16, 20, 25]}    # mm/s
+    ACC_BINS = {"default": [0, 10, 20, 40, 60]}             # mm/s2
+
+    def __init__(self, speed_bins: Union[Sequence[float], Dict[str, Sequence[float]]] = None,
+                 acc_bins: Union[Sequence[float], Dict[str, Sequence[float]]] = None) -> None:
+        """
+        :param speed_bins: speed bin edges for every machine, or dict machine name -> edges (updates SPEED_BINS)
+        :param acc_bins: acceleration bin edges for every machine, or dict machine name -> edges (updates ACC_BINS)
+        """
+        self.speed_bins = self.MergeBins(self.SPEED_BINS, speed_bins)
+        self.acc_bins = self.MergeBins(self.ACC_BINS, acc_bins)
+
+    @staticmethod
+    def MergeBins(default: Dict[str, Sequence[float]], bins) -> Dict[str, List[float]]:
+        merged = {machine: list(edges) for machine, edges in default.items()}
+        if isinstance(bins, dict):
+            merged.update({machine: list(edges) for machine, edges in bins.items()})
+        elif bins is not None:
+            merged["default"] = list(bins)
+        return merged
+
+    @staticmethod
+    def GetBins(bins: Dict[str, List[float]], treatment_machine_name: str) -> List[float]:
+        return bins.get(str(treatment_machine_name), bins["default"])
 
     def CalculateForPlan(self, plan: Dict[str, str]=None):
         speed_proportion = []
@@ -41,24 +67,14 @@ class ProportionMLCSpeedAcceleration(ComplexityMetric):
                np.round(np.mean(acc_proportion, axis=0), 2), np.round(np.mean(speed_acc_avg_std, axis=0), 2)
 
     def CalculateForBeam(self, beam: Dict[str, str]):
-        apertures = AperturesFromBeamCreator().Create(beam)
-        cumulative_metersets = MetersetsFromMetersetWeightsCreator().GetCumulativeMetersets(beam)
-
-        mlc_attributes = MLCAttributes(apertures, cumulative_metersets, beam['TreatmentMachineName'],
-                                   beam['DoseRateSet'], beam['GantryRotationAngle'])
-
-        mlc_speed = mlc_attributes.MLCSpeed()
-        mlc_acc = mlc_attributes.MLCAcc()
-
-        # 计算MLC各档速度和加速度所占比重
-        mlc_speed_proportion = self.CalculateForSpeedProportion(mlc_speed, beam['TreatmentMachineName'])
-        mlc_acc_proportion = self.CalculateForAccProportion(mlc_acc)
+        mlc_attributes = self.GetBeamContext(beam).MLCAttributes
+        machine = beam['TreatmentMachineName']
 
-        # 计算MLC速度和加速度平均值及标准差
-        mlc_speed_avg = mlc_attributes.MLCSpeedAvg()
-        mlc_acc_avg = mlc_attributes.MLCAccAvg()
-        mlc_speed_std_avg = mlc_attributes.MLCSpeedStdAvg()
-        mlc_acc_std_avg = mlc_attributes.MLCAccStdAvg()
+        # 计算MLC各档速度和加速度所占比重，及MLC速度和加速度平均值及标准差
+        mlc_speed_proportion, mlc_speed_avg, mlc_speed_std_avg = self.BinnedSummary(
+            mlc_attributes.MLCSpeed(), self.GetBins(self.speed_bins, machine), mlc_attributes.mlc_speed_std)
+        mlc_acc_proportion, mlc_acc_avg, mlc_acc_std_avg = self.BinnedSummary(
+            mlc_attributes.MLCAcc(), self.GetBins(self.acc_bins, machine), mlc_attributes.mlc_acc_std)
 
         mlc_speed_acc_avg_std = [mlc_speed_avg, mlc_acc_avg, mlc_speed_std_avg, mlc_acc_std_avg]
 
@@ -66,26 +82,35 @@ class ProportionMLCSpeedAcceleration(ComplexityMetric):
 
     def CalculateForSpeedProportion(self, mlc_speed, treatment_machine_name) -> List[float]:
         """计算各档MLC速度所占比例"""
-        Ncp = mlc_speed.shape[0] * mlc_speed.shape[1]       # 计算MLC控制点总数
+        return self.BinProportions(mlc_speed, self.GetBins(self.speed_bins, treatment_machine_name))
 
-        S_0_4 = np.sum(np.sum(np.logical_and(mlc_speed >= 0, mlc_speed < 4))) / Ncp
-        S_4_8 = np.sum(np.sum(np.logical_and(mlc_speed >= 4, mlc_speed < 8))) / Ncp
-        S_8_12 = np.sum(np.sum(np.logical_and(mlc_speed >= 8, mlc_speed < 12))) / Ncp
-        S_12_16 = np.sum(np.sum(np.logical_and(mlc_speed >= 12, mlc_speed < 16))) / Ncp
-        S_16_20 = np.sum(np.sum(np.logical_and(mlc_speed >= 16, mlc_speed < 20))) / Ncp
-        S_20_25 = np.sum(np.sum(np.logical_and(mlc_speed >= 20, mlc_speed < 25))) / Ncp
-
-        return [S_0_4, S_4_8, S_8_12, S_12_16, S_16_20, S_20_25]
-
-    def CalculateForAccProportion(self, mlc_acceleration) -> List[float]:
+    def CalculateForAccProportion(self, mlc_acceleration, treatment_machine_name=None) -> List[float]:
         """计算各档MLC加速度所占比例"""
-        Ncp = mlc_acceleration.shape[0] * mlc_acceleration.shape[1]
-
-        # MLC加速度分为4档
-        A_0_10 = np.sum(np.sum(np.logical_and(mlc_acceleration >= 0, mlc_acceleration < 10))) / Ncp
-        A_10_20 = np.sum(np.sum(np.logical_and(mlc_acceleration >= 10, mlc_acceleration < 20))) / Ncp
-        A_20_40 = np.sum(np.sum(np.logical_and(mlc_acceleration >= 20, mlc_acceleration < 40))) / Ncp
-        A_40_60 = np.sum(np.sum(np.logical_and(mlc_acceleration >= 40, mlc_acceleration < 60))) / Ncp
-
-        return [A_0_10, A_10_20, A_20_40, A_40_60]
+        return self.BinProportions(mlc_acceleration, self.GetBins(self.acc_bins, treatment_machine_name))
+
+    @staticmethod
+    def BinProportions(values: np.ndarray, edges: Sequence[float]) -> List[float]:
+        """Fraction of all values (NaN included in the total) in each bin [edges[i], edges[i + 1]), one digitize pass"""
+        values = np.ravel(np.asarray(values, dtype=float))
+        # index 0: below edges[0], len(edges): above the last edge or NaN
+        counts = np.bincount(np.digitize(values, edges), minlength=len(edges) + 1)[1:len(edges)]
+        return list(counts / values.size)
+
+    @classmethod
+    def BinnedSummary(cls, values: np.ndarray, edges: Sequence[float],
+                      column_std: np.ndarray) -> Tuple[List[float], float, float]:
+        """Bin proportions, average of the per leaf mean and average of the per leaf standard deviation,
+        zero and NaN values excluded (MLCAttributes.MLCSpeedAvg / MLCSpeedStdAvg)"""
+        values = np.asarray(values, dtype=float)
+        proportions = cls.BinProportions(values, edges)
+
+        counted = ~np.isnan(values) & (values != 0)
+        column_count = np.sum(counted, axis=0)
+        column_sum = np.sum(np.where(counted, values, 0.0), axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            column_mean = column_sum / column_count
+            average = np.nanmean(column_mean)
+            std_average = np.nanmean(np.where(column_std == 0, np.nan, column_std))
+        return proportions, average, std_average
 
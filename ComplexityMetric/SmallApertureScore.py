@@ -1,8 +1,10 @@
-from typing import List, Dict
+from typing import List, Dict, Sequence, Union
+
+import numpy as np
 
 from ComplexityMetric.ComplexityMetric import ComplexityMetric
 from ApertureMetric.Aperture import PyAperture
-from ApertureMetric.ApertureCreator import AperturesFromBeamCreator
+from ApertureMetric.FieldSizeDistribution import FieldSizeDistribution
 
 
 class SmallApertureScore(ComplexityMetric):
@@ -12,14 +14,20 @@ class SmallApertureScore(ComplexityMetric):
         Crowe SB, et al. Examination of the properties of IMRT and VMAT beams and evaluation against
         pre-treatment quality assurance results. Phys Med Biol 2015; 60(6):2587-2601.
         DOI: https://doi.org/10.1088/0031-9155/60/6/2587
+
+    x may be a single threshold (mm) or a list of thresholds, which are all answered from the same beam
+    field size distribution (BeamContext.FieldSizes) and return one value per threshold.
     """
-    def CalculateForPlan(self, plan: Dict[str, str] = None, x=5):
+    def CalculateForPlan(self, plan: Dict[str, str] = None, x: Union[float, Sequence[float]] = 5):
         """Returns the complexity metric of a plan, calculated as the weighted sum of the individual metrics
         for each beam"""
         weights = self.GetWeightsPlan(plan)
         metrics = self.GetMetricsPlan(plan, x)
 
-        return round(self.WeightedSum(weights, metrics), 2)
+        if np.ndim(x) == 0:
+            return round(self.WeightedSum(weights, metrics), 2)
+        metrics = np.asarray(metrics, dtype=float).reshape(-1, len(x))
+        return [round(self.WeightedSum(weights, column), 2) for column in metrics.T]
 
     def GetMetricsPlan(self, plan: Dict[str, str], x=5) -> List[float]:
         """Returns the unweighted metrics of a plan's beams"""
@@ -38,18 +46,20 @@ class SmallApertureScore(ComplexityMetric):
         weights = self.GetWeightsBeam(beam)
         values = self.GetMetricsBeam(beam, x)
 
-        return self.WeightedSum(weights, values)
+        if np.ndim(x) == 0:
+            return self.WeightedSum(weights, values)
+        return [self.WeightedSum(weights, column) for column in np.asarray(values).T]
 
-    def GetMetricsBeam(self, beam: Dict[str, str], x=5) -> List[float]:
-        """Returns the unweighted metrics of a beam's control points"""
-        apertures = AperturesFromBeamCreator().Create(beam)
-        return self.CalculatePerAperture(apertures, x)
+    def GetMetricsBeam(self, beam: Dict[str, str], x=5) -> np.ndarray:
+        """Returns the unweighted metrics of a beam's control points, (Ncp,) or (Ncp, len(x))"""
+        return self.GetBeamContext(beam).FieldSizes.SmallApertureScore(x)
 
-    def CalculatePerAperture(self, apertures: List[PyAperture], x=5) -> List[float]:
+    def CalculatePerAperture(self, apertures: List[PyAperture], x=5) -> np.ndarray:
         """计算控制点Aperture小于给定阈值距离（x）开放叶片对的比例"""
-        return [self.CalculateSmallApertureScore(aperture, x) for aperture in apertures]
+        return FieldSizeDistribution(apertures).SmallApertureScore(x)
 
     def CalculateSmallApertureScore(self, aperture: PyAperture, x=5) -> float:
+        """Scalar reference of CalculatePerAperture"""
         lp_fs = [lp.FieldSize() for lp in aperture.LeafPairs if not lp.IsOutsideJaw()]
         lp_fs_x = [fs for fs in lp_fs if fs < x]
         return len(lp_fs_x) / len(lp_fs)
\ No newline at end of file
@@ -0,0 +1,97 @@
+import io
+import numbers
+from typing import BinaryIO, Dict, Union
+
+import numpy as np
+from pydicom.dataset import Dataset
+from pydicom.multival import MultiValue
+from pydicom.sequence import Sequence
+
+from ApertureMetric.BeamContext import BeamContextCache, LeafPositionBoundaries
+from ApertureMetric.MetersetCreator import MetersetsFromMetersetWeightsCreator
+from DicomParse.dicomrt import RTPlan
+
+# Control point data of an extracted beam, everything the complexity metrics read from the pydicom sequences
+BEAM_ARRAY_KEYS = ["LeafPositions", "JawPositions", "ApertureGantryAngles", "ApertureControlPoints",
+                   "ControlPointGantryAngles", "CumulativeMetersetWeights", "LeafPositionBoundaries"]
+
+# Version of the extracted plan layout, part of the PlanCache entry names: bump it when the extraction changes
+EXTRACT_VERSION = 3
+
+# pydicom sequences replaced by the arrays, and runtime objects that are not plan data
+DROPPED_KEYS = ["ControlPointSequence", "BeamLimitingDeviceSequence", BeamContextCache.BEAM_KEY,
+                BeamContextCache.PLAN_KEY]
+
+
+def ToPlainValue(value):
+    """Converts pydicom values (DSfloat, IS, MultiValue, PersonName) to plain, JSON serializable values"""
+    if isinstance(value, (list, tuple, MultiValue)):
+        return [ToPlainValue(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (bool, str)) or value is None:
+        return value
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Number):
+        return float(value)
+    return str(value)
+
+
+def ExtractBeamArrays(beam: Dict[str, str]) -> Dict[str, np.ndarray]:
+    """Returns the control point data of a pydicom backed beam as plain arrays (BEAM_ARRAY_KEYS)"""
+    # reuses the apertures already built for the metrics when the beam is attached to a plan cache
+    context = BeamContextCache.ForBeam(beam)
+    apertures = context.Apertures
+
+    return {
+        "LeafPositions": apertures.leaf_positions,
+        "JawPositions": apertures.jaws,
+        "ApertureGantryAngles": apertures.gantry_angles,
+        "ApertureControlPoints": apertures.control_points,
+        "ControlPointGantryAngles": np.asarray(context.GantryAngles, dtype=float),
+        "CumulativeMetersetWeights": MetersetsFromMetersetWeightsCreator().GetBeamMetersetWeights(beam),
+        "LeafPositionBoundaries": LeafPositionBoundaries(beam),
+    }
+
+
+def ExtractBeam(beam: Dict[str, str]) -> Dict[str, str]:
+    """Returns a copy of the beam dict without any pydicom object: plain values plus the control point arrays"""
+    extracted = {key: ToPlainValue(value) for key, value in beam.items()
+                 if key not in DROPPED_KEYS and key not in BEAM_ARRAY_KEYS
+                 and not isinstance(value, (Sequence, Dataset))}
+    if "LeafPositions" in beam:
+        extracted.update({key: np.asarray(beam[key], dtype=float) for key in BEAM_ARRAY_KEYS})
+    else:
+        extracted.update(ExtractBeamArrays(beam))
+    return extracted
+
+
+def ExtractPlan(plan: Dict[str, str]) -> Dict[str, str]:
+    """Returns a copy of a get_plan dict whose beams hold plain arrays instead of pydicom sequences.
+
+    The metrics give the same results on the extracted plan, which no longer references the dataset
+    and can be pickled or stored (DicomParse.PlanCache).
+    """
+    extracted = {key: ToPlainValue(value) for key, value in plan.items()
+                 if key not in DROPPED_KEYS and key != "beams"}
+    extracted["beams"] = {int(number): ExtractBeam(beam) for number, beam in plan["beams"].items()}
+    BeamContextCache.ForPlan(extracted)
+    return extracted
+
+
+def ReadPlan(filename: Union[str, bytes, BinaryIO]) -> Dict[str, str]:
+    """Extraction mode of RTPlan: returns the extracted plan (ExtractPlan) of a file, its content or a file object.
+
+    The file is read once into memory and parsed without deferred values, so the leaf positions are not
+    read again from the file on each access; the dataset is released on return and the plan only holds
+    plain values and the control point arrays.
+    """
+    if isinstance(filename, str):
+        with open(filename, "rb") as f:
+            filename = f.read()
+    if isinstance(filename, bytes):
+        filename = io.BytesIO(filename)
+    return ExtractPlan(RTPlan(filename=filename, defer_size=None).get_plan())
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import os.path as osp
+import tempfile
+from typing import Dict, Optional
+
+import numpy as np
+
+from ApertureMetric.BeamContext import BeamContextCache
+from DicomParse.PlanArrays import BEAM_ARRAY_KEYS, EXTRACT_VERSION, ExtractPlan, ReadPlan
+
+
+class PlanCache:
+    """Persistent cache of extracted plans, one uncompressed .npz file per plan keyed by the SHA-1 of the
+    DICOM file content.
+
+    Each entry holds the beam arrays (BEAM_ARRAY_KEYS, stored as "<beam number>/<key>") and a JSON
+    "metadata" member with the plan and beam scalar values, so a cached plan is loaded with numpy only,
+    without pydicom. Entry names hold the extraction version (PlanArrays.EXTRACT_VERSION), entries of an older
+    layout are never read again and age out as least recently used. Entries are touched when read; once the directory grows above
+    max_size bytes the least recently used entries are removed. The directory size is tracked from the entries
+    written, and only listed again every scan_interval writes (other workers write to the same directory).
+    """
+
+    SUFFIX = ".npz"
+    # entries being written, not listed by Entries so that other workers never count or remove them
+    TMP_SUFFIX = ".tmp"
+
+    def __init__(self, directory: str, max_size: int = 2 * 1024 ** 3, scan_interval: int = 100) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.scan_interval = scan_interval
+        self.size = None    # estimated directory size, listed on the first write
+        self.writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def Key(filename: str) -> str:
+        """SHA-1 of the file content"""
+        h = hashlib.sha1()
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def EntryPath(self, key: str) -> str:
+        return osp.join(self.directory, "%s.v%d%s" % (key, EXTRACT_VERSION, self.SUFFIX))
+
+    def Load(self, filename: str) -> Dict[str, str]:
+        """Returns the extracted plan of a DICOM file, parsing it (ReadPlan) only if it is not cached"""
+        key = self.Key(filename)
+        plan = self.Get(key)
+        if plan is None:
+            plan = self.Put(key, ReadPlan(filename))
+        return plan
+
+    def LoadData(self, data: bytes) -> Dict[str, str]:
+        """Load of a file content already read (CohortRunner.iter_plan_data)"""
+        key = hashlib.sha1(data).hexdigest()
+        plan = self.Get(key)
+        if plan is None:
+            plan = self.Put(key, ReadPlan(data))
+        return plan
+
+    def Get(self, key: str) -> Optional[Dict[str, str]]:
+        path = self.EntryPath(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                metadata = json.loads(str(data["metadata"]))
+                arrays = {name: np.asarray(data[name]) for name in data.files if name != "metadata"}
+            os.utime(path)      # LRU: last use is the entry modification time
+        except (OSError, KeyError, ValueError):
+            return None
+
+        plan = metadata["plan"]
+        plan["beams"] = {}
+        for number, beam in metadata["beams"].items():
+            for name in BEAM_ARRAY_KEYS:
+                beam[name] = arrays.get("%s/%s" % (number, name))
+            plan["beams"][int(number)] = beam
+
+        BeamContextCache.ForPlan(plan)
+        return plan
+
+    def Put(self, key: str, plan: Dict[str, str]) -> Dict[str, str]:
+        """Stores a plan (get_plan or extracted dict) and returns its extracted version"""
+        plan = ExtractPlan(plan)
+
+        metadata = {"plan": {}, "beams": {}}
+        arrays = {}
+        for name, value in plan.items():
+            if name not in ["beams", BeamContextCache.PLAN_KEY]:
+                metadata["plan"][name] = value
+        for number, beam in plan["beams"].items():
+            metadata["beams"][str(number)] = {name: value for name, value in beam.items()
+                                              if name not in BEAM_ARRAY_KEYS and name != BeamContextCache.BEAM_KEY}
+            for name in BEAM_ARRAY_KEYS:
+                if beam[name] is not None:  # e.g. no MLC leaf boundaries, read back as None
+                    arrays["%s/%s" % (number, name)] = beam[name]
+        arrays["metadata"] = np.array(json.dumps(metadata))
+
+        # write to a temporary file first, concurrent workers never read a partial entry
+        path = self.EntryPath(key)
+        replaced = osp.getsize(path) if osp.exists(path) else 0
+        fd, tmp_path = tempfile.mkstemp(suffix=self.TMP_SUFFIX, dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            written = osp.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if osp.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.Added(written - replaced)
+        return plan
+
+    def Added(self, size: int) -> None:
+        """Updates the directory size after a write, evicts when it is above max_size"""
+        self.writes += 1
+        if self.size is None or self.writes >= self.scan_interval:
+            self.size = self.Size()
+            self.writes = 0
+        else:
+            self.size += size
+        if self.size > self.max_size:
+            self.Evict()
+
+    def Entries(self):
+        """Cache entries as (modification time, size, path)"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(self.SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def Size(self) -> int:
+        return sum(size for _, size, _ in self.Entries())
+
+    def Evict(self) -> None:
+        """Removes the least recently used entries until the cache fits in max_size"""
+        entries = sorted(self.Entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass    # already evicted by another worker
+            total -= size
+        self.size = total
+        self.writes = 0
+
+    def Clear(self) -> None:
+        for _, _, path in self.Entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
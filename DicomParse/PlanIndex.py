@@ -0,0 +1,193 @@
+import os
+import sqlite3
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from DicomParse.dicomrt import triage
+
+# Header columns of the plans table, filled from RTPlan.peek
+PLAN_COLUMNS = ["sop_instance_uid", "path", "size", "mtime", "patient_id", "modality", "label", "machine_id",
+                "beam_type", "radiation_type", "rotation_direction", "control_points", "beam_number", "plan_class"]
+
+
+def ScanDirectory(directory: str, extension: str = ".dcm") -> Tuple[List[Tuple[str, int, float]], List[str]]:
+    """Returns the (path, size, mtime) of the files of a directory with the extension, and its sub directories"""
+    files, directories = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif entry.name.lower().endswith(extension):
+                        stat = entry.stat()
+                        files.append((entry.path, stat.st_size, stat.st_mtime))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files, directories
+
+
+def scan_dcm_files(directory: str, workers: int = 8, extension: str = ".dcm") -> Iterator[Tuple[str, int, float]]:
+    """Yields (path, size, mtime) of every file with the extension below directory, the directories being
+    listed with os.scandir by a pool of threads (network shares answer several listings at once)"""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(ScanDirectory, directory, extension)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, directories = future.result()
+                pending.update(pool.submit(ScanDirectory, d, extension) for d in directories)
+                yield from files
+
+
+class PlanIndex:
+    """SQLite index of the RT Plan files of an archive, built from their header tags only (RTPlan.peek).
+
+    The plans table holds one row per SOPInstanceUID: copies of a plan in several folders are indexed once,
+    the copy with the smallest path being kept, and every file is listed in the files table with the UID it
+    holds. Unchanged files (same size and mtime) are not read again by Update. Cohorts are selected with
+    Paths (or Query) instead of copying files into per machine folders.
+
+    Example:
+        with PlanIndex(r".\\rt_plan_index.sqlite") as index:
+            index.Update(r"D:\\RT_Plan")
+            paths = index.Paths(plan_class="VMAT", machine_id="TrueBeamSN1352")
+    """
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS plans (
+                                   sop_instance_uid TEXT PRIMARY KEY, path TEXT, size INTEGER, mtime REAL,
+                                   patient_id TEXT, modality TEXT, label TEXT, machine_id TEXT, beam_type TEXT,
+                                   radiation_type TEXT, rotation_direction TEXT, control_points INTEGER,
+                                   beam_number INTEGER, plan_class TEXT)""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS files (
+                                   path TEXT PRIMARY KEY, size INTEGER, mtime REAL, sop_instance_uid TEXT,
+                                   plan_class TEXT)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS plans_class ON plans (plan_class, machine_id)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS files_uid ON files (sop_instance_uid)")
+        self.connection.commit()
+
+    def __enter__(self) -> "PlanIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.Close()
+
+    def Close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+
+    @staticmethod
+    def ReadHeader(entry: Tuple[str, int, float]) -> Dict:
+        """Header tags of one scanned file, plan_class INVALID for unreadable files"""
+        path, size, mtime = entry
+        info = triage(path)
+        row = {column: "" for column in PLAN_COLUMNS}
+        row.update({key: value if isinstance(value, (int, float)) else str(value) for key, value in info.items()
+                    if key in row})
+        row.update(path=path, size=size, mtime=mtime)
+        return row
+
+    def Update(self, directory: str, workers: int = 8, batch_size: int = 500, prune: bool = True) -> Dict[str, int]:
+        """Indexes the new or modified .dcm files below directory, returns the number of scanned, read and
+        indexed files; with prune, files no longer found below directory are removed from the index"""
+        known = {path: (size, mtime) for path, size, mtime in
+                 self.connection.execute("SELECT path, size, mtime FROM files")}
+        counts = {"scanned": 0, "read": 0, "indexed": 0, "removed": 0}
+        scanned = set()
+        changed = []
+        for entry in scan_dcm_files(directory, workers=workers):
+            counts["scanned"] += 1
+            scanned.add(entry[0])
+            if known.get(entry[0]) != (entry[1], entry[2]):
+                changed.append(entry)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            batch = []
+            for row in pool.map(self.ReadHeader, changed, chunksize=16):
+                counts["read"] += 1
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    counts["indexed"] += self.Insert(batch)
+                    batch = []
+            counts["indexed"] += self.Insert(batch)
+
+        if prune:
+            root = os.path.join(os.path.abspath(directory), "")
+            removed = [path for path in known if path not in scanned and os.path.abspath(path).startswith(root)]
+            counts["removed"] = self.Remove(removed)
+        return counts
+
+    def Insert(self, rows: Sequence[Dict]) -> int:
+        """Bulk inserts header rows in one transaction, returns the number of RT Plan rows"""
+        plans = [row for row in rows if row["sop_instance_uid"] and row["plan_class"] not in ["INVALID", "NOT_RTPLAN"]]
+        with self.connection:
+            # a modified file may hold another plan now, or no plan
+            deleted = self.connection.executemany("DELETE FROM plans WHERE path = ? AND sop_instance_uid != ?",
+                                                  [(row["path"], row["sop_instance_uid"]) for row in rows]).rowcount
+            self.connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                                        [(row["path"], row["size"], row["mtime"], row["sop_instance_uid"],
+                                          row["plan_class"]) for row in rows])
+            # one row per SOPInstanceUID, the copy with the smallest path wins whatever the scan order
+            self.connection.executemany(
+                "INSERT INTO plans VALUES (%s) ON CONFLICT (sop_instance_uid) DO UPDATE SET %s "
+                "WHERE excluded.path <= plans.path" % (", ".join("?" * len(PLAN_COLUMNS)),
+                                                       ", ".join("%s = excluded.%s" % (c, c) for c in PLAN_COLUMNS[1:])),
+                [tuple(row[column] for column in PLAN_COLUMNS) for row in plans])
+        if deleted > 0:
+            self.IndexOrphans()
+        return len(plans)
+
+    def Remove(self, paths: Sequence[str]) -> int:
+        """Removes deleted files; a plan whose indexed copy was removed falls back to another copy if any"""
+        if not paths:
+            return 0
+        with self.connection:
+            self.connection.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+            self.connection.executemany("DELETE FROM plans WHERE path = ?", [(path,) for path in paths])
+        self.IndexOrphans()
+        return len(paths)
+
+    def IndexOrphans(self) -> int:
+        """Re-reads the remaining copies of the plans that lost their indexed file (removed, or rewritten with
+        another plan or an invalid file), so that another copy is indexed; returns the number of files read"""
+        orphans = self.connection.execute(
+            "SELECT path, size, mtime FROM files WHERE sop_instance_uid != '' AND sop_instance_uid NOT IN "
+            "(SELECT sop_instance_uid FROM plans) AND plan_class NOT IN ('INVALID', 'NOT_RTPLAN')").fetchall()
+        self.Insert([self.ReadHeader(entry) for entry in orphans])
+        return len(orphans)
+
+    def Duplicates(self) -> Dict[str, List[str]]:
+        """Paths of the plans found in more than one file, by SOPInstanceUID"""
+        duplicates = {}
+        for uid, path in self.connection.execute(
+                "SELECT sop_instance_uid, path FROM files WHERE sop_instance_uid IN (SELECT sop_instance_uid FROM files "
+                "WHERE sop_instance_uid != '' GROUP BY sop_instance_uid HAVING COUNT(*) > 1) ORDER BY path"):
+            duplicates.setdefault(uid, []).append(path)
+        return duplicates
+
+    def Query(self, where: str = "", parameters: Sequence = ()) -> List[Dict]:
+        """Plan rows matching an SQL condition on the plans columns, e.g. Query("control_points > ?", (100,))"""
+        sql = "SELECT %s FROM plans" % ", ".join(PLAN_COLUMNS)
+        if where:
+            sql += " WHERE " + where
+        return [dict(zip(PLAN_COLUMNS, row)) for row in self.connection.execute(sql + " ORDER BY path", parameters)]
+
+    def Paths(self, **equals) -> List[str]:
+        """Paths of the plans whose columns equal the given values, a list value matches any of its items,
+        e.g. Paths(plan_class="VMAT", machine_id=["TrueBeamSN1352", "TrueBeamSN2716"])"""
+        conditions, parameters = [], []
+        for column, value in equals.items():
+            if column not in PLAN_COLUMNS:
+                raise KeyError("unknown plan index column: %s" % column)
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            conditions.append("%s IN (%s)" % (column, ", ".join("?" * len(values))))
+            parameters.extend(values)
+        return [row["path"] for row in self.Query(" AND ".join(conditions), parameters)]
@@ -4,20 +4,28 @@ import numpy as np
 import pydicom as dicom
 from pydicom.valuerep import IS
 
+from ApertureMetric.BeamContext import BeamContextCache
+from ApertureMetric.Instrumentation import PlanControlPoints, PlanLabel, Timed
+from ApertureMetric.MachineProfile import GetMachineRegistry
+
+# Top level tags read by RTPlan.peek, the BeamSequence is needed for beam type, machine and control points
+PEEK_TAGS = ["SOPClassUID", "SOPInstanceUID", "PatientID", "Modality", "RTPlanLabel", "BeamSequence"]
+
 
 class RTPlan:
     """Class that parses and returns formatted DICOM RT Plan data."""
 
-    def __init__(self, filename: str) -> None:
-
+    def __init__(self, filename: str, defer_size: int = 100) -> None:
+        """:param defer_size: values larger than defer_size bytes are read from the file on access,
+            None reads the whole dataset at once (DicomParse.PlanArrays.ReadPlan)"""
         if filename:
             self.plan = dict()
             try:
                 # Only pydicom 0.9.5 and above supports the force read argument
                 if dicom.__version__ >= "0.9.5":
-                    self.ds = dicom.read_file(filename, defer_size=100, force=True)
+                    self.ds = dicom.read_file(filename, defer_size=defer_size, force=True)
                 else:
-                    self.ds = dicom.read_file(filename, defer_size=100)
+                    self.ds = dicom.read_file(filename, defer_size=defer_size)
             except (EOFError, IOError):
                 # Raise the error for the calling method to handle
                 raise
@@ -30,9 +38,52 @@ class RTPlan:
         else:
             raise AttributeError
 
+    @staticmethod
+    def peek(filename: str) -> Dict[str, str]:
+        """Returns the plan classification tags only, without building the beams and control points.
+
+        Only PEEK_TAGS are read (specific_tags), and large values such as LeafJawPositions are deferred
+        and never loaded, so a directory can be triaged before any full get_plan.
+        """
+        ds = dicom.read_file(filename, defer_size=100, force=True, specific_tags=PEEK_TAGS)
+        if "SOPClassUID" not in ds:
+            raise AttributeError
+
+        info = {"sop_instance_uid": str(ds.SOPInstanceUID) if "SOPInstanceUID" in ds else "",
+                "patient_id": str(ds.PatientID) if "PatientID" in ds else "",
+                "modality": str(ds.Modality) if "Modality" in ds else "",
+                "label": str(ds.RTPlanLabel) if "RTPlanLabel" in ds else "",
+                "beam_type": "", "radiation_type": "", "machine_id": "", "rotation_direction": "",
+                "control_points": 0, "beam_number": 0}
+
+        for bi in ds.BeamSequence if "BeamSequence" in ds else []:
+            if "TreatmentDeliveryType" in bi and bi.TreatmentDeliveryType == "SETUP":
+                continue
+            info["beam_number"] += 1
+            info["beam_type"] = bi.BeamType if "BeamType" in bi else ""
+            info["radiation_type"] = bi.RadiationType if "RadiationType" in bi else ""
+            info["machine_id"] = bi.TreatmentMachineName if "TreatmentMachineName" in bi else ""
+
+            if "NumberOfControlPoints" in bi:
+                n_cp = int(bi.NumberOfControlPoints)
+            else:
+                n_cp = len(bi.ControlPointSequence) if "ControlPointSequence" in bi else 0
+            info["control_points"] = max(info["control_points"], n_cp)
+
+            if "ControlPointSequence" in bi and len(bi.ControlPointSequence) > 0:
+                cp0 = bi.ControlPointSequence[0]
+                if "GantryRotationDirection" in cp0 and cp0.GantryRotationDirection in ["CW", "CC"]:
+                    info["rotation_direction"] = cp0.GantryRotationDirection
+
+        info["plan_class"] = classify_plan(info)
+        return info
+
+    @Timed("parse", "RTPlan.get_plan",
+           counts=lambda args, plan: {"control_points": PlanControlPoints(plan), "plan": PlanLabel(plan)})
     def get_plan(self) -> Dict[str, str]:
         """Returns the plan information."""
         self.plan["label"] = self.ds.RTPlanLabel
+        self.plan["sop_instance_uid"] = str(self.ds.SOPInstanceUID) if "SOPInstanceUID" in self.ds else ""
 
         # get plan id
         if "RTPlanName" in self.ds:
@@ -112,8 +163,17 @@ class RTPlan:
             else:
                 self.plan["beam_type"] = ""
 
+        # get gantry rotation direction, "" for static gantry plans
+        self.plan["rotation_direction"] = ""
+        for item in ref_beams:
+            if ref_beams[item].get("GantryRotationDirection", "") in ["CW", "CC"]:
+                self.plan["rotation_direction"] = ref_beams[item]["GantryRotationDirection"]
+
         self.plan["beam_number"] = len(ref_beams)
 
+        # apertures, metersets and MLC attributes shared by all complexity metrics
+        BeamContextCache.ForPlan(self.plan)
+
         return self.plan
 
     def get_beams(self, fx: int = 0) -> Dict[IS, Dict[str, str]]:
@@ -128,6 +188,7 @@ class RTPlan:
         for bi in bdict:
             if bi.TreatmentDeliveryType != 'SETUP':
                 beam = dict()
+                beam["BeamNumber"] = bi.BeamNumber
                 beam["Manufacturer"] = bi.Manufacturer if "Manufacturer" in bi else ""
                 beam["InstitutionName"] = bi.InstitutionName if "InstitutionName" in bi else ""
                 beam["TreatmentMachineName"] = bi.TreatmentMachineName if "TreatmentMachineName" in bi else ""
@@ -174,12 +235,13 @@ class RTPlan:
                                 if "GantryRotationDirection" in cp0 else ""
 
                             # last control point angle
-                            if final_cp.GantryRotationDirection == "NONE":
+                            # Monaco may leave GantryRotationDirection out of the final control point
+                            if final_cp.get("GantryRotationDirection", "NONE") == "NONE":
                                 final_angle = bi.ControlPointSequence[-1].GantryAngle \
-                                    if "GantryAngle" in cp0 else ""
+                                    if "GantryAngle" in final_cp else ""
                                 beam["GantryFinalAngle"] = final_angle
 
-                            if beam['TreatmentMachineName'] in ['TRILOGY-SN5602', 'TrueBeamSN1352', 'TrueBeamSN2716']:
+                            if beam['TreatmentMachineName'] in GetMachineRegistry() and "GantryFinalAngle" in beam:
                                 if beam["GantryRotationDirection"] == "CW":
                                     rotation_angle = ((beam["GantryFinalAngle"] - beam["GantryAngle"]) + 360) % 360
                                     beam["GantryRotationAngle"] = rotation_angle
@@ -228,3 +290,33 @@ class RTPlan:
             study['id'] = self.ds.StudyInstanceUID
 
         return study
+
+
+def classify_plan(info: Dict[str, str]) -> str:
+    """Plan class from the RTPlan.peek tags: NOT_RTPLAN, NO_BEAM, ELECTRON, 3DCRT, VMAT or IMRT
+
+    VMAT is the selection of the metric scripts, STATIC or DYNAMIC beams with a CW or CC gantry rotation,
+    whatever the plan label; the label ("CRT") only tells conformal plans from IMRT for static gantry plans.
+    """
+    if info["modality"].upper() != "RTPLAN":
+        return "NOT_RTPLAN"
+    if info["beam_number"] == 0:
+        return "NO_BEAM"
+    if info["radiation_type"].upper() == "ELECTRON":
+        return "ELECTRON"
+    if info["beam_type"] in ["STATIC", "DYNAMIC"] and info["rotation_direction"] in ["CW", "CC"]:
+        return "VMAT"
+    if "CRT" in info["label"].upper():
+        return "3DCRT"
+    # step and shoot or sliding window IMRT have more than the two control points of a conformal beam
+    if info["beam_type"] in ["STATIC", "DYNAMIC"] and info["control_points"] > 2:
+        return "IMRT"
+    return "3DCRT"
+
+
+def triage(path: str) -> Dict[str, str]:
+    """Classifies a plan file with RTPlan.peek, unreadable files are returned with plan_class INVALID"""
+    try:
+        return RTPlan.peek(path)
+    except Exception as e:
+        return {"plan_class": "INVALID", "error": "%s: %s" % (type(e).__name__, e)}
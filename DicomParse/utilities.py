@@ -2,6 +2,7 @@ import os
 import os.path as osp
 from shutil import copy2
 
+import numpy as np
 import pydicom
 
 from typing import Callable, List
@@ -26,6 +27,12 @@ def DivisionOrDefault(a: float, b: float) -> float:
     return a / b if b != 0 else 0.0
 
 
+def DivisionOrDefaultArray(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Element-wise DivisionOrDefault"""
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+    return np.divide(a, b, out=np.zeros(a.shape), where=b != 0)
+
+
 def LeafTravelMCS(leaf_travel: float, mcs: float) -> float:
     """Leaf Travel Modulation Complexity Score (LTMCS)"""
     return ((1000 - leaf_travel) / 1000) * mcs
@@ -60,6 +67,8 @@ def retrieve_filenames(directory: str, func: Callable = None, recursive: bool =
 
 
 def dcm_retrieve(directory: str):
+    """Copies the RT Plans into per machine folders; DicomParse.PlanIndex selects the same cohorts with a query,
+    without reading whole files or copying them"""
     filepaths = retrieve_dcm_filenames(directory, recursive=True)
     for pfile in filepaths:
         ds = pydicom.read_file(pfile, force=True)
@@ -0,0 +1,170 @@
+"""Times plan parsing, aperture creation and every ComplexityMetric on synthetic plans, writes a JSON report.
+
+    python -m benchmarks.run_benchmarks --repeat 5 --output report.json
+    python -m benchmarks.run_benchmarks --compare before.json --output after.json
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import pkgutil
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import pydicom
+
+import ComplexityMetric
+from ApertureMetric.ApertureCreator import AperturesFromBeamCreator
+from ApertureMetric.BeamContext import BeamContextCache
+from ComplexityMetric.ComplexityMetric import ComplexityMetric as ComplexityMetricBase
+from ComplexityMetric.MetricSuite import MetricSuite
+from DicomParse.dicomrt import RTPlan
+from benchmarks.synthetic_plan import SCENARIOS, scenario_plans
+
+
+def metric_classes() -> Dict[str, type]:
+    """Every default constructible ComplexityMetric subclass of the ComplexityMetric package, by class name"""
+    for module in pkgutil.iter_modules(ComplexityMetric.__path__):
+        importlib.import_module("ComplexityMetric." + module.name)
+
+    classes = {}
+    pending = list(ComplexityMetricBase.__subclasses__())
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        if cls is not MetricSuite and cls.__module__.startswith("ComplexityMetric."):
+            classes[cls.__name__] = cls
+    return dict(sorted(classes.items()))
+
+
+def measure(func: Callable, repeat: int, setup: Callable = None) -> Dict[str, float]:
+    """Runs func repeat times (after setup, not timed) and returns min / median / mean seconds"""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):     # get_beams prints the beam limiting devices
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": float(np.median(times)), "mean": float(np.mean(times))}
+
+
+def parse(data: bytes) -> Dict[str, str]:
+    return RTPlan(filename=io.BytesIO(data)).get_plan()
+
+
+def benchmark_scenario(data: bytes, metrics: Dict[str, type], repeat: int) -> Dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan = parse(data)
+    beams = list(plan["beams"].values())
+    n_cp = sum(len(beam["ControlPointSequence"]) for beam in beams)
+    cache = BeamContextCache.ForPlan(plan)
+
+    result = {
+        "beams": len(beams),
+        "control_points": n_cp,
+        "bytes": len(data),
+        "get_plan": measure(lambda: parse(data), repeat),
+        "create_apertures": measure(lambda: [AperturesFromBeamCreator().Create(beam) for beam in beams], repeat),
+        "metrics": {},
+    }
+
+    instances = {}
+    for name, cls in metrics.items():
+        metric = instances[name] = cls()
+        entry = {}
+        try:
+            # cold: apertures and MLC attributes built by the metric, as when it runs alone
+            entry["plan"] = measure(lambda: metric.CalculateForPlan(plan), repeat, setup=cache.Clear)
+            # warm: beam context already filled by a previous metric, as in MetricSuite
+            entry["plan_warm"] = measure(lambda: metric.CalculateForPlan(plan), repeat)
+            entry["per_control_point"] = {k: v / n_cp for k, v in entry["plan"].items()}
+        except Exception as e:
+            entry["error"] = "%s: %s" % (type(e).__name__, e)
+        result["metrics"][name] = entry
+
+    # all metrics that succeeded, in one MetricSuite pass
+    suite = MetricSuite([(name, instances[name]) for name, entry in result["metrics"].items() if "error" not in entry])
+    try:
+        result["metric_suite"] = measure(lambda: suite.CalculateForPlan(plan), repeat, setup=cache.Clear)
+    except Exception as e:
+        result["metric_suite"] = {"error": "%s: %s" % (type(e).__name__, e)}
+    return result
+
+
+def environment() -> Dict[str, str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {"python": platform.python_version(), "numpy": np.__version__, "pydicom": pydicom.__version__,
+            "platform": platform.platform(), "processor": platform.processor(), "commit": commit,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def run(scenarios: List[str] = None, repeat: int = 3, seed: int = 0, metrics: List[str] = None) -> Dict:
+    classes = metric_classes()
+    if metrics:
+        classes = {name: cls for name, cls in classes.items() if name in metrics}
+
+    report = {"environment": environment(), "repeat": repeat, "seed": seed, "scenarios": {}}
+    for name, data in scenario_plans(scenarios, seed=seed).items():
+        print("benchmark %s" % name, file=sys.stderr)
+        report["scenarios"][name] = dict(SCENARIOS[name], **benchmark_scenario(data, classes, repeat))
+    return report
+
+
+def compare(before: Dict, after: Dict) -> List[str]:
+    """Lines "scenario / step: before -> after (speedup)" of the median times found in both reports"""
+    def medians(report):
+        values = {}
+        for scenario, result in report["scenarios"].items():
+            for step in ["get_plan", "create_apertures", "metric_suite"]:
+                if "median" in result.get(step, {}):
+                    values[(scenario, step)] = result[step]["median"]
+            for metric, entry in result["metrics"].items():
+                if "plan" in entry:
+                    values[(scenario, metric)] = entry["plan"]["median"]
+        return values
+
+    old, new = medians(before), medians(after)
+    lines = []
+    for key in old:
+        if key in new and new[key] > 0:
+            lines.append("%s / %s: %.4fs -> %.4fs (x%.2f)" % (key[0], key[1], old[key], new[key], old[key] / new[key]))
+    return lines
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="default: all scenarios")
+    parser.add_argument("--metric", action="append", help="metric class name, default: all metrics")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON report file, default: stdout")
+    parser.add_argument("--compare", help="previous JSON report, prints the speedup of each step")
+    args = parser.parse_args(argv)
+
+    report = run(args.scenario, repeat=args.repeat, seed=args.seed, metrics=args.metric)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(json.load(f), report):
+                print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import io
+from typing import Dict, List
+
+import numpy as np
+from pydicom.dataset import Dataset, FileDataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+RT_PLAN_STORAGE = "1.2.840.10008.5.1.4.1.1.481.5"
+
+
+def LeafBoundaries(widths: List[float]) -> List[float]:
+    """Leaf position boundaries, centred on 0, of a MLC with the given leaf widths (mm)"""
+    boundaries = np.concatenate([[0.0], np.cumsum(widths)])
+    return list(boundaries - boundaries[-1] / 2)
+
+
+# 60 leaf pairs: Varian Millennium 120 (10 x 10mm, 40 x 5mm, 10 x 10mm) and HD120 (14 x 5mm, 32 x 2.5mm, 14 x 5mm)
+MLC_BOUNDARIES = {
+    "millennium": LeafBoundaries([10.0] * 10 + [5.0] * 40 + [10.0] * 10),
+    "hd120": LeafBoundaries([5.0] * 14 + [2.5] * 32 + [5.0] * 14),
+}
+
+# machine names of ApertureMetric/machine_profiles.json
+MLC_MACHINES = {"millennium": "TrueBeamSN1352", "hd120": "TrueBeamSN2716"}
+
+# scenarios of the benchmark suite, name -> make_plan keyword arguments
+SCENARIOS = {
+    "vmat_1arc_90cp": dict(technique="VMAT", beams=1, control_points=90),
+    "vmat_1arc_178cp": dict(technique="VMAT", beams=1, control_points=178),
+    "vmat_1arc_178cp_no_jaw_tracking": dict(technique="VMAT", beams=1, control_points=178, jaw_tracking=False),
+    "vmat_2arc_178cp": dict(technique="VMAT", beams=2, control_points=178),
+    "vmat_2arc_360cp": dict(technique="VMAT", beams=2, control_points=360),
+    "vmat_2arc_178cp_hd120": dict(technique="VMAT", beams=2, control_points=178, mlc="hd120"),
+    "imrt_7beam_10seg": dict(technique="IMRT", beams=7, control_points=20),
+    "imrt_7beam_10seg_hd120": dict(technique="IMRT", beams=7, control_points=20, mlc="hd120"),
+}
+
+
+def SimulateLeafPositions(boundaries: np.ndarray, n_apertures: int, rng: np.random.Generator,
+                          smooth: bool = True) -> np.ndarray:
+    """(n_apertures, Npairs, 2) bank A / bank B positions (mm) of a target of random size and shape.
+
+    Open leaf pairs cover the target rows, their opening follows the target outline plus a smooth (VMAT)
+    or independent (IMRT segments) modulation; the other pairs are closed with a 0.5 mm gap.
+    """
+    centres = (boundaries[:-1] + boundaries[1:]) / 2
+    n_pairs = len(centres)
+    radius_y = rng.uniform(20.0, min(70.0, 0.45 * (boundaries[-1] - boundaries[0])))
+    radius_x = rng.uniform(20.0, 70.0)
+    inside = np.abs(centres) < radius_y
+    outline = radius_x * np.sqrt(np.clip(1 - (centres / radius_y) ** 2, 0, 1))
+
+    positions = np.empty((n_apertures, n_pairs, 2))
+    shift = np.zeros(n_pairs)
+    width = np.ones(n_pairs)
+    for i in range(n_apertures):
+        if smooth:
+            shift = 0.9 * shift + rng.normal(0, 3.0, n_pairs)
+            width = np.clip(0.9 * width + 0.1 + rng.normal(0, 0.08, n_pairs), 0.1, 1.0)
+        else:
+            shift = rng.normal(0, 8.0, n_pairs)
+            width = rng.uniform(0.1, 1.0, n_pairs)
+        half = np.where(inside, outline * width, 0.0)
+        left = np.round(shift - half, 1)
+        right = np.round(shift + half, 1)
+        closed = right - left < 0.5
+        right[closed] = left[closed] + 0.5
+        positions[i, :, 0] = left
+        positions[i, :, 1] = right
+    return positions
+
+
+def JawPositions(positions: np.ndarray, boundaries: np.ndarray, jaw_tracking: bool, margin: float = 5.0) -> np.ndarray:
+    """(n_apertures, 4) X1, X2, Y1, Y2 jaw positions around the open leaves, per aperture or for the whole beam"""
+    opened = positions[:, :, 1] - positions[:, :, 0] > 0.5
+    if not jaw_tracking:
+        opened = np.broadcast_to(opened.any(axis=0), opened.shape)
+
+    jaws = np.empty((len(positions), 4))
+    for i in range(len(positions)):
+        rows = np.flatnonzero(opened[i])
+        if len(rows) == 0:
+            jaws[i] = [-margin, margin, -margin, margin]
+            continue
+        if jaw_tracking:
+            left, right = positions[i, rows, 0].min(), positions[i, rows, 1].max()
+        else:
+            left, right = positions[:, rows, 0].min(), positions[:, rows, 1].max()
+        jaws[i] = [left - margin, right + margin, boundaries[rows[0]] - margin, boundaries[rows[-1] + 1] + margin]
+    return np.round(jaws, 1)
+
+
+def ControlPoint(index: int, gantry_angle: float, weight: float, leaves: np.ndarray, jaws: np.ndarray,
+                 rotation: str, with_jaws: bool) -> Dataset:
+    cp = Dataset()
+    cp.ControlPointIndex = index
+    cp.GantryAngle = round(float(gantry_angle), 1)
+    cp.GantryRotationDirection = rotation
+    cp.CumulativeMetersetWeight = round(float(weight), 6)
+    devices = []
+    if with_jaws:
+        for device, values in [("ASYMX", jaws[:2]), ("ASYMY", jaws[2:])]:
+            d = Dataset()
+            d.RTBeamLimitingDeviceType = device
+            d.LeafJawPositions = [float(v) for v in values]
+            devices.append(d)
+    d = Dataset()
+    d.RTBeamLimitingDeviceType = "MLCX"
+    d.LeafJawPositions = [float(v) for v in np.concatenate([leaves[:, 0], leaves[:, 1]])]
+    devices.append(d)
+    cp.BeamLimitingDevicePositionSequence = Sequence(devices)
+    return cp
+
+
+def MakeBeam(number: int, technique: str, control_points: int, mlc: str, jaw_tracking: bool,
+             rng: np.random.Generator, machine: str) -> Dataset:
+    boundaries = np.asarray(MLC_BOUNDARIES[mlc])
+    beam = Dataset()
+    beam.BeamNumber = number
+    beam.BeamName = "%s%d" % ("ARC" if technique == "VMAT" else "F", number)
+    beam.BeamType = "DYNAMIC" if technique == "VMAT" else "STATIC"
+    beam.RadiationType = "PHOTON"
+    beam.TreatmentMachineName = machine
+    beam.Manufacturer = "Varian Medical Systems"
+    beam.TreatmentDeliveryType = "TREATMENT"
+    beam.PrimaryDosimeterUnit = "MU"
+    beam.NumberOfControlPoints = control_points
+    beam.FinalCumulativeMetersetWeight = 1.0
+
+    devices = []
+    for device in ["ASYMX", "ASYMY"]:
+        d = Dataset()
+        d.RTBeamLimitingDeviceType = device
+        d.NumberOfLeafJawPairs = 1
+        devices.append(d)
+    d = Dataset()
+    d.RTBeamLimitingDeviceType = "MLCX"
+    d.NumberOfLeafJawPairs = len(boundaries) - 1
+    d.LeafPositionBoundaries = [float(v) for v in boundaries]
+    devices.append(d)
+    beam.BeamLimitingDeviceSequence = Sequence(devices)
+
+    if technique == "VMAT":
+        # full arcs, alternating CW / CC, meterset weight increasing at a modulated dose rate
+        direction = "CW" if number % 2 == 1 else "CC"
+        sign = 1 if direction == "CW" else -1
+        angles = (181.0 + sign * np.linspace(0, 358, control_points) + (0 if sign > 0 else -2)) % 360
+        weights = np.concatenate([[0.0], np.cumsum(rng.uniform(0.2, 1.0, control_points - 1))])
+        leaves = SimulateLeafPositions(boundaries, control_points, rng, smooth=True)
+        rotations = [direction] * (control_points - 1) + ["NONE"]
+    else:
+        # step and shoot: each segment is a pair of control points with the same MLC shape
+        segments = control_points // 2
+        angles = np.full(control_points, round(float(rng.choice(np.arange(0, 360, 10))), 1))
+        segment_mu = rng.uniform(0.2, 1.0, segments)
+        weights = np.concatenate([[0.0], np.repeat(np.cumsum(segment_mu), 2)])[:control_points]
+        leaves = np.repeat(SimulateLeafPositions(boundaries, segments, rng, smooth=False), 2, axis=0)
+        rotations = ["NONE"] * control_points
+    weights = weights / weights[-1]
+    jaws = JawPositions(leaves, boundaries, jaw_tracking)
+
+    cps = []
+    for i in range(control_points):
+        cp = ControlPoint(i, angles[i], weights[i], leaves[i], jaws[i], rotations[i], i == 0 or jaw_tracking)
+        if i == 0:
+            cp.NominalBeamEnergy = 6
+            cp.DoseRateSet = 600
+            cp.BeamLimitingDeviceAngle = round(float(rng.uniform(0, 90)), 1) if technique == "VMAT" else 0.0
+            cp.PatientSupportAngle = 0.0
+            cp.TableTopEccentricAngle = 0.0
+            cp.IsocenterPosition = [0.0, 0.0, 0.0]
+        cps.append(cp)
+    beam.ControlPointSequence = Sequence(cps)
+    return beam
+
+
+def make_plan(technique: str = "VMAT", beams: int = 2, control_points: int = 178, mlc: str = "millennium",
+              jaw_tracking: bool = True, seed: int = 0, machine: str = None) -> FileDataset:
+    """Returns a synthetic, anonymous RT Plan dataset (in memory, see plan_bytes)
+
+    :param technique: "VMAT" (full arcs) or "IMRT" (step and shoot, control_points // 2 segments per field)
+    :param beams: number of arcs or fields
+    :param control_points: control points per beam
+    :param mlc: "millennium" or "hd120" leaf boundaries (60 leaf pairs)
+    :param jaw_tracking: jaws follow the open leaves at every control point, or stay fixed for the whole beam
+    :param seed: random seed, a scenario always generates the same plan
+    :param machine: treatment machine name, default MLC_MACHINES[mlc]
+    """
+    rng = np.random.default_rng(seed)
+    machine = machine or MLC_MACHINES[mlc]
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = RT_PLAN_STORAGE
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = FileDataset("synthetic.dcm", {}, file_meta=meta, preamble=b"\0" * 128)
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    ds.SOPClassUID = RT_PLAN_STORAGE
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.StudyInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = generate_uid()
+    ds.Modality = "RTPLAN"
+    ds.PatientName = "Synthetic^Plan"
+    ds.PatientID = "SYN%04d" % seed
+    ds.RTPlanLabel = "%s%d" % (technique, beams)
+    ds.RTPlanName = ds.RTPlanLabel
+    ds.ManufacturerModelName = "Synthetic"
+
+    ds.BeamSequence = Sequence([MakeBeam(n, technique, control_points, mlc, jaw_tracking, rng, machine)
+                                for n in range(1, beams + 1)])
+
+    fraction_group = Dataset()
+    fraction_group.FractionGroupNumber = 1
+    fraction_group.NumberOfFractionsPlanned = 30
+    fraction_group.NumberOfBeams = beams
+    references = []
+    for n in range(1, beams + 1):
+        rb = Dataset()
+        rb.ReferencedBeamNumber = n
+        rb.BeamDose = round(2.0 / beams, 4)
+        rb.BeamMeterset = round(float(rng.uniform(150, 400)) / (1 if technique == "VMAT" else 3), 2)
+        references.append(rb)
+    fraction_group.ReferencedBeamSequence = Sequence(references)
+    ds.FractionGroupSequence = Sequence([fraction_group])
+    return ds
+
+
+def plan_bytes(ds: FileDataset) -> bytes:
+    """Encodes a dataset as a DICOM file, RTPlan reads it back from io.BytesIO without touching the disk"""
+    buffer = io.BytesIO()
+    ds.save_as(buffer, write_like_original=False)
+    return buffer.getvalue()
+
+
+def scenario_plans(names: List[str] = None, seed: int = 0) -> Dict[str, bytes]:
+    """Encoded plans of the benchmark scenarios (all SCENARIOS by default)"""
+    names = names or list(SCENARIOS)
+    return {name: plan_bytes(make_plan(seed=seed, **SCENARIOS[name])) for name in names}
@@ -21,23 +21,42 @@ from ComplexityMetric.SmallApertureScore import SmallApertureScore
 from ComplexityMetric.ProportionMLCSpeedAcceleration import ProportionMLCSpeedAcceleration
 from ComplexityMetric.ModulationIndexScore import ModulationIndexScore
 from ComplexityMetric.StationParameterOptimizedRadiationTherapy import StationParameterOptimizedRadiationTherapy
+from ComplexityMetric.MetricSuite import MetricSuite
+
+
+PLAN_COLUMNS = ['ID', 'Name', 'PlanID', 'MachineID', 'Calculation_Model', 'Prescribed_Dose', 'MU']
+
+# (column name(s), metric, parameters), computed in one pass over the beams by MetricSuite
+METRICS = [
+    ('EDGE_Metric', EdgeMetric()),
+    ('Leaf_Area', LeafArea()),
+    ('Plan_Irregularity', PlanIrregularity()),
+    ('Plan_Modulation', PlanModulation()),
+    ('Modulation_Complexity_Score', ModulationComplexityScore()),
+    (('Small_Aperture_Score_5mm', 'Small_Aperture_Score_10mm', 'Small_Aperture_Score_20mm'),
+     SmallApertureScore(), {'x': [5, 10, 20]}),
+    ('Mean_Field_Area', MeanFieldArea()),
+    ('Mean_Asymmetry_Distance', MeanAsymmetryDistance()),
+    ('Aperture_Area_Ration_Jaw_Area', ApertureAreaRatioJawArea()),
+    ('Aperture_Sub_Regions', ApertureSubRegions()),
+    ('Aperture_X_Jaw_Distance', ApertureXJaw()),
+    ('Aperture_Y_Jaw_Distance', ApertureYJaw()),
+    (('Leaf_Gap_Average', ' Leaf_Gap_Std'), LeafGap()),
+    ('Leaf_Travel', LeafTravel()),
+    ('Converted_Aperture_Metric', ConvertedApertureMetric()),
+    ('Edge_Area_Metric', EdgeAreaMetric()),
+]
 
 
 if __name__ == '__main__':
     pdir = r"D:\RT_Plan\Oncentra"
     filepaths = retrieve_dcm_filenames(pdir, recursive=True)
+    suite = MetricSuite(METRICS)
 
     imrt_path = r".\oncentra.csv"
     with open(imrt_path, 'w') as f:
         writer = csv.writer(f, delimiter=',', lineterminator='\n')
-
-        row = ['ID', 'Name', 'PlanID', 'MachineID', 'Calculation_Model', 'Prescribed_Dose', 'MU', 'EDGE_Metric',
-               'Leaf_Area', 'Plan_Irregularity', 'Plan_Modulation', 'Modulation_Complexity_Score', 'Small_Aperture_Score_5mm',
-               'Small_Aperture_Score_10mm', 'Small_Aperture_Score_20mm', 'Mean_Field_Area', 'Mean_Asymmetry_Distance',
-               'Aperture_Area_Ration_Jaw_Area', 'Aperture_Sub_Regions', 'Aperture_X_Jaw_Distance', 'Aperture_Y_Jaw_Distance',
-               'Leaf_Gap_Average', ' Leaf_Gap_Std', 'Leaf_Travel', 'Converted_Aperture_Metric', 'Edge_Area_Metric']
-
-        writer.writerow(row)
+        writer.writerow(PLAN_COLUMNS + suite.ColumnNames)
 
         for pfile in filepaths:
             print(pfile)
@@ -59,81 +78,11 @@ if __name__ == '__main__':
 
             matches = ["STATIC", "DYNAMIC"]
             if beam_type in matches:
-                edge_metric_obj = EdgeMetric()
-                edge_metric = edge_metric_obj.CalculateForPlan(plan_dict)
-                print("Edge Metric (EM): ", edge_metric)
-
-                leaf_area_obj = LeafArea()
-                leaf_area = leaf_area_obj.CalculateForPlan(plan_dict)
-                print("Mean Leaf Area (MLA): ", leaf_area)
-
-                plan_irregularity_obj = PlanIrregularity()
-                plan_irregularity = plan_irregularity_obj.CalculateForPlan(plan_dict)
-                print("Plan Irregularity (PI): ", plan_irregularity)
-
-                plan_modulation_obj = PlanModulation()
-                plan_modulation = plan_modulation_obj.CalculateForPlan(plan_dict)
-                print("Plan Modulation (PM): ", plan_modulation)
-
-                modulation_complexity_score_obj = ModulationComplexityScore()
-                modulation_complexity_score = modulation_complexity_score_obj.CalculateForPlan(plan_dict)
-                print("Modulation Complexity Score (MCS): ", modulation_complexity_score)
-
-                small_aperture_score_obj = SmallApertureScore()
-                small_aperture_score_5mm = small_aperture_score_obj.CalculateForPlan(plan_dict, x=5)
-                small_aperture_score_10mm = small_aperture_score_obj.CalculateForPlan(plan_dict, x=10)
-                small_aperture_score_20mm = small_aperture_score_obj.CalculateForPlan(plan_dict, x=20)
-                print("Small Aperture Score 5 mm: ", small_aperture_score_5mm)
-                print("Small Aperture Score 10 mm: ", small_aperture_score_10mm)
-                print("Small Aperture Score 20 mm: ", small_aperture_score_20mm)
-
-                mean_field_area_obj = MeanFieldArea()
-                mean_field_area = mean_field_area_obj.CalculateForPlan(plan_dict)
-                print("Mean Field Area: ", mean_field_area)
-
-                mean_asymmetry_distance_obj = MeanAsymmetryDistance()
-                mean_asymmetry_distance = mean_asymmetry_distance_obj.CalculateForPlan(plan_dict)
-                print("Mean Asymmetry Distance: ", mean_asymmetry_distance)
-
-                aperture_ratio_jaw_area_obj = ApertureAreaRatioJawArea()
-                aperture_ratio_jaw_area = aperture_ratio_jaw_area_obj.CalculateForPlan(plan_dict)
-                print("Aperture Area Ratio Jaw Area: ", aperture_ratio_jaw_area)
-
-                aperture_sub_regions_obj = ApertureSubRegions()
-                aperture_sub_regions = aperture_sub_regions_obj.CalculateForPlan(plan_dict)
-                print("Aperture Sub Regions: ", aperture_sub_regions)
-
-                aperture_x_jaw_obj = ApertureXJaw()
-                aperture_x_jaw_distance = aperture_x_jaw_obj.CalculateForPlan(plan_dict)
-                print("Aperture X Jaw: ", aperture_x_jaw_distance)
-                aperture_y_jaw_obj = ApertureYJaw()
-                aperture_y_jaw_distance = aperture_y_jaw_obj.CalculateForPlan(plan_dict)
-                print("Aperture Y Jaw: ", aperture_y_jaw_distance)
-
-                leaf_gap_obj = LeafGap()
-                leaf_gap_average, leaf_gap_std = leaf_gap_obj.CalculateForPlan(plan_dict)
-                print("Leaf Gap Average: ", leaf_gap_average)
-                print("Leaf Gap Std: ", leaf_gap_std)
-
-                leaf_travel_obj = LeafTravel()
-                leaf_travel = leaf_travel_obj.CalculateForPlan(plan_dict)
-                print("Leaf Travel: ", leaf_travel)
-
-                cam_obj = ConvertedApertureMetric()
-                cam = cam_obj.CalculateForPlan(plan_dict)
-                print("Converted Aperture Metric (CAM): ", cam)
-
-                eam_obj = EdgeAreaMetric()
-                eam = eam_obj.CalculateForPlan(plan_dict)
-                print("Edge Area Metric (EAM): ", eam)
-
-                info = [patient_id, patient_name, plan_id, machine_id, calculation_model, prescribed_dose, mu,
-                        edge_metric, leaf_area, plan_irregularity, plan_modulation, modulation_complexity_score,
-                        small_aperture_score_5mm, small_aperture_score_10mm, small_aperture_score_20mm, mean_field_area,
-                        mean_asymmetry_distance, aperture_ratio_jaw_area, aperture_sub_regions, aperture_x_jaw_distance,
-                        aperture_y_jaw_distance, leaf_gap_average, leaf_gap_std, leaf_travel, cam, eam]
+                row = suite.CalculateForPlan(plan_dict)
+                print(row)
 
-                print(info)
+                info = [patient_id, patient_name, plan_id, machine_id, calculation_model, prescribed_dose, mu] + \
+                       list(row.values())
                 writer.writerow(info)
 
             else:
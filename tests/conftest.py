@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from ApertureMetric.BeamApertures import BeamApertures
+from ApertureMetric.BeamContext import BeamContextCache
+from benchmarks.synthetic_plan import SCENARIOS, scenario_plans
+from DicomParse.PlanArrays import ReadPlan
+
+# 6 leaf pairs, tops 25, 15, 5, 0, -5, -15 and bottom -25
+JAW_CASE_WIDTHS = [10.0, 10.0, 5.0, 5.0, 10.0, 10.0]
+
+
+@pytest.fixture(scope="session")
+def scenario_plans_extracted():
+    """Extracted plans of the benchmark scenarios, name -> plan"""
+    return {name: ReadPlan(data) for name, data in scenario_plans().items()}
+
+
+@pytest.fixture(scope="session")
+def scenario_beams(scenario_plans_extracted):
+    """(scenario, beam) of every treatment beam of the benchmark scenarios"""
+    beams = []
+    for name in SCENARIOS:
+        plan = scenario_plans_extracted[name]
+        BeamContextCache.ForPlan(plan)
+        beams.extend((name, beam) for beam in plan["beams"].values()
+                     if beam["TreatmentDeliveryType"] == "TREATMENT")
+    return beams
+
+
+@pytest.fixture(scope="session")
+def jaw_case_apertures():
+    """Hand made apertures going through every jaw branch of LeafPair and Aperture: leaf pairs fully outside the
+    jaws (above, below, behind the left or right jaw), partly outside (jaw edge inside the pair, in x and y),
+    edges equal to the jaw edges, closed pairs, disjoint neighbours and a closed jaw; then random apertures"""
+    jaws = [
+        (-20.0, 12.0, 20.0, -12.0),     # pairs 0 and 5 outside, 1 and 4 cut by the y jaws
+        (-10.0, 15.0, 10.0, -15.0),     # y jaws on the leaf boundaries
+        (-20.0, 3.0, 20.0, 2.0),        # y jaws inside pair 2 only
+        (0.0, 25.0, 0.0, -25.0),        # closed x jaws
+        (-40.0, 40.0, 40.0, -40.0),     # open jaws
+    ]
+    positions = [
+        [(-5, 5), (-30, -22), (3, 3), (-10, 10), (-25, 5), (0, 8)],
+        [(-12, -10), (-10, 12), (-10, -5), (5, 10), (10, 15), (-3, 3)],
+        [(-5, 5), (-5, 5), (-30, 30), (-5, 5), (-5, 5), (-5, 5)],
+        [(-5, 5), (-1, 1), (0, 0), (-5, 5), (-2, 3), (1, 2)],
+        [(0, 0), (2, 2), (-1, -1), (0, 0), (0, 0), (5, 5)],
+    ]
+
+    rng = np.random.default_rng(1)
+    n_random = 200
+    random_left = rng.uniform(-40, 30, (n_random, 6))
+    random_right = random_left + rng.choice([0.0, 0.5, 5.0, 30.0], (n_random, 6))
+    random_jaws = np.stack([rng.uniform(-45, 5, n_random), rng.uniform(-10, 30, n_random),
+                            rng.uniform(-5, 45, n_random), rng.uniform(-30, 10, n_random)], axis=1)
+
+    leaf_positions = np.concatenate([np.array(positions, dtype=float),
+                                     np.stack([random_left, random_right], axis=2)])
+    return BeamApertures(leaf_positions, JAW_CASE_WIDTHS, np.concatenate([jaws, random_jaws]),
+                         np.linspace(0, 359, len(leaf_positions)))
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from ApertureMetric.Aperture import PyAperture
+from ApertureMetric.BeamApertures import BeamApertures
+from ApertureMetric.BeamContext import BeamContextCache
+
+
+def ScalarApertures(apertures: BeamApertures):
+    """PyAperture objects of the same control points, computed by the scalar LeafPair methods"""
+    return [PyAperture(apertures.leaf_positions[i].T.copy(), apertures.leaf_widths, list(apertures.jaws[i]),
+                       float(apertures.gantry_angles[i])) for i in range(apertures.Ncp)]
+
+
+def AssertMatchesScalar(apertures: BeamApertures):
+    scalar = ScalarApertures(apertures)
+    pairs = lambda method: np.array([[getattr(lp, method)() for lp in ap.LeafPairs] for ap in scalar])
+
+    np.testing.assert_array_equal(apertures.IsOutsideJaw(), pairs("IsOutsideJaw"))
+    np.testing.assert_array_equal(apertures.IsOpenBehindJaw(), pairs("IsOpenBehindJaw"))
+    np.testing.assert_allclose(apertures.FieldSize(), pairs("FieldSize"), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(apertures.OpenLeafWidth(), pairs("OpenLeafWidth"), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(apertures.FieldArea(), pairs("FieldArea"), rtol=0, atol=1e-9)
+
+    np.testing.assert_allclose(apertures.Area(), [ap.Area() for ap in scalar], rtol=1e-12, atol=1e-9)
+    np.testing.assert_array_equal(apertures.OpenLeafPairsNumber(), [ap.OpenLeafParisNumber() for ap in scalar])
+    np.testing.assert_array_equal(apertures.HasOpenLeafBehindJaws(), [ap.HasOpenLeafBehindJaws() for ap in scalar])
+    np.testing.assert_array_equal(apertures.ApertureSubRegions(), [ap.ApertureSubRegions() for ap in scalar])
+
+    side = [[ap.SidePerimeter(ap.LeafPairs[i - 1], ap.LeafPairs[i]) for i in range(1, len(ap.LeafPairs))]
+            for ap in scalar]
+    np.testing.assert_allclose(apertures.SidePerimeter(), side, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(apertures.SidePerimeterHorizontal(), [ap.SidePerimeterHorizontal() for ap in scalar],
+                               rtol=1e-12, atol=1e-9)
+    np.testing.assert_allclose(apertures.SidePerimeterVertical(), [ap.SidePerimeterVertical() for ap in scalar],
+                               rtol=1e-12, atol=1e-9)
+
+
+def test_jaw_cases_match_scalar(jaw_case_apertures):
+    apertures = jaw_case_apertures
+    outside = apertures.IsOutsideJaw()
+    field_size = apertures.FieldSize()
+    open_width = apertures.OpenLeafWidth()
+    # every jaw branch is exercised: outside, partly outside in y and in x, closed but inside
+    assert outside.any() and (~outside).any()
+    assert ((open_width > 0) & (open_width < apertures.leaf_widths[None, :])).any()
+    assert ((field_size > 0) & (field_size < apertures.Right - apertures.Left)).any()
+    assert (~outside & (apertures.Right == apertures.Left)).any()
+    assert apertures.HasOpenLeafBehindJaws().any()
+    AssertMatchesScalar(apertures)
+
+
+def test_scenarios_match_scalar(scenario_beams):
+    for name, beam in scenario_beams:
+        AssertMatchesScalar(BeamContextCache.ForBeam(beam).Apertures)
+
+
+def test_from_apertures_round_trip(jaw_case_apertures):
+    rebuilt = BeamApertures.FromApertures(ScalarApertures(jaw_case_apertures))
+    np.testing.assert_array_equal(rebuilt.leaf_positions, jaw_case_apertures.leaf_positions)
+    np.testing.assert_array_equal(rebuilt.jaws, jaw_case_apertures.jaws)
+    np.testing.assert_array_equal(rebuilt.leaf_tops, jaw_case_apertures.leaf_tops)
+    np.testing.assert_array_equal(rebuilt.gantry_angles, jaw_case_apertures.gantry_angles)
+    assert BeamApertures.FromApertures(jaw_case_apertures) is jaw_case_apertures
+
+
+def test_views(jaw_case_apertures):
+    view = jaw_case_apertures[-1]
+    assert view is jaw_case_apertures[len(jaw_case_apertures) - 1]
+    assert view.Area() == pytest.approx(jaw_case_apertures.Area()[-1])
+    with pytest.raises(IndexError):
+        jaw_case_apertures[len(jaw_case_apertures)]
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from ApertureMetric.BeamContext import BeamContextCache
+from ComplexityMetric.BeamFeatures import BEAM_FEATURES, compute_beam_features
+from ComplexityMetric.LeafGap import LeafGap
+from ComplexityMetric.MetricSuite import MetricSuite
+
+pytestmark = pytest.mark.filterwarnings("ignore::RuntimeWarning")   # empty means of the scalar references
+
+METRICS = {metric_name: metric for metric_name, metric, params in MetricSuite(BEAM_FEATURES).metrics
+           for metric_name in MetricSuite.Names(metric_name)}
+
+
+def Scalar(func):
+    """Per aperture scalar reference, NaN where it divides by zero"""
+    def call(aperture):
+        try:
+            return func(aperture)
+        except ZeroDivisionError:
+            return np.nan
+    return call
+
+
+# scalar references of the BEAM_FEATURES columns, aperture -> value
+SCALAR_FEATURES = {
+    "Aperture_Area": lambda ap: ap.Area(),
+    "Leaf_Area": Scalar(METRICS["Leaf_Area"].CalculateApertureLeafGapArea),
+    "EDGE_Metric": Scalar(METRICS["EDGE_Metric"].CalculateApertureEdgeMetric),
+    "Plan_Irregularity": Scalar(METRICS["Plan_Irregularity"].CalculateApertureIrregularity),
+    "Converted_Aperture_Metric": Scalar(METRICS["Converted_Aperture_Metric"].CalculateConvertedApertureMetric),
+    "Edge_Area_Metric": Scalar(METRICS["Edge_Area_Metric"].CalculateEdgeAreaMetric),
+    "Small_Aperture_Score_5mm": Scalar(lambda ap: METRICS["Small_Aperture_Score_5mm"].CalculateSmallApertureScore(ap, 5)),
+    "Small_Aperture_Score_10mm": Scalar(lambda ap: METRICS["Small_Aperture_Score_10mm"].CalculateSmallApertureScore(ap, 10)),
+    "Small_Aperture_Score_20mm": Scalar(lambda ap: METRICS["Small_Aperture_Score_20mm"].CalculateSmallApertureScore(ap, 20)),
+    "Mean_Asymmetry_Distance": Scalar(METRICS["Mean_Asymmetry_Distance"].CalculateMeanAsymmetryDistance),
+    "Aperture_Area_Ratio_Jaw_Area": Scalar(METRICS["Aperture_Area_Ratio_Jaw_Area"].CalculateApertureAreaRatioJawArea),
+    "Aperture_Sub_Regions": lambda ap: ap.ApertureSubRegions(),
+    "Aperture_X_Jaw_Distance": lambda ap: abs(ap.Jaw.Right - ap.Jaw.Left),
+    "Aperture_Y_Jaw_Distance": lambda ap: abs(ap.Jaw.Top - ap.Jaw.Bottom),
+}
+
+
+def ScalarFeatures(apertures, names):
+    columns = []
+    for name in names:
+        if name == "Modulation_Complexity_Score":
+            # normalized by the whole beam
+            columns.append(METRICS[name].CalculatePerApertureReference(list(apertures)))
+        else:
+            columns.append([SCALAR_FEATURES[name](ap) for ap in apertures])
+    return np.array(columns, dtype=float).T
+
+
+def test_scenarios_match_scalar(scenario_beams):
+    for name, beam in scenario_beams:
+        features, names = compute_beam_features(beam)
+        apertures = BeamContextCache.ForBeam(beam).Apertures
+        assert features.shape == (apertures.Ncp, len(names))
+        np.testing.assert_allclose(features, ScalarFeatures(apertures, names), rtol=1e-10, atol=1e-12,
+                                   err_msg=name)
+
+
+def test_jaw_cases_match_scalar(jaw_case_apertures):
+    names = list(SCALAR_FEATURES) + ["Modulation_Complexity_Score"]
+    features = []
+    for name in names:
+        params = {"x": int(name[len("Small_Aperture_Score_"):-2])} if name.startswith("Small_Aperture") else {}
+        features.append(METRICS[name].CalculatePerAperture(jaw_case_apertures, **params))
+    np.testing.assert_allclose(np.array(features, dtype=float).T, ScalarFeatures(jaw_case_apertures, names),
+                               rtol=1e-10, atol=1e-12)
+
+
+def test_only_per_control_point_metrics(scenario_beams):
+    with pytest.raises(ValueError):
+        compute_beam_features(scenario_beams[0][1], [("Leaf_Gap", LeafGap())])
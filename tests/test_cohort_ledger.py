@@ -0,0 +1,64 @@
+import hashlib
+
+import pytest
+
+from benchmarks.synthetic_plan import make_plan, plan_bytes
+from ComplexityMetric.CohortLedger import CohortLedger, run_incremental_cohort
+from ComplexityMetric.LeafArea import LeafArea
+from ComplexityMetric.MeanFieldArea import MeanFieldArea
+
+METRICS = [("Leaf_Area", LeafArea()), ("Mean_Field_Area", MeanFieldArea())]
+
+REWRITE = {}
+
+
+def KeepAll(plan):
+    return True
+
+
+def RewriteDuringCompute(plan):
+    """plan_filter rewriting the plan file while its metrics are calculated"""
+    with open(REWRITE["path"], "wb") as f:
+        f.write(REWRITE["data"])
+    return True
+
+
+@pytest.fixture
+def plan_files(tmp_path):
+    paths = []
+    for seed in range(2):
+        path = tmp_path / ("plan%d.dcm" % seed)
+        path.write_bytes(plan_bytes(make_plan("IMRT", beams=1, control_points=10, seed=seed)))
+        paths.append(str(path))
+    return paths
+
+
+@pytest.mark.parametrize("io_threads", [0, 2])
+def test_ledger_stamp_is_the_calculated_content(tmp_path, plan_files, io_threads):
+    with CohortLedger(str(tmp_path / "ledger.sqlite")) as ledger:
+        records = run_incremental_cohort(plan_files, METRICS, ledger, workers=0, io_threads=io_threads)
+        assert [record["status"] for record in records] == ["ok", "ok"]
+        assert all("file" not in record for record in
+                   run_incremental_cohort(plan_files, METRICS, ledger, workers=0, io_threads=io_threads))
+        for path in plan_files:
+            with open(path, "rb") as f:
+                expected = hashlib.sha1(f.read()).hexdigest()
+            sha1, = ledger.connection.execute("SELECT sha1 FROM ledger WHERE path = ?", (path,)).fetchone()
+            assert sha1 == expected
+
+
+def test_file_rewritten_during_compute_is_calculated_again(tmp_path, plan_files):
+    REWRITE["path"] = plan_files[0]
+    REWRITE["data"] = plan_bytes(make_plan("IMRT", beams=1, control_points=10, seed=5))
+    with CohortLedger(str(tmp_path / "ledger.sqlite")) as ledger:
+        run_incremental_cohort(plan_files[:1], METRICS, ledger, workers=0, plan_filter=RewriteDuringCompute)
+        version, = ledger.connection.execute("SELECT version FROM ledger").fetchone()
+        assert ledger.Get(plan_files[0], version) is None
+
+
+def test_version_holds_plan_filter(tmp_path, plan_files):
+    with CohortLedger(str(tmp_path / "ledger.sqlite")) as ledger:
+        run_incremental_cohort(plan_files, METRICS, ledger, workers=0)
+        run_incremental_cohort(plan_files, METRICS, ledger, workers=0, plan_filter=KeepAll)
+        versions = [version for version, in ledger.connection.execute("SELECT version FROM ledger")]
+        assert all(version.endswith(":%s.KeepAll" % __name__) for version in versions)
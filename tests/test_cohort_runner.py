@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+from benchmarks.synthetic_plan import make_plan, plan_bytes
+from ComplexityMetric.CohortRunner import iter_cohort, run_cohort
+from ComplexityMetric.EdgeMetric import EdgeMetric
+from ComplexityMetric.LeafGap import LeafGap
+
+METRICS = [("EDGE_Metric", EdgeMetric()), (("Leaf_Gap_Average", "Leaf_Gap_Std"), LeafGap())]
+
+
+@pytest.fixture(scope="module")
+def plan_files(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("plans")
+    paths = []
+    for seed in range(5):
+        path = directory / ("plan%d.dcm" % seed)
+        path.write_bytes(plan_bytes(make_plan("IMRT", beams=1, control_points=10, seed=seed)))
+        paths.append(str(path))
+    paths.insert(2, str(directory / "missing.dcm"))
+    return paths
+
+
+def Summary(records):
+    return [(r["path"], r["status"], r["error"].split(":")[0], r["metrics"]) for r in records]
+
+
+@pytest.mark.parametrize("kwargs", [
+    dict(workers=2, chunksize=3),
+    dict(workers=2, chunksize=3, io_threads=2, prefetch=2),
+    dict(workers=2, chunksize=2, io_threads=2, prefetch=2, max_tasks_per_child=1),
+    dict(workers=0, io_threads=2, prefetch=2),
+])
+def test_modes_give_the_records_in_order(plan_files, kwargs):
+    expected = Summary(run_cohort(plan_files, METRICS, workers=0))
+    assert [status for _, status, _, _ in expected] == ["ok", "ok", "error", "ok", "ok", "ok"]
+    assert Summary(run_cohort(plan_files, METRICS, **kwargs)) == expected
+
+
+def Consume(records, timeout=30):
+    """List of the records and the exception raised, in a thread so that a hang fails the test"""
+    result = {"records": [], "error": None}
+
+    def consume():
+        try:
+            for record in records:
+                result["records"].append(record)
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "the consumer hangs"
+    return result["records"], result["error"]
+
+
+def FailingPaths(paths):
+    yield from paths
+    raise RuntimeError("listing failed")
+
+
+@pytest.mark.parametrize("paths, error", [
+    (lambda plan_files: [plan_files[0], "plan\0.dcm"], ValueError),     # open() raises ValueError
+    (lambda plan_files: FailingPaths(plan_files[:2]), RuntimeError),
+])
+def test_parse_stage_failure_reaches_consumer(plan_files, paths, error):
+    records, raised = Consume(iter_cohort(paths(plan_files), METRICS, workers=0, io_threads=2, prefetch=1))
+    assert isinstance(raised, error)
+    assert records[0]["status"] == "ok"
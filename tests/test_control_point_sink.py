@@ -0,0 +1,118 @@
+import io
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic_plan import make_plan, plan_bytes
+from ComplexityMetric.ControlPointSink import (CONTROL_POINT_COLUMNS, ControlPointColumns, ControlPointSink,
+                                               IterControlPointBatches, IterPlanRows, PlanRows)
+from ComplexityMetric.EdgeMetric import EdgeMetric
+from ComplexityMetric.LeafGap import LeafGap
+from ComplexityMetric.MetricSuite import MetricSuite
+from ComplexityMetric.SmallApertureScore import SmallApertureScore
+from DicomParse.PlanArrays import ReadPlan
+from DicomParse.dicomrt import RTPlan
+
+SUITE = MetricSuite([("EDGE_Metric", EdgeMetric()),
+                     (("SAS_5mm", "SAS_10mm"), SmallApertureScore(), {"x": [5, 10]}),
+                     (("Leaf_Gap_Average", "Leaf_Gap_Std"), LeafGap())])
+
+# control point of beam 1 without BeamLimitingDevicePositionSequence, it has no aperture
+MISSING_CP = 3
+
+
+@pytest.fixture(scope="module")
+def plan_data():
+    ds = make_plan("IMRT", beams=2, control_points=10)
+    del ds.BeamSequence[0].ControlPointSequence[MISSING_CP].BeamLimitingDevicePositionSequence
+    return plan_bytes(ds)
+
+
+@pytest.mark.parametrize("extracted", [False, True])
+def test_rows_are_aperture_control_points(plan_data, extracted):
+    plan = ReadPlan(plan_data) if extracted else RTPlan(io.BytesIO(plan_data)).get_plan()
+    columns = ControlPointColumns(plan, SUITE, "plan.dcm")
+    assert list(columns) == CONTROL_POINT_COLUMNS + ["EDGE_Metric", "SAS_5mm", "SAS_10mm"]
+    assert len({len(values) for values in columns.values()}) == 1
+
+    beam_1 = columns["Beam"] == 1
+    assert list(columns["ControlPoint"][beam_1]) == [i for i in range(10) if i != MISSING_CP]
+    assert list(columns["ControlPoint"][~beam_1]) == list(range(10))
+
+    beam = plan["beams"][1]
+    metersets = np.asarray(SUITE.GetWeightsBeam(beam))
+    angles = np.asarray(SUITE.GetGantryAngleBeam(beam))
+    np.testing.assert_array_equal(columns["MUWeight"][beam_1], np.delete(metersets, MISSING_CP))
+    np.testing.assert_array_equal(columns["GantryAngle"][beam_1], np.delete(angles, MISSING_CP))
+    np.testing.assert_array_equal(columns["EDGE_Metric"][beam_1], EdgeMetric().GetMetricsBeam(beam))
+
+
+def test_no_control_point_metric(plan_data):
+    columns = ControlPointColumns(ReadPlan(plan_data), MetricSuite([(("Average", "Std"), LeafGap())]))
+    assert list(columns) == CONTROL_POINT_COLUMNS
+    assert all(len(values) == 0 for values in columns.values())
+
+
+@pytest.fixture(scope="module")
+def cohort(plan_data):
+    """(path, plan) of intact plans, then of the plan with a control point without aperture"""
+    plans = [("plan%d.dcm" % seed, ReadPlan(plan_bytes(make_plan("VMAT", beams=2, control_points=30, seed=seed))))
+             for seed in range(3)]
+    return plans + [("missing.dcm", ReadPlan(plan_data))]
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+@pytest.mark.parametrize("batch_size", [7, 50])
+def test_sink_round_trip(tmp_path, cohort, format, batch_size):
+    pytest.importorskip("pyarrow")
+    filename = str(tmp_path / ("cp." + format))
+    columns = [ControlPointColumns(plan, SUITE, path) for path, plan in cohort]
+    with ControlPointSink(filename, SUITE.ControlPointColumnNames, format=format, row_group_size=37) as sink:
+        for plan_columns in columns:
+            sink.Write(plan_columns)
+    n_rows = sum(len(plan_columns["Beam"]) for plan_columns in columns)
+    assert sink.rows == n_rows
+
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        metadata = pq.ParquetFile(filename).metadata
+        sizes = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+        assert sizes == [37] * (n_rows // 37) + ([n_rows % 37] if n_rows % 37 else [])
+
+    batches = list(IterControlPointBatches(filename, batch_size=batch_size))
+    for column in sink.columns:
+        expected = np.concatenate([plan_columns[column] for plan_columns in columns])
+        np.testing.assert_array_equal(np.concatenate([batch[column] for batch in batches]), expected)
+
+    # plan rows carried over the batches are the ones of the whole file
+    whole = {column: np.concatenate([plan_columns[column] for plan_columns in columns]) for column in sink.columns}
+    rows = list(IterPlanRows(filename, batch_size=batch_size))
+    assert rows == PlanRows(whole, SUITE.ControlPointColumnNames)
+    assert [row["Path"] for row in rows] == [path for path, plan in cohort]
+
+
+def test_plan_rows_of_intact_plans_match_calculate_for_plan(cohort):
+    for path, plan in cohort[:-1]:
+        row = PlanRows(ControlPointColumns(plan, SUITE, path), SUITE.ControlPointColumnNames)[0]
+        expected = SUITE.CalculateForPlan(plan)
+        assert {column: row[column] for column in SUITE.ControlPointColumnNames} == \
+            {column: expected[column] for column in SUITE.ControlPointColumnNames}
+
+
+def test_plan_rows_weight_the_aperture_control_points(cohort):
+    path, plan = cohort[-1]
+    row = PlanRows(ControlPointColumns(plan, SUITE, path), SUITE.ControlPointColumnNames)[0]
+    # each aperture with the meterset of its own control point, over the control points with an aperture
+    beams = [beam for beam in plan["beams"].values() if beam["TreatmentDeliveryType"] == "TREATMENT"]
+    beam_values = []
+    for beam in beams:
+        control_points = SUITE.GetBeamContext(beam).Apertures.control_points
+        weights = np.asarray(SUITE.GetWeightsBeam(beam), dtype=float)[control_points]
+        values = SUITE.GetMetricsBeam(beam)
+        beam_values.append(np.nansum(weights * values, axis=1) / np.sum(weights))
+    beam_mu = np.array([beam["MU"] for beam in beams])
+    expected = beam_mu @ np.array(beam_values) / np.sum(beam_mu)
+    assert [row[column] for column in SUITE.ControlPointColumnNames] == [round(float(v), 2) for v in expected]
+    # CalculateForPlan pairs the apertures with the metersets by position, see PlanRows
+    plan_row = SUITE.CalculateForPlan(plan)
+    assert any(row[column] != plan_row[column] for column in SUITE.ControlPointColumnNames)
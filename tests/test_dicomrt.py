@@ -0,0 +1,26 @@
+import pytest
+
+from DicomParse.dicomrt import classify_plan
+
+
+def PeekInfo(**tags):
+    info = {"modality": "RTPLAN", "label": "", "beam_type": "DYNAMIC", "radiation_type": "PHOTON",
+            "rotation_direction": "", "control_points": 2, "beam_number": 1}
+    info.update(tags)
+    return info
+
+
+@pytest.mark.parametrize("tags, plan_class", [
+    (dict(rotation_direction="CW", control_points=178), "VMAT"),
+    (dict(rotation_direction="CC", beam_type="STATIC", control_points=178), "VMAT"),
+    # arcs are VMAT whatever the label
+    (dict(rotation_direction="CW", label="CRT_ARC", control_points=178), "VMAT"),
+    (dict(label="3DCRT", beam_type="STATIC", control_points=20), "3DCRT"),
+    (dict(beam_type="STATIC", control_points=20), "IMRT"),
+    (dict(beam_type="STATIC", control_points=2), "3DCRT"),
+    (dict(radiation_type="ELECTRON", rotation_direction="CW"), "ELECTRON"),
+    (dict(beam_number=0), "NO_BEAM"),
+    (dict(modality="RTDOSE"), "NOT_RTPLAN"),
+])
+def test_classify_plan(tags, plan_class):
+    assert classify_plan(PeekInfo(**tags)) == plan_class
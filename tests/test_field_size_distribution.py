@@ -0,0 +1,47 @@
+import numpy as np
+
+from ApertureMetric.BeamContext import BeamContextCache
+from ApertureMetric.FieldSizeDistribution import FieldSizeDistribution
+from ComplexityMetric.LeafGap import LeafGap
+from ComplexityMetric.SmallApertureScore import SmallApertureScore
+
+
+def ScalarScore(aperture, x):
+    try:
+        return SmallApertureScore().CalculateSmallApertureScore(aperture, x)
+    except ZeroDivisionError:
+        return np.nan   # no open leaf pair
+
+
+def AssertMatchesScalar(apertures):
+    distribution = FieldSizeDistribution(apertures)
+    field_sizes = [[lp.FieldSize() for lp in ap.LeafPairs if not lp.IsOutsideJaw()] for ap in apertures]
+
+    # round thresholds and thresholds equal to field sizes of the beam (strict comparison)
+    thresholds = [0.5, 5.0, 10.0, 20.0] + list(distribution.sizes[::max(len(distribution.sizes) // 5, 1)])
+    expected = [[sum(fs < x for fs in sizes) for x in thresholds] for sizes in field_sizes]
+    np.testing.assert_array_equal(distribution.CountBelow(thresholds), expected)
+    np.testing.assert_array_equal(distribution.CountBelow(5.0), [row[1] for row in expected])
+
+    for x in [5.0, [5.0, 10.0, 20.0]]:
+        scalar = [[ScalarScore(ap, v) for v in np.atleast_1d(x)] for ap in apertures]
+        np.testing.assert_allclose(np.reshape(distribution.SmallApertureScore(x), (len(apertures), -1)), scalar)
+
+    np.testing.assert_array_equal(distribution.LeafGaps(), LeafGap().CalculatePerApertureReference(apertures))
+
+    edges = [0.0, 2.0, 5.0, 10.0, 40.0]
+    per_cp = [np.histogram(sizes, bins=edges)[0] for sizes in field_sizes]
+    # np.histogram closes the last bin on the right
+    for row, sizes in zip(per_cp, field_sizes):
+        row[-1] -= sum(fs == edges[-1] for fs in sizes)
+    np.testing.assert_array_equal(distribution.Histogram(edges, per_control_point=True), per_cp)
+    np.testing.assert_array_equal(distribution.Histogram(edges), np.sum(per_cp, axis=0))
+
+
+def test_jaw_cases_match_scalar(jaw_case_apertures):
+    AssertMatchesScalar(jaw_case_apertures)
+
+
+def test_scenarios_match_scalar(scenario_beams):
+    for name, beam in scenario_beams:
+        AssertMatchesScalar(BeamContextCache.ForBeam(beam).Apertures)
@@ -0,0 +1,86 @@
+import io
+
+import numpy as np
+import pytest
+
+from ApertureMetric.BeamContext import BeamContextCache
+from ApertureMetric.FluenceMap import FluenceMap
+from benchmarks.synthetic_plan import make_plan, plan_bytes
+from DicomParse.PlanArrays import ReadPlan
+from DicomParse.dicomrt import RTPlan
+
+# control point of beam 1 without BeamLimitingDevicePositionSequence, it has no aperture
+MISSING_CP = 3
+
+
+def RasterizeReference(apertures, metersets, fluence_map):
+    """Pixel by pixel coverage of the open leaf pair rectangles of the scalar apertures, on the grid of the map"""
+    x_min, x_max, y_min, y_max = fluence_map.extent
+    ny, nx = fluence_map.shape
+    xe = x_min + fluence_map.resolution * np.arange(nx + 1)
+    ye = y_min + fluence_map.resolution * np.arange(ny + 1)
+    reference = np.zeros((ny, nx))
+    for aperture, meterset in zip(apertures, metersets):
+        for lp in aperture.LeafPairs:
+            if lp.IsOutsideJaw():
+                continue
+            left, right = max(lp.Left, lp.Jaw.Left), min(lp.Right, lp.Jaw.Right)
+            bottom, top = max(lp.Bottom, lp.Jaw.Bottom), min(lp.Top, lp.Jaw.Top)
+            if right <= left or top <= bottom:
+                continue
+            covered_x = np.clip(np.minimum(right, xe[1:]) - np.maximum(left, xe[:-1]), 0.0, None)
+            covered_y = np.clip(np.minimum(top, ye[1:]) - np.maximum(bottom, ye[:-1]), 0.0, None)
+            reference += meterset * np.outer(covered_y, covered_x) / fluence_map.resolution ** 2
+    return reference
+
+
+@pytest.mark.parametrize("resolution, extent", [
+    (1.0, None),
+    (2.5, None),
+    (2.0, (-15.0, 17.0, -12.0, 8.0)),       # cuts the openings
+    (0.7, (-33.3, 41.2, -26.9, 30.1)),      # edges off the leaf and jaw positions
+])
+def test_jaw_cases_match_rasterizer(jaw_case_apertures, resolution, extent):
+    metersets = np.random.default_rng(3).uniform(0, 2, jaw_case_apertures.Ncp)
+    fluence_map = FluenceMap.FromApertures(jaw_case_apertures, metersets, resolution, extent)
+    assert fluence_map.fluence.max() > 0
+    if extent is not None:
+        assert fluence_map.extent[::2] == extent[::2]
+    np.testing.assert_allclose(fluence_map.fluence, RasterizeReference(jaw_case_apertures, metersets, fluence_map),
+                               rtol=1e-9, atol=1e-9)
+
+
+def test_scenarios_match_rasterizer(scenario_beams):
+    scenarios = {}
+    for name, beam in scenario_beams:
+        scenarios.setdefault(name, beam)    # first beam of every scenario
+    for name, beam in scenarios.items():
+        context = BeamContextCache.ForBeam(beam)
+        fluence_map = FluenceMap.FromBeam(beam, resolution=2.5)
+        reference = RasterizeReference(context.Apertures, context.Metersets, fluence_map)
+        np.testing.assert_allclose(fluence_map.fluence, reference, rtol=1e-9, atol=1e-9 * reference.max(),
+                                   err_msg=name)
+
+
+def test_metersets_must_match_the_apertures(jaw_case_apertures):
+    with pytest.raises(ValueError):
+        FluenceMap.FromApertures(jaw_case_apertures, np.ones(jaw_case_apertures.Ncp + 1))
+
+
+@pytest.mark.parametrize("extracted", [False, True])
+def test_control_point_without_aperture(extracted):
+    ds = make_plan("IMRT", beams=1, control_points=10)
+    intact = ReadPlan(plan_bytes(ds))["beams"][1]
+    del ds.BeamSequence[0].ControlPointSequence[MISSING_CP].BeamLimitingDevicePositionSequence
+    data = plan_bytes(ds)
+    beam = (ReadPlan(data) if extracted else RTPlan(io.BytesIO(data)).get_plan())["beams"][1]
+
+    fluence_map = FluenceMap.FromBeam(beam, resolution=2.5)
+    # every other control point deposits its own MU
+    context = BeamContextCache.ForBeam(intact)
+    metersets = np.array(context.Metersets, dtype=float)
+    metersets[MISSING_CP] = 0.0
+    assert np.count_nonzero(np.diff(metersets)) > 0
+    reference = RasterizeReference(context.Apertures, metersets, fluence_map)
+    assert reference.max() > 0
+    np.testing.assert_allclose(fluence_map.fluence, reference, rtol=1e-9, atol=1e-9 * reference.max())
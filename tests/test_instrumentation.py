@@ -0,0 +1,76 @@
+import subprocess
+import sys
+
+import pytest
+
+from ApertureMetric.Instrumentation import (DisableTiming, EnableTiming, PlanControlPoints, PlanLabel, Timed,
+                                            Timing)
+from benchmarks.synthetic_plan import scenario_plans
+from ComplexityMetric.EdgeMetric import EdgeMetric
+from ComplexityMetric.LeafGap import LeafGap
+from ComplexityMetric.MetricSuite import MetricSuite
+from ComplexityMetric.PlanIrregularity import PlanIrregularity
+from DicomParse.PlanArrays import ReadPlan
+
+
+def test_aperture_and_dicom_layers_do_not_import_metrics():
+    code = ("import sys, ApertureMetric.ApertureCreator, DicomParse.dicomrt, DicomParse.PlanArrays; "
+            "print([m for m in sys.modules if m.startswith('ComplexityMetric')])")
+    output = subprocess.check_output([sys.executable, "-W", "ignore", "-c", code], universal_newlines=True)
+    assert output.strip().splitlines()[-1] == "[]"
+
+
+
+@pytest.fixture
+def plan():
+    """Fresh plan, without the beam contexts built by the other tests"""
+    return ReadPlan(scenario_plans()["vmat_1arc_90cp"])
+
+
+def Stats(recorder):
+    return {(s["stage"], s["name"]): s for s in recorder.ToDict()["stats"]}
+
+
+def test_suite_metrics_are_timed_one_by_one(plan):
+    suite = MetricSuite([("EDGE_Metric", EdgeMetric()), ("PI", PlanIrregularity()),
+                         (("Leaf_Gap_Average", "Leaf_Gap_Std"), LeafGap())])
+    with Timing() as recorder:
+        suite.CalculateForPlan(plan)
+    stats = Stats(recorder)
+    control_points = PlanControlPoints(plan)
+    for name in ["EdgeMetric", "PlanIrregularity"]:
+        assert stats["metric.cp", name]["calls"] == len(plan["beams"])
+        assert stats["metric.cp", name]["control_points"] == control_points
+    assert stats["metric.plan", "LeafGap"]["calls"] == 1
+    assert stats["metric.plan", "MetricSuite"]["control_points"] == control_points
+    # the beam apertures are built once, by the first metric, and shared by the others
+    assert stats["apertures", "AperturesFromBeamCreator.Create"]["apertures"] == control_points
+
+    # plan time is the one of the outermost call, not the sum of the nested metric calls
+    plans = recorder.ToDict()["plans"]
+    assert [p["plan"] for p in plans] == [PlanLabel(plan)]
+    assert plans[0]["wall"] == stats["metric.plan", "MetricSuite"]["wall"]
+
+    table = recorder.Table()
+    assert table.splitlines()[0].split()[:3] == ["stage", "name", "calls"]
+    assert any(line.split()[:3] == ["metric.cp", "EdgeMetric", str(len(plan["beams"]))] for line in table.splitlines())
+    assert table.splitlines()[-1].split()[0] == PlanLabel(plan)
+
+
+def test_timing_is_restored_after_the_block():
+    @Timed("test", counts=lambda args, result: {"control_points": result})
+    def stage(n):
+        return n
+
+    outer = EnableTiming()
+    try:
+        with Timing() as inner:
+            stage(3)
+        stage(4)
+    finally:
+        DisableTiming()
+    stage(5)
+    assert inner is not outer
+    assert [(s["name"].split(".")[-1], s["calls"], s["control_points"]) for s in inner.ToDict()["stats"]] == \
+        [("stage", 1, 3)]
+    assert [(s["calls"], s["control_points"]) for s in outer.ToDict()["stats"]] == [(1, 4)]
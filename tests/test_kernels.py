@@ -0,0 +1,56 @@
+import importlib.util
+import sys
+
+import numpy as np
+import pytest
+
+from ApertureMetric.BeamContext import BeamContextCache
+from ApertureMetric.Kernels import BACKEND_ENV, GetKernels, LoadKernels, NumpyKernels, SetKernels
+from ComplexityMetric.StationParameterOptimizedRadiationTherapy import StationParameterOptimizedRadiationTherapy
+
+
+def KernelResults(cases):
+    """SidePerimeter, ApertureSubRegions and SPORT of every (apertures, metersets) case, with the selected kernels"""
+    sport = StationParameterOptimizedRadiationTherapy()
+    return [(apertures.SidePerimeter(), apertures.ApertureSubRegions(),
+             np.array(sport.CalculatePerAperture(apertures, metersets))) for apertures, metersets in cases]
+
+
+@pytest.fixture(scope="module")
+def cases(scenario_beams, jaw_case_apertures):
+    cases = [(BeamContextCache.ForBeam(beam).Apertures, BeamContextCache.ForBeam(beam).CumulativeMetersets)
+             for name, beam in scenario_beams]
+    # static gantry pairs (same angle) are skipped by SPORT
+    jaw_case_metersets = np.cumsum(np.random.default_rng(2).uniform(0, 1, jaw_case_apertures.Ncp))
+    return cases + [(jaw_case_apertures, jaw_case_metersets)]
+
+
+@pytest.fixture(scope="module")
+def numpy_results(cases):
+    SetKernels("numpy")
+    try:
+        return KernelResults(cases)
+    finally:
+        SetKernels(None)
+
+
+@pytest.mark.parametrize("backend", ["numpy", pytest.param("numba", marks=pytest.mark.skipif(
+    importlib.util.find_spec("numba") is None, reason="numba is not installed"))])
+def test_backends_give_the_same_results(cases, numpy_results, backend):
+    SetKernels(backend)
+    try:
+        assert GetKernels().name == backend
+        results = KernelResults(cases)
+    finally:
+        SetKernels(None)
+    for result, expected in zip(results, numpy_results):
+        for values, expected_values in zip(result, expected):
+            np.testing.assert_allclose(values, expected_values, rtol=1e-12, atol=1e-12)
+
+
+def test_numba_falls_back_to_numpy(monkeypatch):
+    monkeypatch.setitem(sys.modules, "numba", None)     # import numba raises ImportError
+    monkeypatch.setenv(BACKEND_ENV, "numba")
+    with pytest.warns(UserWarning, match="numba is not installed"):
+        kernels = LoadKernels()
+    assert isinstance(kernels, NumpyKernels)
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from ApertureMetric.BeamApertures import BeamApertures
+from ApertureMetric.BeamContext import BeamContextCache
+from ComplexityMetric.LeafTravel import LeafTravel
+from ComplexityMetric.PlanModulation import PlanModulation
+
+
+def Subsets(apertures):
+    """The hand made jaw cases one by one and together, all the apertures, then a beam with every leaf pair
+    above the y jaws"""
+    cases = [[i] for i in range(5)] + [list(range(5)), list(range(apertures.Ncp))]
+    subsets = [BeamApertures.FromApertures([apertures[i] for i in case]) for case in cases]
+    closed = BeamApertures(np.full((2, apertures.Npairs, 2), [-5.0, 5.0]), apertures.leaf_widths,
+                           [(-20.0, 40.0, 20.0, 30.0)] * 2, [0, 90])
+    assert closed.IsOutsideJaw().all()
+    return subsets + [closed]
+
+
+@pytest.fixture
+def apertures_as_beam(monkeypatch):
+    """PlanModulation takes the apertures given as beam"""
+    monkeypatch.setattr(PlanModulation, "GetBeamContext", staticmethod(lambda beam: SimpleNamespace(Apertures=beam)))
+
+
+def test_leaf_travel_scenarios_match_scalar(scenario_beams):
+    for name, beam in scenario_beams:
+        apertures = BeamContextCache.ForBeam(beam).Apertures
+        np.testing.assert_allclose(LeafTravel().CalculatePerAperture(apertures),
+                                   LeafTravel().CalculatePerApertureReference(apertures), err_msg=name)
+
+
+def test_leaf_travel_jaw_cases_match_scalar(jaw_case_apertures):
+    for apertures in Subsets(jaw_case_apertures):
+        np.testing.assert_allclose(LeafTravel().CalculatePerAperture(apertures),
+                                   LeafTravel().CalculatePerApertureReference(apertures))
+
+
+def test_union_area_scenarios_match_scalar(scenario_beams):
+    for name, beam in scenario_beams:
+        metric = PlanModulation()
+        assert metric.CalculateBeamUnionArea(beam) == pytest.approx(metric.CalculateBeamUnionAreaReference(beam),
+                                                                     rel=1e-12), name
+
+
+@pytest.mark.usefixtures("apertures_as_beam")
+def test_union_area_jaw_cases_match_scalar(jaw_case_apertures):
+    metric = PlanModulation()
+    for apertures in Subsets(jaw_case_apertures):
+        assert metric.CalculateBeamUnionArea(apertures) == pytest.approx(
+            metric.CalculateBeamUnionAreaReference(apertures), rel=1e-12)
@@ -0,0 +1,94 @@
+import json
+
+import numpy as np
+import pytest
+
+from ApertureMetric.BeamApertures import BeamApertures
+from ApertureMetric.MachineProfile import PROFILES_ENV, GetMachineProfile, GetMachineRegistry, SetMachineRegistry
+from ApertureMetric.MLCAttributes import MLCAttributes
+
+ELEKTA_MACHINE = "2776"
+
+
+@pytest.fixture
+def elekta():
+    profile = GetMachineProfile(ELEKTA_MACHINE)
+    assert profile.delivery_model == "discrete_dose_rate"
+    return profile
+
+
+@pytest.fixture
+def registry():
+    """Process registry loaded again by the test, restored after it"""
+    SetMachineRegistry(None)
+    yield
+    SetMachineRegistry(None)
+
+
+def test_discrete_dose_rate_hand_cases(elekta):
+    # 10 MU over 6, 12 and 9 deg at 6 deg/s: 600 MU/min fits in 1 s, 300 MU/min in 2 s, 400 MU/min is not a level
+    times = elekta.ControlPointTimes([np.nan, 10.0, 10.0, 10.0], [np.nan, 6.0, 12.0, 9.0], [0.0, 0.0, 0.0, 0.0],
+                                     dose_rate_set=600)
+    np.testing.assert_allclose(times, [np.nan, 1.0, 2.0, 2.0])
+    # 50 mm at 20 mm/s takes 2.5 s, 240 MU/min is not a level: 10 MU at 150 MU/min
+    assert elekta.ControlPointTimes([10.0], [6.0], [50.0], dose_rate_set=600)[0] == pytest.approx(4.0)
+    # the planned dose rate caps the levels
+    assert elekta.ControlPointTimes([10.0], [6.0], [0.0], dose_rate_set=300)[0] == pytest.approx(2.0)
+
+
+def test_discrete_dose_rate_matches_brute_force(elekta):
+    rng = np.random.default_rng(4)
+    n = 500
+    delta_mu = rng.choice([0.0, 0.01, 0.5, 2.0, 10.0], n) * rng.uniform(0.5, 1.5, n)
+    delta_gantry = rng.choice([0.0, 1.0, 2.0, 4.0], n)
+    leaf_travel = rng.choice([0.0, 1.0, 5.0, 20.0], n)
+    for dose_rate_set in [600, 300, 100]:
+        times = elekta.ControlPointTimes(delta_mu, delta_gantry, leaf_travel, dose_rate_set=dose_rate_set)
+
+        gantry_time = delta_gantry / elekta.max_gantry_speed
+        mlc_time = leaf_travel / elekta.max_mlc_speed
+        assert np.all(times >= gantry_time - 1e-12) and np.all(times >= mlc_time - 1e-12)
+
+        levels = [level / 60 for level in elekta.dose_rates if level <= dose_rate_set]
+        for i in range(n):
+            min_time = max(gantry_time[i], mlc_time[i])
+            # MU at the highest level that does not make the control point shorter than the gantry and MLC limits
+            fitting = [level for level in levels if delta_mu[i] / level >= min_time]
+            level = max(fitting) if fitting else min(levels)
+            assert times[i] == pytest.approx(max(min_time, delta_mu[i] / level), rel=1e-12, abs=1e-12)
+
+
+def Attributes(machine, cumulative_mu, leaf_positions, gantry_angles):
+    apertures = BeamApertures(np.asarray(leaf_positions, dtype=float), [10.0, 10.0],
+                              [(-50.0, 10.0, 50.0, -10.0)] * len(gantry_angles), gantry_angles)
+    return MLCAttributes(list(apertures), cumulative_mu, machine, 600, 360.0)
+
+
+def test_no_motion_and_no_mu_gives_nan_speeds():
+    still = [[(-5.0, 5.0), (-5.0, 5.0)]] * 3
+    attributes = Attributes(ELEKTA_MACHINE, [0.0, 0.0, 0.0], still, [0.0, 0.0, 0.0])
+    for values in [attributes.mlc_speed, attributes.mlc_acc, attributes.gantry_speed, attributes.dose_rates]:
+        assert np.isnan(values).all()
+    assert np.isnan(attributes.MLCSpeedAvg())
+
+
+def test_unknown_machine_warns():
+    still = [[(-5.0, 5.0), (-5.0, 5.0)]] * 3
+    with pytest.warns(UserWarning, match="UNKNOWN-LINAC"):
+        attributes = Attributes("UNKNOWN-LINAC", [0.0, 1.0, 2.0], still, [0.0, 2.0, 4.0])
+    assert np.isnan(attributes.time).all()
+    assert np.isnan(attributes.mlc_speed).all()
+
+
+@pytest.mark.usefixtures("registry")
+def test_profiles_from_environment(tmp_path, monkeypatch, elekta):
+    profile = {"name": "Test linac", "machines": ["TEST-LINAC"], "delivery_model": "discrete_dose_rate",
+               "max_gantry_speed": 3.0, "dose_rates": [100, 400], "max_mlc_speed": 10.0}
+    filename = tmp_path / "profiles.json"
+    filename.write_text(json.dumps({"profiles": [profile]}))
+    monkeypatch.setenv(PROFILES_ENV, str(filename))
+    SetMachineRegistry(None)
+
+    assert len(GetMachineRegistry()) == 1
+    assert GetMachineProfile("TEST-LINAC").max_gantry_speed == 3.0
+    assert ELEKTA_MACHINE not in GetMachineRegistry()
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from ApertureMetric.BeamContext import BeamContextCache
+
+pd = pytest.importorskip("pandas")
+
+
+def DeltaGantry(alpha, beta):
+    phi = abs(beta - alpha) % 360
+    return 360 - phi if phi > 180 else phi
+
+
+def PandasReference(attributes, cumulative_mu):
+    """Kinematics computed as the former pandas implementation, control point by control point"""
+    positions = pd.DataFrame([np.ravel([(lp.Left, lp.Right) for lp in ap.LeafPairs]) for ap in attributes.apertures])
+    time = pd.Series(cumulative_mu).diff().abs().apply(attributes.calculate_time)
+    speed = (positions.diff().abs().T / time).T
+    acc = (speed.diff().abs().T / time).T
+
+    angles = [ap.GantryAngle for ap in attributes.apertures]
+    delta_gantry = pd.Series([np.nan] + [DeltaGantry(a, b) for a, b in zip(angles[:-1], angles[1:])])
+    gantry_speed = delta_gantry / time
+    dose_rate = pd.Series(cumulative_mu).diff().abs() / time
+    return {
+        "time": time, "mlc_speed": speed, "mlc_speed_std": speed.std(), "mlc_acc": acc, "mlc_acc_std": acc.std(),
+        "delta_gantry_angle": delta_gantry, "gantry_speed": gantry_speed,
+        "gantry_acc": gantry_speed.diff().abs() / time, "dose_rates": dose_rate,
+        "delta_dose_rate": dose_rate.diff().abs(),
+        "MLCSpeedAvg": np.mean(speed.replace(0, np.nan).mean()),
+        "MLCSpeedStdAvg": np.mean(speed.std().replace(0, np.nan).mean()),
+        "MLCAccAvg": np.mean(acc.replace(0, np.nan).mean()),
+        "MLCAccStdAvg": np.mean(acc.std().replace(0, np.nan).mean()),
+    }
+
+
+def test_scenarios_match_pandas_reference(scenario_beams):
+    # arcs only, the kinematics need the gantry rotation
+    for name, beam in [(name, beam) for name, beam in scenario_beams if "GantryRotationAngle" in beam]:
+        context = BeamContextCache.ForBeam(beam)
+        attributes = context.MLCAttributes
+        reference = PandasReference(attributes, context.CumulativeMetersets)
+        for key in ["time", "mlc_speed", "mlc_speed_std", "mlc_acc", "mlc_acc_std", "delta_gantry_angle",
+                    "gantry_speed", "gantry_acc", "dose_rates", "delta_dose_rate"]:
+            np.testing.assert_allclose(getattr(attributes, key), np.asarray(reference[key], dtype=float),
+                                       rtol=1e-12, atol=1e-12, err_msg="%s %s" % (name, key))
+        for method in ["MLCSpeedAvg", "MLCSpeedStdAvg", "MLCAccAvg", "MLCAccStdAvg"]:
+            assert getattr(attributes, method)() == pytest.approx(reference[method], rel=1e-12), (name, method)
+
+
+def test_frame_views(scenario_beams):
+    attributes = BeamContextCache.ForBeam(scenario_beams[0][1]).MLCAttributes
+    np.testing.assert_array_equal(attributes.MLCSpeed(as_frame=True).values, attributes.MLCSpeed())
+    np.testing.assert_array_equal(attributes.MLCAcc(as_frame=True).values, attributes.MLCAcc())
+    assert list(attributes.gantry.columns) == ["gantry", "delta_gantry", "gantry_speed", "delta_gantry_speed",
+                                               "gantry_acc"]
+    np.testing.assert_array_equal(attributes.delta_mu_time["time"].values, attributes.time)
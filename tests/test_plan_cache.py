@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic_plan import make_plan, plan_bytes
+from DicomParse.PlanArrays import BEAM_ARRAY_KEYS, EXTRACT_VERSION, ReadPlan
+from DicomParse.PlanCache import PlanCache
+
+
+@pytest.fixture(scope="module")
+def plans():
+    return [plan_bytes(make_plan("IMRT", beams=2, control_points=10, seed=seed)) for seed in range(4)]
+
+
+def test_load_data_round_trip(tmp_path, plans):
+    cache = PlanCache(str(tmp_path))
+    first = cache.LoadData(plans[0])
+    again = cache.LoadData(plans[0])
+    expected = ReadPlan(plans[0])
+    assert sorted(again["beams"]) == sorted(expected["beams"])
+    for number, beam in expected["beams"].items():
+        for name in BEAM_ARRAY_KEYS:
+            if beam[name] is None:
+                assert again["beams"][number][name] is None
+            else:
+                np.testing.assert_array_equal(again["beams"][number][name], beam[name])
+                np.testing.assert_array_equal(first["beams"][number][name], beam[name])
+
+
+def test_entry_names_hold_extract_version(tmp_path, plans):
+    cache = PlanCache(str(tmp_path))
+    cache.LoadData(plans[0])
+    names = os.listdir(str(tmp_path))
+    assert len(names) == 1 and names[0].endswith(".v%d.npz" % EXTRACT_VERSION)
+
+    # an entry of an older layout under the bare key is not read
+    key = names[0].split(".")[0]
+    os.rename(os.path.join(str(tmp_path), names[0]), os.path.join(str(tmp_path), key + ".npz"))
+    assert cache.Get(key) is None
+
+
+def test_size_tracked_without_listing(tmp_path, plans, monkeypatch):
+    cache = PlanCache(str(tmp_path), scan_interval=100)
+    listed = []
+    entries = PlanCache.Entries
+    monkeypatch.setattr(PlanCache, "Entries", lambda self: listed.append(1) or entries(self))
+    for data in plans:
+        cache.LoadData(data)
+    assert len(listed) == 1     # first write only
+    assert cache.size == sum(size for _, size, _ in entries(cache))
+
+
+def test_evict_above_max_size(tmp_path, plans):
+    cache = PlanCache(str(tmp_path))
+    cache.LoadData(plans[0])
+    cache.max_size = int(cache.Size() * 2.5)
+    for data in plans[1:]:
+        cache.LoadData(data)
+    assert cache.Size() <= cache.max_size
+    assert cache.size == cache.Size()
+    assert len(cache.Entries()) == 2
+
+
+def test_entry_being_written_is_not_listed(tmp_path, plans, monkeypatch):
+    cache = PlanCache(str(tmp_path))
+    other_worker = PlanCache(str(tmp_path))
+    savez = np.savez
+
+    def savez_then_clear(f, **arrays):
+        savez(f, **arrays)
+        f.flush()
+        assert other_worker.Entries() == []
+        other_worker.Clear()
+
+    monkeypatch.setattr(np, "savez", savez_then_clear)
+    cache.LoadData(plans[0])
+    assert len(cache.Entries()) == 1
+    assert [name for name in os.listdir(str(tmp_path)) if not name.endswith(".npz")] == []
@@ -0,0 +1,69 @@
+import io
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic_plan import make_plan, plan_bytes
+from ComplexityMetric.BeamResultCache import BeamResults
+from ComplexityMetric.EdgeMetric import EdgeMetric
+from ComplexityMetric.PlanComparison import ComparisonTable, Delta, compare_plans
+from DicomParse.PlanArrays import ReadPlan
+from DicomParse.dicomrt import RTPlan
+
+
+def test_cached_results_are_copies(scenario_beams):
+    beam = scenario_beams[0][1]
+    with BeamResults() as cache:
+        first = EdgeMetric().GetMetricsBeam(beam)
+        expected = np.array(first, dtype=float)
+        first[0] = -1.0
+        second = EdgeMetric().GetMetricsBeam(beam)
+        second[1] = -1.0
+        np.testing.assert_array_equal(EdgeMetric().GetMetricsBeam(beam), expected)
+        assert cache.hits == 2 and cache.misses == 1
+
+
+def test_table_lists_changed_deltas():
+    values = {"same": Delta(1.0, 1.0), "changed": Delta(1.0, 2.5), "nan": Delta(np.nan, np.nan),
+              "to_nan": Delta(1.0, np.nan), "from_inf": Delta(np.inf, 3.0), "inf": Delta(np.inf, np.inf),
+              "text": Delta("a", "b")}
+    row = dict(beam=1, name="Arc 1", status="changed", hash_a="a", hash_b="b", **values)
+    table = ComparisonTable({"beams": [row], "plan": values})
+    listed = [line.split() for line in table.splitlines() if line.startswith("  ")]
+    assert [line[0] for line in listed] == ["changed", "to_nan", "from_inf"] * 2
+    assert listed[0][1:] == ["1.0000", "2.5000", "+1.5000"]
+    assert listed[1][1:] == ["1.0000", "nan", "n/a"]
+    assert listed[2][1:] == ["inf", "3.0000", "n/a"]
+
+
+@pytest.fixture(scope="module")
+def revisions():
+    """Plan data of a two arc plan, and of a revision with the right bank of arc 2 opened at one control point"""
+    ds = make_plan("VMAT", beams=2, control_points=30, seed=5)
+    original = plan_bytes(ds)
+    for device in ds.BeamSequence[1].ControlPointSequence[10].BeamLimitingDevicePositionSequence:
+        if device.RTBeamLimitingDeviceType == "MLCX":
+            positions = [float(p) for p in device.LeafJawPositions]
+            n_pairs = len(positions) // 2
+            device.LeafJawPositions = positions[:n_pairs] + [p + 3.0 for p in positions[n_pairs:]]
+    return original, plan_bytes(ds)
+
+
+def test_compare_edited_revision(revisions):
+    original, edited = revisions
+    metrics = [("EDGE_Metric", EdgeMetric())]
+    with BeamResults() as cache:
+        report = compare_plans(RTPlan(io.BytesIO(original)).get_plan(), ReadPlan(edited), metrics)
+        # EdgeMetric memoizes its per control point values: the unchanged arc is calculated once for both plans
+        assert cache.misses == 3 and len(cache) == 3
+    assert [(row["beam"], row["status"]) for row in report["beams"]] == [(1, "unchanged"), (2, "changed")]
+    assert report["beams"][1]["EDGE_Metric"][2] != 0
+    assert "EDGE_Metric" in ComparisonTable(report)
+
+
+def test_pydicom_plan_and_extracted_copy_hash_the_same(revisions):
+    original, edited = revisions
+    report = compare_plans(RTPlan(io.BytesIO(original)).get_plan(), ReadPlan(original), [("EDGE_Metric", EdgeMetric())])
+    assert [row["status"] for row in report["beams"]] == ["unchanged", "unchanged"]
+    assert all(row["hash_a"] == row["hash_b"] != "" for row in report["beams"])
+    assert all(value[2] == 0 for value in report["plan"].values())
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from benchmarks.synthetic_plan import make_plan, plan_bytes
+from DicomParse.PlanIndex import PlanIndex
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """Plan A copied in a/ and b/, plan B in c/"""
+    plans = {"A": plan_bytes(make_plan("IMRT", beams=1, control_points=10, seed=1)),
+             "B": plan_bytes(make_plan("IMRT", beams=1, control_points=10, seed=2))}
+    for folder, name in [("a", "A"), ("b", "A"), ("c", "B")]:
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "plan.dcm").write_bytes(plans[name])
+    return tmp_path, plans
+
+
+def Rewrite(path, data):
+    mtime = os.stat(path).st_mtime
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, (mtime + 10, mtime + 10))
+
+
+def IndexedPaths(index, root):
+    return sorted(os.path.relpath(path, str(root)) for path in index.Paths())
+
+
+@pytest.fixture
+def index(archive, tmp_path):
+    root, plans = archive
+    with PlanIndex(str(tmp_path / "index.sqlite")) as index:
+        index.Update(str(root))
+        assert IndexedPaths(index, root) == [os.path.join("a", "plan.dcm"), os.path.join("c", "plan.dcm")]
+        yield index
+
+
+def test_rewritten_as_invalid_promotes_copy(index, archive):
+    root, plans = archive
+    Rewrite(str(root / "a" / "plan.dcm"), b"not dicom")
+    index.Update(str(root))
+    assert IndexedPaths(index, root) == [os.path.join("b", "plan.dcm"), os.path.join("c", "plan.dcm")]
+
+
+def test_rewritten_as_other_plan_promotes_copy(index, archive):
+    root, plans = archive
+    Rewrite(str(root / "a" / "plan.dcm"), plans["B"])
+    index.Update(str(root))
+    # plan A falls back to b/, plan B is now indexed from a/, its smallest path
+    assert IndexedPaths(index, root) == [os.path.join("a", "plan.dcm"), os.path.join("b", "plan.dcm")]
+    assert len(index) == 2
+
+
+def test_removed_promotes_copy(index, archive):
+    root, plans = archive
+    os.remove(str(root / "a" / "plan.dcm"))
+    counts = index.Update(str(root))
+    assert counts["removed"] == 1
+    assert IndexedPaths(index, root) == [os.path.join("b", "plan.dcm"), os.path.join("c", "plan.dcm")]